@@ -93,7 +93,7 @@ class RetryingConnection:
     Usage:
 
         connection = RetryingConnection(url, 10, 1.5)
-        connection.declare_consume('render', 2, handle_render)
+        connection.declare_consume('render', 2, render_callback)
         connection.declare_consume('fetch', 2, handle_fetch)
 
         await connection.connect_forever()
@@ -322,10 +322,12 @@ class RetryingConnection:
 
     # Workbench-specific methods follow:
 
-    async def queue_render(self, workflow_id: int, delta_id: int) -> None:
+    async def queue_render(self, workflow_id: int, delta_id: int,
+                           background: bool = False) -> None:
         await self.publish('render', {
             'workflow_id': workflow_id,
             'delta_id': delta_id,
+            'background': background,
         })
 
     async def queue_fetch(self, wf_module_id: int) -> None:
@@ -352,7 +354,7 @@ def get_connection(loop=None):
 
         def start():
             connection = RetryingConnection(url, 10, 1.5)
-            connection.declare_consume('render', 2, handle_render)
+            connection.declare_consume('render', 2, render_callback)
             connection.declare_consume('fetch', 2, handle_fetch)
 
     ... `connection.connect_forever()` will be scheduled to run on the event
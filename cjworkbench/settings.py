@@ -28,6 +28,10 @@ SITE_ID = 1
 # How many rows in one table?
 MAX_ROWS_PER_TABLE = 1000000
 
+# How much RAM may we spend parsing one CSV file? Past this, we truncate, as
+# with MAX_ROWS_PER_TABLE. (Excel and JSON files are read all at once.)
+MAX_BYTES_PER_TABLE = 1024*1024*1024
+
 # How many columns can the client side display?
 # (Currently there is no limit on the actual number of columns per table -- and
 # there should certainly be one. But we do limit how many the client will
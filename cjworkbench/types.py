@@ -779,3 +779,25 @@ class ProcessResult:
             'There is a bug in this module: invalid return type %s'
             % type(value).__name__
         ))
+
+
+@dataclass(frozen=True)
+class RowsToPrepend:
+    """
+    Output from an accumulating module's fetch() method: new rows to put
+    before the rows of the latest stored table.
+
+    A module that accumulates (e.g., Twitter with "accumulate" on) returns
+    just the rows it fetched. Workbench stores them as a small segment that
+    points to the previous version, instead of rewriting the whole table.
+    """
+
+    dataframe: pd.DataFrame
+    """New rows. Empty means, "nothing new": no new version is stored."""
+
+    max_rows: Optional[int] = None
+    """
+    Most rows the module will ever read from the accumulated table.
+
+    When Workbench compacts a long chain of segments, it drops later rows.
+    """
@@ -6,6 +6,7 @@ import warnings
 from django.conf import settings
 from worker.pg_locker import PgLocker
 from .autoupdate import queue_fetches
+from .renderblobs import delete_unreferenced_render_blobs
 from .sessions import delete_expired_sessions_and_workflows
 
 
@@ -18,6 +19,9 @@ FetchInterval = 60  # seconds
 ExpiryInterval = 300  # seconds
 
 
+RenderBlobsInterval = 3600  # seconds
+
+
 async def benchmark(task, message):
     t1 = time.time()
     logger.info(f'Start {message}')
@@ -65,6 +69,17 @@ async def delete_expired_sessions_and_workflows_forever():
         await asyncio.sleep(ExpiryInterval)
 
 
+async def delete_unreferenced_render_blobs_forever():
+    while True:
+        try:
+            await benchmark(delete_unreferenced_render_blobs(),
+                            'delete_unreferenced_render_blobs()')
+        except:
+            logger.exception('Error deleting unreferenced render blobs')
+
+        await asyncio.sleep(RenderBlobsInterval)
+
+
 async def main():
     """
     Run maintenance tasks in the background.
@@ -74,4 +89,5 @@ async def main():
     await asyncio.wait({
         queue_fetches_forever(),
         delete_expired_sessions_and_workflows_forever(),
+        delete_unreferenced_render_blobs_forever(),
     }, return_when=asyncio.FIRST_EXCEPTION)
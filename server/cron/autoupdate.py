@@ -4,7 +4,7 @@ from django.utils import timezone
 from cjworkbench.sync import database_sync_to_async
 from server import rabbitmq, websockets
 from server.models import WfModule
-from worker.pg_locker import PgLocker, WorkflowAlreadyLocked
+from worker.pg_locker import PgLocker
 
 
 logger = logging.getLogger(__name__)
@@ -27,10 +27,13 @@ def load_pending_wf_modules() -> List[Tuple[int, WfModule]]:
 
 
 @database_sync_to_async
-def set_wf_module_busy(wf_module):
+def set_wf_modules_busy(wf_modules: List[WfModule]) -> None:
     # Database writes can't be on the event-loop thread
-    wf_module.is_busy = True
-    wf_module.save(update_fields=['is_busy'])
+    WfModule.objects \
+        .filter(id__in=[wf_module.id for wf_module in wf_modules]) \
+        .update(is_busy=True)
+    for wf_module in wf_modules:
+        wf_module.is_busy = True
 
 
 async def queue_fetches(pg_locker: PgLocker):
@@ -41,35 +44,38 @@ async def queue_fetches(pg_locker: PgLocker):
     """
     wf_modules = await load_pending_wf_modules()
 
-    for workflow_id, wf_module in wf_modules:
-        # Don't schedule a fetch if we're currently rendering.
-        #
-        # This still lets us schedule a fetch if a render is _queued_, so it
-        # doesn't solve any races. But it should lower the number of fetches of
-        # resource-intensive workflows.
-        #
-        # Using pg_locker means we can only queue a fetch _between_ renders.
-        # The render queue may be non-empty (we aren't testing that); but we're
-        # giving the workers a chance to tackle some of the backlog.
-        try:
-            async with pg_locker.render_lock(workflow_id):
-                # At this moment, the workflow isn't rendering. Let's pass
-                # through and queue the fetch.
-                pass
+    # Don't schedule a fetch if we're currently rendering.
+    #
+    # This still lets us schedule a fetch if a render is _queued_, so it
+    # doesn't solve any races. But it should lower the number of fetches of
+    # resource-intensive workflows.
+    #
+    # Using pg_locker means we can only queue a fetch _between_ renders. The
+    # render queue may be non-empty (we aren't testing that); but we're giving
+    # the workers a chance to tackle some of the backlog.
+    #
+    # One query checks all workflows. We'll revisit skipped WfModules next time
+    # we query for pending fetches.
+    locked_workflow_ids = await pg_locker.find_locked_workflow_ids(
+        set(workflow_id for workflow_id, _ in wf_modules)
+    )
+    wf_modules = [(workflow_id, wf_module)
+                  for workflow_id, wf_module in wf_modules
+                  if workflow_id not in locked_workflow_ids]
+    if not wf_modules:
+        return
+
+    await set_wf_modules_busy([wf_module for _, wf_module in wf_modules])
 
-            logger.info('Queue fetch of wf_module(%d, %d)', workflow_id,
-                        wf_module.id)
-            await set_wf_module_busy(wf_module)
-            await websockets.ws_client_send_delta_async(
-                workflow_id,
-                {
-                    'updateWfModules': {
-                        str(wf_module.id): {'is_busy': True, 'fetch_error': ''}
-                    }
+    for workflow_id, wf_module in wf_modules:
+        logger.info('Queue fetch of wf_module(%d, %d)', workflow_id,
+                    wf_module.id)
+        await websockets.ws_client_send_delta_async(
+            workflow_id,
+            {
+                'updateWfModules': {
+                    str(wf_module.id): {'is_busy': True, 'fetch_error': ''}
                 }
-            )
-            await rabbitmq.queue_fetch(wf_module)
-        except WorkflowAlreadyLocked:
-            # Don't queue a fetch. We'll revisit this WfModule next time we
-            # query for pending fetches.
-            pass
+            }
+        )
+        await rabbitmq.queue_fetch(wf_module)
@@ -0,0 +1,12 @@
+import logging
+from cjworkbench.sync import database_sync_to_async
+from server.models import CachedRenderResult
+
+
+logger = logging.getLogger(__name__)
+
+
+@database_sync_to_async
+def delete_unreferenced_render_blobs():
+    n_deleted = CachedRenderResult.delete_unreferenced_blobs()
+    logger.info('Deleted %d unreferenced render-result blobs', n_deleted)
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import datetime
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+# (id_name, source_version_hash, last_update_time, params_hash)
+CacheKey = Tuple[str, str, datetime.datetime, str]
+
+
+def hash_params(params: Dict[str, Any]) -> str:
+    """
+    Hash a WfModule's stored (unmigrated) params JSON.
+    """
+    data = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+
+class MigratedParamsCache:
+    """
+    In-process, size-bounded LRU cache of `LoadedModule.migrate_params()`
+    results.
+
+    Keys are `(id_name, source_version_hash, last_update_time, params_hash)`.
+    The first three identify a ModuleVersion -- its migrate_params() code and
+    its schema -- and `params_hash` identifies the stored params. Migration is
+    a pure function of those, so a cache hit is always correct.
+
+    Values are stored as JSON text: `get()` returns a fresh dict every time,
+    so callers (and modules) may modify it.
+
+    When `max_entries == 0`, the cache is disabled.
+
+    When `write_back` is set (workers opt in, in `worker.main`),
+    `WfModule.get_params()` also saves migrated params to the database, so the
+    next process to read them needn't migrate at all.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 10000, write_back: bool = False):
+        self.max_entries = max_entries
+        self.write_back = write_back
+        self.n_hits = 0
+        self.n_misses = 0
+        self._entries = OrderedDict()  # key => JSON text
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the cached params, or `None` on cache miss.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            try:
+                text = self._entries[key]
+            except KeyError:
+                self.n_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.n_hits += 1
+
+        return json.loads(text)
+
+    def put(self, key: CacheKey, params: Dict[str, Any]) -> None:
+        """
+        Store a copy of `params`, evicting the least-recently-used entry.
+        """
+        if not self.enabled:
+            return
+
+        text = json.dumps(params)
+
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries. Counters are not reset."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return a dict of counters, for logging.
+        """
+        with self._lock:
+            return {
+                'n_entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'n_hits': self.n_hits,
+                'n_misses': self.n_misses,
+            }
+
+
+migrated_params_cache = MigratedParamsCache()
+"""
+The process-wide cache. Write-back is off until someone sets `write_back`.
+"""
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-06-04 14:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0008_schedule_orphan_fetches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedobject',
+            name='parquet_footer',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_parquet_footer',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_parquet_size',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-06-05 15:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0009_parquet_footers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_fingerprint',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='wfmodule',
+            name='cached_render_result_input_fingerprint',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
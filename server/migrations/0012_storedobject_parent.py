@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-06-10 15:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0011_render_result_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedobject',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='server.StoredObject'),
+        ),
+        migrations.AddField(
+            model_name='storedobject',
+            name='chain_length',
+            field=models.IntegerField(default=1),
+        ),
+    ]
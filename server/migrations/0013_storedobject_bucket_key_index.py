@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-06-12 14:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0012_storedobject_parent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='storedobject',
+            index=models.Index(fields=['bucket', 'key'], name='storedobject_bucket_key'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-06-13 10:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0013_storedobject_bucket_key_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedobject',
+            name='max_rows',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
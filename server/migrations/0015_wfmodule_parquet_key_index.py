@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-06-13 15:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0014_storedobject_max_rows'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wfmodule',
+            name='cached_render_result_parquet_key',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
@@ -1,14 +1,20 @@
+import concurrent.futures
 from contextlib import closing, contextmanager
 from dataclasses import dataclass
 import errno
+import functools
 import hmac
 import hashlib
 import io
 import logging
 import math
+import os
 import pathlib
 import tempfile
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, \
+        Tuple
 import urllib3
 from django.conf import settings
 
@@ -43,25 +49,63 @@ def _send_request(self, method, url, body, headers, *args, **kwargs):
     return _original_send_request(self, method, url, body, headers, *args,
                                   **kwargs)
 botocore.awsrequest.AWSConnection._send_request = _send_request
+import botocore.config
 
 
 logger = logging.getLogger(__name__)
 
 
+BatchConcurrency = 8
+"""
+Number of requests batch functions (`fput_files()`, `copy_many()`,
+`remove_many()`) run at once.
+
+S3 requests are mostly waiting on the network, so threads parallelize them
+well. More concurrency would make one batch faster at the expense of every
+other request sharing the server.
+"""
+
+
+PrefetchConcurrency = 4
+"""
+Number of RandomReadMinioFile block fetches that run in the background at once.
+"""
+
+
 session = boto3.session.Session(
     aws_access_key_id=settings.MINIO_ACCESS_KEY,
     aws_secret_access_key=settings.MINIO_SECRET_KEY
 )
-client = session.client(
-    's3',
-    endpoint_url=settings.MINIO_URL  # e.g., 'https://localhost:9001/'
-)
 # Create the one transfer manager we'll reuse for all transfers. Otherwise,
 # boto3 default is to create a transfer manager _per upload/download_, which
 # means 10 threads per operation. (Primer: upload/download split over multiple
 # threads to speed up transfer of large files.)
 transfer_config = TransferConfig()
+client = session.client(
+    's3',
+    endpoint_url=settings.MINIO_URL,  # e.g., 'https://localhost:9001/'
+    # One connection pool for the whole process, big enough that our own
+    # threads never wait for a connection. (botocore's default is 10: any more
+    # concurrent requests would block, or open and discard connections.)
+    config=botocore.config.Config(max_pool_connections=(
+        BatchConcurrency
+        + PrefetchConcurrency
+        + transfer_config.max_concurrency
+    ))
+)
 transfer = S3Transfer(client, transfer_config)
+# Threads that fetch RandomReadMinioFile blocks in the background. Threads are
+# only spawned when needed.
+prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=PrefetchConcurrency,
+    thread_name_prefix='minio-prefetch'
+)
+# Threads that run batch functions' requests. Threads are only spawned when
+# needed.
+batch_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=BatchConcurrency,
+    thread_name_prefix='minio-batch'
+)
 # boto3 exceptions are a bit odd -- https://github.com/boto/boto3/issues/1195
 error = client.exceptions
 """
@@ -78,6 +122,69 @@ Usage:
 """
 
 
+class _OperationStats:
+    """
+    Count S3 requests and their latency, by operation name.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # operation => [n_requests, total_seconds, max]
+
+    @contextmanager
+    def timed(self, operation: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            with self._lock:
+                stat = self._stats.setdefault(operation, [0, 0.0, 0.0])
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = max(stat[2], seconds)
+
+    def get(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                operation: {
+                    'n_requests': n,
+                    'total_seconds': total,
+                    'mean_seconds': total / n,
+                    'max_seconds': max_seconds,
+                }
+                for operation, (n, total, max_seconds) in self._stats.items()
+            }
+
+
+_operation_stats = _OperationStats()
+
+
+def operation_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Return S3 request counts and latencies since startup, for logging.
+
+    Keys are operation names such as `'put_object'`; values are dicts with
+    `n_requests`, `total_seconds`, `mean_seconds` and `max_seconds`. (Failed
+    requests count, too.)
+    """
+    return _operation_stats.get()
+
+
+def _run_batch(fn: Callable[..., None], args_list: Iterable[Tuple]) -> None:
+    """
+    Call `fn(*args)` for each `args` in `args_list`, on `batch_executor`.
+
+    Wait for all calls to finish; then raise the first error, if any.
+    """
+    futures = [batch_executor.submit(fn, *args) for args in args_list]
+    concurrent.futures.wait(futures)
+    for future in futures:
+        future.result()  # raise
+
+
 def _build_bucket_name(key: str) -> str:
     return ''.join([
         settings.MINIO_BUCKET_PREFIX,
@@ -136,28 +243,39 @@ def list_file_keys(bucket: str, prefix: str):
     >>> minio.list_file_keys('bucket', 'filter/a132b3f/')
     ['filter/a132b3f/spec.json', 'filter/a132b3f/filter.py']
     """
-    response = client.list_objects_v2(
-        Bucket=bucket,
-        Prefix=prefix,
-        Delimiter='/'  # avoid recursive
-    )
+    with _operation_stats.timed('list_objects_v2'):
+        response = client.list_objects_v2(
+            Bucket=bucket,
+            Prefix=prefix,
+            Delimiter='/'  # avoid recursive
+        )
     if 'Contents' not in response:
         return []
     return [o['Key'] for o in response['Contents']]
 
 
 def fput_file(bucket: str, key: str, path: pathlib.Path) -> None:
-    transfer.upload_file(str(path.resolve()), bucket, key)
+    with _operation_stats.timed('upload_file'):
+        transfer.upload_file(str(path.resolve()), bucket, key)
+
+
+def fput_files(bucket: str, files: Iterable[Tuple[str, pathlib.Path]]) -> None:
+    """
+    Upload each `(key, path)` of `files`, `BatchConcurrency` at a time.
+    """
+    _run_batch(functools.partial(fput_file, bucket), files)
 
 
 def put_bytes(bucket: str, key: str, body: bytes) -> None:
-    client.put_object(Bucket=bucket, Key=key, Body=body,
-                      ContentLength=len(body))
+    with _operation_stats.timed('put_object'):
+        client.put_object(Bucket=bucket, Key=key, Body=body,
+                          ContentLength=len(body))
 
 
 def exists(bucket: str, key: str) -> bool:
     try:
-        client.head_object(Bucket=bucket, Key=key)
+        with _operation_stats.timed('head_object'):
+            client.head_object(Bucket=bucket, Key=key)
         return True
     except error.NoSuchKey:
         return False
@@ -175,7 +293,8 @@ class Stat:
 
 def stat(bucket: str, key: str) -> Stat:
     """Return an object's metadata or raise an error."""
-    response = client.head_object(Bucket=bucket, Key=key)
+    with _operation_stats.timed('head_object'):
+        response = client.head_object(Bucket=bucket, Key=key)
     return Stat(response['ContentLength'])
 
 
@@ -186,30 +305,110 @@ def fput_directory_contents(bucket: str, prefix: str,
 
     paths = dirpath.glob('**/*')
     file_paths = [p for p in paths if p.is_file()]
-    for file_path in file_paths:
-        key = prefix + str(file_path.relative_to(dirpath))
-        fput_file(bucket, key, file_path)
+    fput_files(bucket, ((prefix + str(file_path.relative_to(dirpath)),
+                         file_path)
+                        for file_path in file_paths))
 
 
 def remove(bucket: str, key: str) -> None:
     """Delete the file. No-op if it is already deleted."""
     try:
-        client.delete_object(Bucket=bucket, Key=key)
+        with _operation_stats.timed('delete_object'):
+            client.delete_object(Bucket=bucket, Key=key)
     except error.NoSuchKey:
         pass
 
 
+_MaxKeysPerDelete = 1000  # S3 limit
+
+
+def _delete_objects(bucket: str, keys: List[str]) -> None:
+    with _operation_stats.timed('delete_objects'):
+        response = client.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys],
+                    'Quiet': True}
+        )
+    for err in response.get('Errors', []):
+        raise Exception('Error %(Code)s removing %(Key)s: %(Message)s' % err)
+
+
+def remove_many(bucket: str, keys: Iterable[str]) -> None:
+    """
+    Delete files. Keys that are already deleted are ignored.
+
+    This makes one request per 1,000 keys, `BatchConcurrency` at a time.
+    """
+    keys = list(keys)
+    _run_batch(functools.partial(_delete_objects, bucket),
+               ((keys[i:i + _MaxKeysPerDelete],)
+                for i in range(0, len(keys), _MaxKeysPerDelete)))
+
+
 def copy(bucket: str, key: str, copy_source: str) -> None:
-    client.copy_object(Bucket=bucket, Key=key, CopySource=copy_source)
+    with _operation_stats.timed('copy_object'):
+        client.copy_object(Bucket=bucket, Key=key, CopySource=copy_source)
+
+
+def copy_many(bucket: str, copies: Iterable[Tuple[str, str]]) -> None:
+    """
+    Copy each `(key, copy_source)` of `copies`, `BatchConcurrency` at a time.
+
+    S3 copies without sending us the data.
+    """
+    _run_batch(functools.partial(copy, bucket), copies)
+
+
+def touch(bucket: str, key: str) -> None:
+    """
+    Set an object's LastModified to now, by copying it onto itself.
+
+    S3 copies without sending us the data. (It refuses to copy an object onto
+    itself unless we replace its metadata, so we do that.)
+
+    Raise FileNotFoundError if the object does not exist.
+    """
+    try:
+        with _operation_stats.timed('copy_object'):
+            client.copy_object(Bucket=bucket, Key=key,
+                               CopySource={'Bucket': bucket, 'Key': key},
+                               MetadataDirective='REPLACE')
+    except error.NoSuchKey:
+        raise FileNotFoundError(errno.ENOENT, f'No file at {bucket}/{key}')
+    except error.ClientError as err:
+        if err.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            raise FileNotFoundError(errno.ENOENT,
+                                    f'No file at {bucket}/{key}')
+        raise
+
+
+def iter_objects(bucket: str, prefix: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield each object (a dict with 'Key', 'LastModified', 'Size') under
+    `prefix`, recursively.
+
+    This makes one request per 1,000 objects.
+    """
+    paginator = client.get_paginator('list_objects_v2')
+    pages = iter(paginator.paginate(Bucket=bucket, Prefix=prefix))
+    while True:
+        with _operation_stats.timed('list_objects_v2'):
+            page = next(pages, None)
+        if page is None:
+            return
+        yield from page.get('Contents', [])
 
 
 def remove_recursive(bucket: str, prefix: str, force=False) -> None:
     """
     Remove all objects in `bucket` whose keys begin with `prefix`.
 
-    If you really mean to use `prefix=''` -- which will wipe the entire bucket,
-    up to 1,000 keys -- pass `force=True`. Otherwise, there is a safeguard
-    against `prefix=''` specifically.
+    If you really mean to use `prefix=''` -- which will wipe the entire bucket
+    -- pass `force=True`. Otherwise, there is a safeguard against `prefix=''`
+    specifically.
+
+    We list 1,000 keys per request, and delete each page of keys while we list
+    the next.
     """
     if not prefix.endswith('/'):
         raise ValueError('`prefix` must end with `/`')
@@ -217,19 +416,22 @@ def remove_recursive(bucket: str, prefix: str, force=False) -> None:
     if prefix == '/' and not force:
         raise ValueError('Refusing to remove prefix=/ when force=False')
 
-    # recursive list_objects_v2
-    list_response = client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    if 'Contents' not in list_response:
-        return
-    delete_response = client.delete_objects(
-        Bucket=bucket,
-        Delete={'Objects': [{'Key': o['Key']}
-                            for o in list_response['Contents']]}
-    )
-    if 'Errors' in delete_response:
-        for err in delete_response['Errors']:
-            raise Exception('Error %{Code}s removing %{Key}s: %{Message}'
-                            % err)
+    keys = []
+    futures = []
+    try:
+        for obj in iter_objects(bucket, prefix):
+            keys.append(obj['Key'])
+            if len(keys) == _MaxKeysPerDelete:
+                futures.append(batch_executor.submit(_delete_objects, bucket,
+                                                     keys))
+                keys = []
+        if keys:
+            futures.append(batch_executor.submit(_delete_objects, bucket,
+                                                 keys))
+    finally:
+        concurrent.futures.wait(futures)
+    for future in futures:
+        future.result()  # raise
 
 
 def get_object_with_data(bucket: str, key: str, **kwargs) -> Dict[str, Any]:
@@ -250,12 +452,14 @@ def get_object_with_data(bucket: str, key: str, **kwargs) -> Dict[str, Any]:
     max_attempts = transfer_config.num_download_attempts
     for i in range(max_attempts):
         try:
-            response = client.get_object(Bucket=bucket, Key=key, **kwargs)
-            body = response['Body']
-            try:
-                data = body.read()
-            finally:
-                body.close()
+            with _operation_stats.timed('get_object'):
+                response = client.get_object(Bucket=bucket, Key=key,
+                                             **kwargs)
+                body = response['Body']
+                try:
+                    data = body.read()
+                finally:
+                    body.close()
             return {
                 **response,
                 'Body': data
@@ -285,7 +489,8 @@ def temporarily_download(bucket: str, key: str) -> None:
     """
     with tempfile.NamedTemporaryFile(prefix='minio_download') as tf:
         try:
-            transfer.download_file(bucket, key, tf.name)
+            with _operation_stats.timed('download_file'):
+                transfer.download_file(bucket, key, tf.name)
         # transfer.download_file() seems to raise ClientError instead of a
         # wrapped error.
         # except error.NoSuchKey:
@@ -306,8 +511,20 @@ class RandomReadMinioFile(io.RawIOBase):
     On init, an S3 query fills in `.size`, and `.tempfile` is created and set
     to the full file length.
 
-    The file is fetched one `block_size`-sized block at a time. If you `seek()`
-    you can skip fetching some blocks.
+    If the caller already knows the file's size -- and, optionally, its last
+    few bytes (`tail`) -- there is no S3 query on init. Reads of `tail` never
+    query S3. (We use this for Parquet footers we store in the database.)
+
+    The file is fetched in `block_size`-sized blocks. If you `seek()` you can
+    skip fetching some blocks. When a read spans several blocks we haven't
+    fetched, we fetch each run of adjacent missing blocks in a single HTTP
+    request.
+
+    With `prefetch_blocks=N`, each fetch also schedules a background fetch of
+    the next N blocks on `prefetch_executor`, so sequential reads (such as
+    fastparquet reading consecutive column chunks) needn't wait for S3.
+
+    `.n_requests` and `.n_bytes_fetched` count S3 traffic, for benchmarking.
 
     If you intend to read the entire file, `FullReadMinioFile` will be more
     efficient.
@@ -319,22 +536,45 @@ class RandomReadMinioFile(io.RawIOBase):
             file.seek(-5, io.SEEK_END)
             file.read(5)  # read from end
     """
-    def __init__(self, bucket: str, key: str, block_size=5*1024*1024):
+    def __init__(self, bucket: str, key: str, block_size=5*1024*1024,
+                 size: Optional[int] = None, tail: bytes = b'',
+                 prefetch_blocks: int = 0):
         self.bucket = bucket
         self.key = key
         self.block_size = block_size
-
-        response = self._request_block(0)
-        self.size = int(response['ContentRange'].split('/')[1])
-        self.tempfile = tempfile.TemporaryFile(prefix='RandomReadMinioFile')
+        self.prefetch_blocks = prefetch_blocks
+        self.n_requests = 0
+        self.n_bytes_fetched = 0
+        # _lock guards fetched_blocks, _prefetches and the counters. Prefetch
+        # threads write to the tempfile with os.pwrite(), so they never move
+        # the file position; and the tempfile is unbuffered, so reads never
+        # see stale data.
+        self._lock = threading.Lock()
+        self._prefetches = {}  # block_number => Future
+
+        if size is None:
+            response = self._request_range(0, self.block_size)
+            self.size = int(response['ContentRange'].split('/')[1])
+            first_block = response['Body']
+            self._count_request(first_block)
+        else:
+            self.size = size
+            first_block = None
+        self.tempfile = tempfile.TemporaryFile(prefix='RandomReadMinioFile',
+                                               buffering=0)
         self.tempfile.truncate(self.size)  # allocate disk space
         nblocks = math.ceil(self.size / self.block_size)
         self.fetched_blocks = [False] * nblocks
 
+        # Bytes at or after `tail_start` are in the tempfile from the start
+        self.tail_start = self.size - len(tail)
+        if tail:
+            os.pwrite(self.tempfile.fileno(), tail, self.tail_start)
+
         # Write first block
-        self.tempfile.write(response['Body'])
-        self.tempfile.seek(0, io.SEEK_SET)
-        self.fetched_blocks[0] = True
+        if first_block is not None:
+            os.pwrite(self.tempfile.fileno(), first_block, 0)
+            self.fetched_blocks[0] = True
 
     # override io.IOBase
     def tell(self) -> int:
@@ -350,6 +590,13 @@ class RandomReadMinioFile(io.RawIOBase):
 
     # override io.IOBase
     def close(self):
+        # Prefetch threads must not write to a closed (and maybe reused) fd
+        with self._lock:
+            prefetches = list(self._prefetches.values())
+        for future in prefetches:
+            future.cancel()
+        concurrent.futures.wait(prefetches)
+
         self.tempfile.close()
         super().close()
 
@@ -362,33 +609,32 @@ class RandomReadMinioFile(io.RawIOBase):
         return False
 
     def read(self, size=-1):
-        # TODO optimization: when size extends beyond our block (and in
-        # particular, is -1), read all the blocks we need _in a single HTTP
-        # request_ and then call super().read(size).
+        if size is None or size < 0:
+            # Don't let io.RawIOBase.readall() read one chunk at a time: fetch
+            # all the blocks we need in one go.
+            size = max(0, self.size - self.tell())
         return super().read(size)
 
     # override io.RawIOBase
     def readinto(self, b: bytes) -> int:
         pos = self.tempfile.tell()
-        block_number = math.floor(pos / self.block_size)
-
-        if block_number >= len(self.fetched_blocks):
+        end = min(pos + len(b), self.size)
+        if end <= pos:
             return 0
 
-        self._ensure_block_fetched(block_number)
+        if pos < self.tail_start:
+            # Bytes at or after tail_start were given to us in __init__()
+            self._ensure_range_fetched(pos, min(end, self.tail_start))
 
-        pos_in_block = pos % self.block_size  # 0 <= x < self.block_size
-        block_limit = self.block_size - pos_in_block
-        limit = min(len(b), block_limit)
-        nread = self.tempfile.readinto(memoryview(b)[:limit])
-        return nread
+        return self.tempfile.readinto(memoryview(b)[:end - pos])
 
-    def _request_block(self, block_number: int) -> Dict[str, Any]:
+    def _request_range(self, start: int, end: int) -> Dict[str, Any]:
         """
         Yield a boto3 dict with 'Body' (bytes) and 'ContentRange'.
+
+        `end` is exclusive, Python-style. (HTTP ranges are inclusive.)
         """
-        offset = block_number * self.block_size
-        http_range = f'bytes={offset}-{offset + self.block_size - 1}'
+        http_range = f'bytes={start}-{end - 1}'
         try:
             return get_object_with_data(self.bucket, self.key,
                                         Range=http_range)
@@ -398,26 +644,100 @@ class RandomReadMinioFile(io.RawIOBase):
                 f'No file at {self.bucket}/{self.key}'
             )
 
-    def _ensure_block_fetched(self, block_number: int) -> None:
-        if self.fetched_blocks[block_number]:
-            return
+    def _count_request(self, body: bytes) -> None:
+        self.n_requests += 1
+        self.n_bytes_fetched += len(body)
 
-        response = self._request_block(block_number)
+    def _plan_missing_runs(self, first_block: int, last_block: int):
+        """
+        List `(first, last)` runs of adjacent blocks nobody has fetched.
 
-        # cache `pos`, write the block, then restore `pos`
-        pos = self.tempfile.tell()
-        self.tempfile.seek(block_number * self.block_size)
-        self.tempfile.write(response['Body'])
-        self.tempfile.seek(pos)
+        Assumes self._lock is held.
+        """
+        runs = []
+        for block_number in range(first_block, last_block + 1):
+            if (
+                self.fetched_blocks[block_number]
+                or block_number in self._prefetches
+            ):
+                continue
+            if runs and runs[-1][1] == block_number - 1:
+                runs[-1] = (runs[-1][0], block_number)
+            else:
+                runs.append((block_number, block_number))
+        return runs
 
-        self.fetched_blocks[block_number] = True
+    def _fetch_blocks(self, first_block: int, last_block: int) -> None:
+        """
+        Fetch blocks `first_block` through `last_block` in one HTTP request.
+        """
+        start = first_block * self.block_size
+        end = min((last_block + 1) * self.block_size, self.size)
+        body = self._request_range(start, end)['Body']
+        os.pwrite(self.tempfile.fileno(), body, start)
+
+        with self._lock:
+            for block_number in range(first_block, last_block + 1):
+                self.fetched_blocks[block_number] = True
+            self._count_request(body)
+
+    def _prefetch_blocks(self, first_block: int, last_block: int) -> None:
+        try:
+            self._fetch_blocks(first_block, last_block)
+        finally:
+            with self._lock:
+                for block_number in range(first_block, last_block + 1):
+                    self._prefetches.pop(block_number, None)
+
+    def _ensure_range_fetched(self, start: int, end: int) -> None:
+        """
+        Fetch all blocks overlapping bytes `[start, end)`.
+
+        Coalesce adjacent missing blocks into single requests; wait for
+        prefetches already in progress; then schedule the next prefetch.
+        """
+        first_block = start // self.block_size
+        last_block = (end - 1) // self.block_size
+
+        with self._lock:
+            waits = set(self._prefetches[block_number]
+                        for block_number in range(first_block, last_block + 1)
+                        if block_number in self._prefetches)
+            runs = self._plan_missing_runs(first_block, last_block)
+
+        for run in runs:
+            self._fetch_blocks(*run)
+        for future in waits:
+            future.result()  # raise FileNotFoundError, for instance
+
+        if self.prefetch_blocks:
+            self._schedule_prefetch(last_block + 1)
+
+    def _schedule_prefetch(self, first_block: int) -> None:
+        last_block = min(first_block + self.prefetch_blocks,
+                         len(self.fetched_blocks)) - 1
+        if self.tail_start < self.size:
+            # Don't prefetch what we already have
+            last_block = min(last_block,
+                             (self.tail_start - 1) // self.block_size)
+        if last_block < first_block:
+            return
+
+        with self._lock:
+            # One task per run: each is a single request, and runs are fetched
+            # concurrently
+            for run in self._plan_missing_runs(first_block, last_block):
+                future = prefetch_executor.submit(self._prefetch_blocks, *run)
+                for block_number in range(run[0], run[1] + 1):
+                    self._prefetches[block_number] = future
 
 
 class FullReadMinioFile(io.RawIOBase):
     """
-    A file on S3, cached in a tempfile.
+    A file on S3, held in memory.
 
-    On init, the entire file is downloaded to `.tempfile`.
+    On init, the entire file is downloaded to `.buffer` (an io.BytesIO). It
+    never touches local disk.
 
     If you intend to seek() and run logic that does not depend on the entire
     file contents, `RandomReadMinioFile` might suit your needs better.
@@ -433,20 +753,19 @@ class FullReadMinioFile(io.RawIOBase):
         self.bucket = bucket
         self.key = key
 
-        with temporarily_download(bucket, key) as path:
-            # POSIX-specific: reopen the file, then delete it from the
-            # filesystem (by leaving the context manager).
-            #
-            # We'll use Python's default buffering settings.
-            self.tempfile = path.open('rb')
+        try:
+            data = get_object_with_data(bucket, key)['Body']
+        except error.NoSuchKey:
+            raise FileNotFoundError(errno.ENOENT, f'No file at {bucket}/{key}')
+        self.buffer = io.BytesIO(data)
 
     # override io.IOBase
     def tell(self) -> int:
-        return self.tempfile.tell()
+        return self.buffer.tell()
 
     # override io.IOBase
     def seek(self, offset: int, whence: int = 0) -> int:
-        return self.tempfile.seek(offset, whence)
+        return self.buffer.seek(offset, whence)
 
     # override io.IOBase
     def readable(self):
@@ -458,13 +777,159 @@ class FullReadMinioFile(io.RawIOBase):
 
     # override io.IOBase
     def close(self):
-        self.tempfile.close()
+        self.buffer.close()
         super().close()
 
     # override io.IOBase
-    def writable():
+    def writable(self):
         return False
 
     # override io.RawIOBase
     def readinto(self, b: bytes) -> int:
-        return self.tempfile.readinto(b)
+        return self.buffer.readinto(b)
+
+
+class MultipartUploadMinioFile(io.RawIOBase):
+    """
+    A write-only file that streams to S3.
+
+    Writes are buffered in memory. Each time `part_size` bytes accumulate, we
+    upload them as one part of a multipart upload, in the background on
+    `batch_executor`, while the caller keeps writing. `close()` uploads the
+    rest and completes the upload. If the whole file fits in one part, we skip
+    the multipart API and `close()` sends one `put_object` request.
+
+    After `close()`, `.tail` holds the last `tail_size` bytes written (for
+    instance, a Parquet footer). `.tell()` gives the number of bytes written.
+
+    Use it as a context manager: if the block raises, we abort the upload and
+    nothing appears on S3.
+
+    Usage:
+
+        with MultipartUploadMinioFile(bucket, key) as file:
+            file.write(b'abc')
+            file.write(b'def')
+        # bucket/key now holds b'abcdef'
+    """
+    def __init__(self, bucket: str, key: str,
+                 part_size: int = transfer_config.multipart_chunksize,
+                 tail_size: int = 0, max_parts_in_flight: int = 2):
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError('S3 parts must be at least 5MB')
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.tail_size = tail_size
+        self.max_parts_in_flight = max_parts_in_flight
+        self.tail = b''
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._part_futures = []  # Future per part, each returning an ETag
+
+    # override io.IOBase
+    def tell(self) -> int:
+        return self._position
+
+    # override io.IOBase
+    def writable(self):
+        return True
+
+    # override io.RawIOBase
+    def write(self, b: bytes) -> int:
+        b = memoryview(b).cast('B')  # count bytes, not (say) numpy elements
+        n = len(b)
+        self._buffer += b
+        self._position += n
+        if len(self._buffer) >= self.part_size:
+            self._upload_buffer()
+        return n
+
+    def _keep_tail(self, data: bytes) -> None:
+        # Called once per part, not per write(): fastparquet and thrift write
+        # a few bytes at a time.
+        if self.tail_size:
+            self.tail = (
+                self.tail + bytes(data[-self.tail_size:])
+            )[-self.tail_size:]
+
+    def _upload_buffer(self) -> None:
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+        self._keep_tail(data)
+
+        if self._upload_id is None:
+            with _operation_stats.timed('create_multipart_upload'):
+                self._upload_id = client.create_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key
+                )['UploadId']
+
+        # Bound memory: wait for old parts before queueing a new one
+        in_flight = [f for f in self._part_futures if not f.done()]
+        while len(in_flight) >= self.max_parts_in_flight:
+            in_flight.pop(0).result()
+
+        part_number = len(self._part_futures) + 1
+        self._part_futures.append(batch_executor.submit(
+            self._upload_part, part_number, data
+        ))
+
+    def _upload_part(self, part_number: int, data: bytes) -> str:
+        with _operation_stats.timed('upload_part'):
+            return client.upload_part(Bucket=self.bucket, Key=self.key,
+                                      UploadId=self._upload_id,
+                                      PartNumber=part_number,
+                                      Body=data)['ETag']
+
+    # override io.IOBase
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self._upload_id is None:
+                self._keep_tail(self._buffer)
+                put_bytes(self.bucket, self.key, bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_buffer()  # the last part may be small
+                parts = [{'PartNumber': i + 1, 'ETag': future.result()}
+                         for i, future in enumerate(self._part_futures)]
+                with _operation_stats.timed('complete_multipart_upload'):
+                    client.complete_multipart_upload(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        UploadId=self._upload_id,
+                        MultipartUpload={'Parts': parts}
+                    )
+        except BaseException:
+            self.abort()
+            raise
+
+        self._buffer = bytearray()
+        super().close()
+
+    def abort(self) -> None:
+        """
+        Close without writing anything to S3.
+        """
+        if self.closed:
+            return
+
+        concurrent.futures.wait(self._part_futures)
+        if self._upload_id is not None:
+            with _operation_stats.timed('abort_multipart_upload'):
+                client.abort_multipart_upload(Bucket=self.bucket,
+                                              Key=self.key,
+                                              UploadId=self._upload_id)
+        self._buffer = bytearray()
+        super().close()
+
+    # override io.IOBase
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
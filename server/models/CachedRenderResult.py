@@ -1,8 +1,17 @@
+import datetime
 import json
-from typing import Any, Dict, List, Optional
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.db import connection, transaction
+from django.utils import timezone
 import pandas as pd
 from cjworkbench.types import ProcessResult, QuickFix, TableShape
 from server import minio, parquet
+from server.pandas_util import hash_table_contents
+from server.render_cache import render_cache
+
+
+logger = logging.getLogger(__name__)
 
 
 WfModuleFields = [
@@ -13,6 +22,11 @@ WfModuleFields = [
     'cached_render_result_columns',
     'cached_render_result_status',
     'cached_render_result_nrows',
+    'cached_render_result_parquet_size',
+    'cached_render_result_parquet_footer',
+    'cached_render_result_parquet_key',
+    'cached_render_result_fingerprint',
+    'cached_render_result_input_fingerprint',
 ]
 
 
@@ -26,6 +40,70 @@ def parquet_prefix(workflow_id: int, wf_module_id: int) -> str:
     return 'wf-%d/wfm-%d/' % (workflow_id, wf_module_id)
 
 
+def parquet_key(workflow_id: int, wf_module_id: int, delta_id: int) -> str:
+    """
+    Path to a file, used by the `parquet` module.
+
+    This is where we used to write results, before content-addressed blobs.
+    Results with no `cached_render_result_parquet_key` are stored here.
+    """
+    return '%sdelta-%d.dat' % (parquet_prefix(workflow_id, wf_module_id),
+                               delta_id)
+
+
+BlobPrefix = 'blobs/'
+"""
+"Directory" of content-addressed Parquet files.
+
+Many WfModules may point to the same blob: duplicated workflows, lessons that
+thousands of students start from, unchanged re-renders.... We never delete a
+blob when a WfModule stops pointing to it: `delete_unreferenced_blobs()` does
+that later.
+"""
+
+
+BlobGracePeriod = datetime.timedelta(hours=1)
+"""
+Minimum age of a blob `delete_unreferenced_blobs()` may delete.
+
+We upload (or touch) a blob _before_ we write a reference to it in the
+database. The grace period lets those writes finish.
+"""
+
+
+BlobLockNamespace = 1
+"""
+First argument of the Postgres advisory locks that guard blobs.
+
+(`worker.pg_locker` locks workflows with 0.)
+"""
+
+
+def _lock_blob(key: str, shared: bool) -> None:
+    """
+    Lock the blob at `key` until the current transaction ends.
+
+    Writers lock it `shared` while they check the blob exists and reference
+    it; `delete_unreferenced_blobs()` locks it exclusively while it checks
+    for references and deletes it. So a writer never references a deleted
+    blob.
+    """
+    if shared:
+        sql = 'SELECT pg_advisory_xact_lock_shared(%s, hashtext(%s))'
+    else:
+        sql = 'SELECT pg_advisory_xact_lock(%s, hashtext(%s))'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [BlobLockNamespace, key])
+
+
+def blob_key(table_hash: str) -> str:
+    """
+    Path to the content-addressed file that stores the table whose
+    `hash_table_contents()` is `table_hash`.
+    """
+    return '%s%s.dat' % (BlobPrefix, table_hash)
+
+
 class CachedRenderResult:
     """
     Result of a module render() call.
@@ -45,7 +123,11 @@ class CachedRenderResult:
 
     def __init__(self, workflow_id: int, wf_module_id: int, delta_id: int,
                  status: str, error: str, json: Optional[Dict[str, Any]],
-                 quick_fixes: List[QuickFix], table_shape: TableShape):
+                 quick_fixes: List[QuickFix], table_shape: TableShape,
+                 file_info: Optional[parquet.FileInfo] = None,
+                 fingerprint: Optional[str] = None,
+                 input_fingerprint: Optional[str] = None,
+                 blob_key: Optional[str] = None):
         self.workflow_id = workflow_id
         self.wf_module_id = wf_module_id
         self.delta_id = delta_id
@@ -54,6 +136,11 @@ class CachedRenderResult:
         self.json = json
         self.quick_fixes = quick_fixes
         self.table_shape = table_shape
+        self.file_info = file_info  # None for files written before we had it
+        # None for results written before we had them
+        self.fingerprint = fingerprint
+        self.input_fingerprint = input_fingerprint
+        self.blob_key = blob_key  # None for results written before blobs
 
     @property
     def columns(self):
@@ -63,15 +150,21 @@ class CachedRenderResult:
     def nrows(self):
         return self.table_shape.nrows
 
+    @property
+    def cache_key(self):
+        """
+        Key into `server.render_cache.render_cache`.
+        """
+        return (self.workflow_id, self.wf_module_id, self.delta_id)
+
     @property
     def parquet_key(self):
         """
         Path to a file, used by the `parquet` module.
         """
-        return '%sdelta-%d.dat' % (
-            parquet_prefix(self.workflow_id, self.wf_module_id),
-            self.delta_id
-        )
+        if self.blob_key is not None:
+            return self.blob_key
+        return parquet_key(self.workflow_id, self.wf_module_id, self.delta_id)
 
     def read_dataframe(self, *args, **kwargs):
         """
@@ -79,14 +172,23 @@ class CachedRenderResult:
 
         Pass *args and **kwargs to `fastparquet.ParquetFile.to_pandas()`.
 
+        When called with no arguments, read from and write to the in-process
+        `render_cache` (a no-op when the cache is disabled).
+
         TODO make this raise OSError/FastparquetCouldNotHandleFile. (Currently
         we return an empty dataframe on error.)
         """
+        if not args and not kwargs:
+            dataframe = render_cache.get(self.cache_key)
+            if dataframe is not None:
+                return dataframe
+
         try:
-            return parquet.read(
+            dataframe = parquet.read(
                 minio.CachedRenderResultsBucket,
                 self.parquet_key,
-                args, kwargs
+                args, kwargs,
+                file_info=self.file_info
             )
         except OSError:
             # Two possibilities:
@@ -102,6 +204,66 @@ class CachedRenderResult:
             # Treat bugs as "empty file"
             return pd.DataFrame()
 
+        if not args and not kwargs:
+            render_cache.put(self.cache_key, dataframe)
+        return dataframe
+
+    def read_dataframe_slice(self, columns: Optional[List[str]],
+                             start_row: int,
+                             end_row: int) -> pd.DataFrame:
+        """
+        Read rows `[start_row, end_row)` of `columns` (costing network
+        requests, but only for the row groups we need).
+
+        The returned DataFrame has a RangeIndex starting at 0.
+
+        TODO make this raise OSError/FastparquetCouldNotHandleFile. (Currently
+        we return an empty dataframe on error.)
+        """
+        dataframe = render_cache.get(self.cache_key)
+        if dataframe is not None:
+            if columns is not None:
+                dataframe = dataframe[columns]
+            return dataframe[start_row:end_row].reset_index(drop=True)
+
+        try:
+            return parquet.read_slice(
+                minio.CachedRenderResultsBucket,
+                self.parquet_key,
+                columns,
+                start_row,
+                end_row,
+                file_info=self.file_info
+            )
+        except OSError:
+            # File is missing or empty -- see read_dataframe()
+            return pd.DataFrame()
+        except parquet.FastparquetCouldNotHandleFile:
+            # Treat bugs as "empty file"
+            return pd.DataFrame()
+
+    def iter_dataframe_row_groups(self) -> Iterator[pd.DataFrame]:
+        """
+        Yield the Parquet file's row groups as DataFrames, one at a time
+        (costing a network request or two per row group).
+
+        This touches no database row, so it's safe to iterate outside of any
+        lock -- though a concurrent render may delete the file while we read
+        it. Unlike `read_dataframe()`, we don't pretend a missing or broken
+        file is empty: we raise OSError or FastparquetCouldNotHandleFile,
+        possibly after yielding some row groups. A streaming response should
+        let that error abort the connection, so the client can't mistake part
+        of a table for all of it.
+        """
+        if self.nrows == 0:
+            return  # nothing to read -- and the file may be empty or missing
+
+        yield from parquet.iter_row_groups(
+            minio.CachedRenderResultsBucket,
+            self.parquet_key,
+            file_info=self.file_info
+        )
+
     @property
     def result(self):
         """
@@ -181,30 +343,98 @@ class CachedRenderResult:
         # Coerce from dict to QuickFixes
         quick_fixes = [QuickFix(**qf) for qf in quick_fixes]
 
+        parquet_size = wf_module.cached_render_result_parquet_size
+        if parquet_size is None:
+            file_info = None
+        else:
+            footer = wf_module.cached_render_result_parquet_footer
+            if footer is not None:
+                footer = bytes(footer)  # it's sometimes a memoryview
+            file_info = parquet.FileInfo(parquet_size, footer)
+
+        fingerprint = wf_module.cached_render_result_fingerprint
+        input_fingerprint = wf_module.cached_render_result_input_fingerprint
+        blob_key = wf_module.cached_render_result_parquet_key
+
         ret = CachedRenderResult(workflow_id=wf_module.workflow_id,
                                  wf_module_id=wf_module.id, delta_id=delta_id,
                                  status=status, error=error, json=json_dict,
                                  quick_fixes=quick_fixes,
-                                 table_shape=TableShape(nrows, columns))
+                                 table_shape=TableShape(nrows, columns),
+                                 file_info=file_info,
+                                 fingerprint=fingerprint,
+                                 input_fingerprint=input_fingerprint,
+                                 blob_key=blob_key)
         # Keep in mind: ret.result has not been loaded yet. It might not exist
         # when we do try reading it.
         return ret
 
     @staticmethod
-    def delete_parquet_files_for_wf_module(wf_module: 'WfModule') -> None:
+    def delete_parquet_files_for_wf_module(
+        wf_module: 'WfModule',
+        except_key: Optional[str] = None
+    ) -> None:
         """
         Ensures there are no Parquet files cached for `wf_module`.
 
-        Different deltas on the same module produce different Parquet
-        filenames. This function removes all of them.
+        Different deltas on the same module used to produce different Parquet
+        filenames. This function removes all of them -- except `except_key`,
+        if given. It doesn't touch blobs: other WfModules may point to them.
 
         This leaves `wf_module.cached_render_result` invalid: it will continue
         to exist in the database, but callers who try to read from it will
         see `FileNotFoundError.
         """
-        minio.remove_recursive(minio.CachedRenderResultsBucket,
-                               parquet_prefix(wf_module.workflow_id,
-                                              wf_module.id))
+        workflow_id = wf_module.workflow_id
+        render_cache.discard_wf_module(workflow_id, wf_module.id)
+        prefix = parquet_prefix(workflow_id, wf_module.id)
+        if except_key is None:
+            minio.remove_recursive(minio.CachedRenderResultsBucket, prefix)
+        else:
+            minio.remove_many(
+                minio.CachedRenderResultsBucket,
+                (key
+                 for key in minio.list_file_keys(
+                     minio.CachedRenderResultsBucket,
+                     prefix
+                 )
+                 if key != except_key)
+            )
+
+    @staticmethod
+    def write_parquet(workflow_id: int, wf_module_id: int, delta_id: int,
+                      result: ProcessResult,
+                      table_hash: Optional[str] = None
+                      ) -> Tuple[str, parquet.FileInfo]:
+        """
+        Upload `result.dataframe` to its content-addressed blob; return the
+        blob's key and FileInfo.
+
+        Pass `table_hash` if you already computed
+        `hash_table_contents(result.dataframe)`: hashing scans every value.
+
+        If the blob already exists, skip the upload: just touch it, so
+        `delete_unreferenced_blobs()` won't delete it before we reference it,
+        and read its size and footer.
+
+        This touches neither the database nor other deltas' files, so it's
+        safe to call without a lock. Pass the return values to
+        `assign_wf_module()` (within a lock) to make the result visible.
+        """
+        bucket = minio.CachedRenderResultsBucket
+        if table_hash is None:
+            table_hash = hash_table_contents(result.dataframe)
+        key = blob_key(table_hash)
+        try:
+            minio.touch(bucket, key)
+            file_info = parquet.read_file_info(bucket, key)
+        except FileNotFoundError:
+            # Either it's new or `delete_unreferenced_blobs()` just deleted it
+            file_info = parquet.write(bucket, key, result.dataframe)
+        # The next step (or another tab) will probably read this right away
+        render_cache.put((workflow_id, wf_module_id, delta_id),
+                         result.dataframe)
+        return key, file_info
 
     @staticmethod
     def clear_wf_module(wf_module: 'WfModule') -> None:
@@ -223,14 +453,31 @@ class CachedRenderResult:
         wf_module.cached_render_result_status = None
         wf_module.cached_render_result_columns = None
         wf_module.cached_render_result_nrows = None
+        wf_module.cached_render_result_parquet_size = None
+        wf_module.cached_render_result_parquet_footer = None
+        wf_module.cached_render_result_parquet_key = None
+        wf_module.cached_render_result_fingerprint = None
+        wf_module.cached_render_result_input_fingerprint = None
 
         wf_module.save(update_fields=WfModuleFields)
 
     @staticmethod
-    def assign_wf_module(wf_module: 'WfModule', delta_id: int,
-                         result: ProcessResult) -> 'CachedRenderResult':
+    def assign_wf_module(
+        wf_module: 'WfModule',
+        delta_id: int,
+        result: ProcessResult,
+        blob: Optional[Tuple[str, parquet.FileInfo]] = None,
+        fingerprint: Optional[str] = None,
+        input_fingerprint: Optional[str] = None
+    ) -> 'CachedRenderResult':
         """
         Write `result` to `wf_module`'s fields and to disk.
+
+        If `blob` is set, the caller already uploaded the Parquet file with
+        `write_parquet()`; we only delete old deltas' files and write to the
+        database. The database never points to a file that was not uploaded:
+        if `delete_unreferenced_blobs()` deleted the blob after
+        `write_parquet()`, we upload it again.
         """
         assert delta_id == wf_module.last_relevant_delta_id
         assert result is not None
@@ -246,14 +493,133 @@ class CachedRenderResult:
                                                       for qf in quick_fixes]
         wf_module.cached_render_result_columns = result.columns
         wf_module.cached_render_result_nrows = len(result.dataframe)
+        wf_module.cached_render_result_fingerprint = fingerprint
+        wf_module.cached_render_result_input_fingerprint = input_fingerprint
 
+        # Delete files from before we wrote blobs
         CachedRenderResult.delete_parquet_files_for_wf_module(wf_module)
+        if blob is None:
+            blob = CachedRenderResult.write_parquet(wf_module.workflow_id,
+                                                    wf_module.id, delta_id,
+                                                    result)
+        else:
+            render_cache.put((wf_module.workflow_id, wf_module.id, delta_id),
+                             result.dataframe)
+        key, file_info = blob
+
+        with transaction.atomic():
+            # Until we commit, delete_unreferenced_blobs() can't delete the
+            # blob. But it may have deleted it already.
+            _lock_blob(key, shared=True)
+            if not minio.exists(minio.CachedRenderResultsBucket, key):
+                file_info = parquet.write(minio.CachedRenderResultsBucket, key,
+                                          result.dataframe)
+
+            wf_module.cached_render_result_parquet_key = key
+            wf_module.cached_render_result_parquet_size = file_info.size
+            wf_module.cached_render_result_parquet_footer = file_info.footer
+
+            wf_module.save(update_fields=WfModuleFields)
 
         ret = CachedRenderResult.from_wf_module(wf_module)
         ret._result = result  # no need to read from disk
-        parquet.write(minio.CachedRenderResultsBucket, ret.parquet_key,
-                      result.dataframe)
+        return ret
 
-        wf_module.save(update_fields=WfModuleFields)
+    @staticmethod
+    def reassign_wf_module(
+        wf_module: 'WfModule',
+        delta_id: int,
+        stale_result: 'CachedRenderResult'
+    ) -> 'CachedRenderResult':
+        """
+        Point `wf_module`'s cached render result at `stale_result`'s data.
 
+        If `stale_result` is a blob, just write `delta_id` to the database.
+        Otherwise, copy its Parquet file to `delta_id`'s key first (S3 copies it
+        without downloading it) and delete other deltas' files. Every other
+        field stays as it was.
+        """
+        assert delta_id == wf_module.last_relevant_delta_id
+        assert stale_result.wf_module_id == wf_module.id
+
+        # Grab our in-process copy before we discard the old delta's files
+        dataframe = render_cache.get(stale_result.cache_key)
+
+        if stale_result.blob_key is None:
+            key = parquet_key(wf_module.workflow_id, wf_module.id, delta_id)
+            minio.copy(minio.CachedRenderResultsBucket, key,
+                       '%s/%s' % (minio.CachedRenderResultsBucket,
+                                  stale_result.parquet_key))
+            CachedRenderResult.delete_parquet_files_for_wf_module(
+                wf_module,
+                except_key=key
+            )
+        else:
+            render_cache.discard(stale_result.cache_key)
+
+        wf_module.cached_render_result_delta_id = delta_id
+        wf_module.save(update_fields=['cached_render_result_delta_id'])
+
+        ret = CachedRenderResult.from_wf_module(wf_module)
+        if dataframe is not None:
+            render_cache.put(ret.cache_key, dataframe)
         return ret
+
+    @staticmethod
+    def delete_unreferenced_blobs(
+        grace_period: datetime.timedelta = BlobGracePeriod
+    ) -> int:
+        """
+        Delete blobs no WfModule points to; return how many we deleted.
+
+        This is a mark-and-sweep garbage collector: list blobs older than
+        `grace_period`, query every key in the database (soft-deleted
+        WfModules included, so "undo" can restore them), and delete the rest.
+
+        Writers reference a blob after they upload or touch it. So before
+        deleting each blob, we lock it (see `_lock_blob()`) and check again
+        that no WfModule references it and that no writer touched it since we
+        listed it. A writer that touched it anyway -- between our check and
+        our delete -- waits for the lock, sees the blob is gone and uploads
+        it again.
+        """
+        from server.models import WfModule
+
+        bucket = minio.CachedRenderResultsBucket
+        cutoff = timezone.now() - grace_period
+        old_keys = [o['Key'] for o in minio.iter_objects(bucket, BlobPrefix)
+                    if o['LastModified'] < cutoff]
+        if not old_keys:
+            return 0
+
+        referenced_keys = frozenset(
+            WfModule.objects
+            .filter(cached_render_result_parquet_key__isnull=False)
+            .values_list('cached_render_result_parquet_key', flat=True)
+            .distinct()
+        )
+
+        n_deleted = 0
+        for key in old_keys:
+            if key in referenced_keys:
+                continue
+            with transaction.atomic():
+                _lock_blob(key, shared=False)
+                if WfModule.objects.filter(
+                    cached_render_result_parquet_key=key
+                ).exists():
+                    continue  # someone referenced it since our query
+                try:
+                    last_modified = minio.client.head_object(
+                        Bucket=bucket,
+                        Key=key
+                    )['LastModified']
+                except minio.error.ClientError:
+                    continue  # someone else deleted it
+                if last_modified >= timezone.now() - grace_period:
+                    continue  # someone touched it
+                logger.info('Deleting unreferenced render-result blob %s',
+                            key)
+                minio.remove(bucket, key)
+                n_deleted += 1
+        return n_deleted
@@ -1,6 +1,6 @@
 import uuid
-from django.db import models
-from django.db.models.signals import pre_delete
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 import pandas as pd
@@ -13,6 +13,43 @@ def _build_key(workflow_id: int, wf_module_id: int) -> str:
     return f'{workflow_id}/{wf_module_id}/{uuid.uuid1()}.dat'
 
 
+MaxChainLength = 20
+"""
+Most StoredObjects `get_table()` will read to build one accumulated table.
+
+Longer chains mean smaller writes when accumulating, but more S3 reads per
+`get_table()`.
+"""
+
+
+FileLockNamespace = 2
+"""
+First argument of the Postgres advisory locks that guard StoredObject files.
+
+(`worker.pg_locker` locks workflows with 0; `CachedRenderResult` locks blobs
+with 1.)
+"""
+
+
+def _lock_file(bucket: str, key: str) -> None:
+    """
+    Lock the file at `bucket`/`key` until the current transaction ends.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))',
+                       [FileLockNamespace, f'{bucket}/{key}'])
+
+
+def _concat_segments(tables):
+    """
+    Concatenate tables, newest first.
+
+    Modules tend to add columns over time, so the first table's columns come
+    first. Older tables may lack some columns: their values are null.
+    """
+    return pd.concat(tables, ignore_index=True, sort=False)
+
+
 # StoredObject is our persistence layer.
 # Allows WfModules to store keyed, versioned binary objects
 class StoredObject(models.Model):
@@ -30,11 +67,34 @@ class StoredObject(models.Model):
     hash = models.CharField(max_length=32)
     metadata = models.CharField(default=None, max_length=255, null=True)
     size = models.IntegerField(default=0)  # file size
+    # Parquet footer, so readers needn't query S3 to find it. NULL for old
+    # objects and huge footers.
+    parquet_footer = models.BinaryField(null=True, blank=True)
 
     # keeping track of whether this version of the data has ever been loaded
     # and delivered to the frontend
     read = models.BooleanField(default=False)
 
+    # Accumulated versions (see `create_prepended_table()`) store only their
+    # new rows; the rest of the table is `parent`'s. `hash` and `size`
+    # describe just this object's rows. `chain_length` counts this object and
+    # its ancestors. `max_rows`, if set, caps the rows `get_table()` returns:
+    # until the chain is compacted, it holds more rows than the module keeps.
+    #
+    # Deleting a parent deletes its children: callers must only delete
+    # versions no remaining version depends upon.
+    parent = models.ForeignKey('self', related_name='children', null=True,
+                               blank=True, on_delete=models.CASCADE)
+    chain_length = models.IntegerField(default=1)
+    max_rows = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        # Deleting a StoredObject queries for others that share its file
+        indexes = [
+            models.Index(fields=['bucket', 'key'],
+                         name='storedobject_bucket_key'),
+        ]
+
     @staticmethod
     def create_table(wf_module, table, metadata=None):
         hash = hash_table(table)
@@ -51,7 +111,8 @@ class StoredObject(models.Model):
                                              metadata=metadata)
 
         hash = hash_table(table)
-        if hash != old_so.hash:
+        # An accumulated version's hash only describes its own rows
+        if old_so.parent_id is not None or hash != old_so.hash:
             old_table = old_so.get_table()
             if not old_table.equals(table):
                 return StoredObject.__create_table_internal(wf_module, table,
@@ -60,56 +121,166 @@ class StoredObject(models.Model):
         return None
 
     @staticmethod
-    def __create_table_internal(wf_module, table, metadata, hash):
+    def __create_table_internal(wf_module, table, metadata, hash,
+                                parent=None, max_rows=None):
         # Write to minio bucket/key
         bucket = minio.StoredObjectsBucket
         key = _build_key(wf_module.workflow_id, wf_module.id)
-        size = parquet.write(bucket, key, table)
+        file_info = parquet.write(bucket, key, table)
 
         # Create the object that references the bucket/key
         return wf_module.stored_objects.create(
             metadata=metadata,
             bucket=minio.StoredObjectsBucket,
             key=key,
-            size=size,
-            hash=hash
+            size=file_info.size,
+            parquet_footer=file_info.footer,
+            hash=hash,
+            parent=parent,
+            chain_length=1 if parent is None else parent.chain_length + 1,
+            max_rows=max_rows
         )
 
-    def get_table(self):
+    @staticmethod
+    def create_prepended_table(wf_module, parent_so, table, metadata=None,
+                               max_rows=None):
+        """
+        Create a version of `parent_so`'s table with `table` prepended.
+
+        Only `table` is written: the new StoredObject points to `parent_so`
+        for the rest; `get_table()` returns at most `max_rows` rows of it.
+        Once the chain is `MaxChainLength` long, compact it instead: write the
+        whole table (up to `max_rows` rows) with no parent.
+
+        Return `None` (and create nothing) if `table` is empty.
+        """
+        if table.empty:
+            return None
+
+        if parent_so is None:
+            return StoredObject.create_table(wf_module, table,
+                                             metadata=metadata)
+
+        if parent_so.chain_length >= MaxChainLength:
+            full_table = _concat_segments([table, parent_so.get_table()])
+            if max_rows is not None:
+                full_table = full_table.truncate(after=max_rows - 1)
+            return StoredObject.create_table(wf_module, full_table,
+                                             metadata=metadata)
+
+        return StoredObject.__create_table_internal(wf_module, table,
+                                                    metadata,
+                                                    hash_table(table),
+                                                    parent=parent_so,
+                                                    max_rows=max_rows)
+
+    def _get_segment(self):
         if not self.bucket or not self.key:
             # Old (obsolete) objects have no bucket/key, usually because
             # empty tables weren't being written.
             return pd.DataFrame()
 
+        if self.parquet_footer is None:
+            file_info = None  # old object, or huge footer
+        else:
+            # parquet_footer is sometimes a memoryview
+            file_info = parquet.FileInfo(self.size, bytes(self.parquet_footer))
+
         try:
-            return parquet.read(self.bucket, self.key)
+            return parquet.read(self.bucket, self.key, file_info=file_info)
         except parquet.FastparquetCouldNotHandleFile:
             return pd.DataFrame()  # empty table
 
-    # make a deep copy for another WfModule
+    def get_table(self):
+        if self.parent_id is None:
+            return self._get_segment()
+
+        # Ancestors all belong to our WfModule: find them in one query
+        versions = {so.id: so for so in StoredObject.objects.filter(
+            wf_module_id=self.wf_module_id
+        )}
+
+        # Newest rows first. Stop reading once we have `max_rows`.
+        segments = []
+        n_rows = 0
+        so = self
+        while so is not None:
+            segment = so._get_segment()
+            segments.append(segment)
+            n_rows += len(segment)
+            if self.max_rows is not None and n_rows >= self.max_rows:
+                break
+            so = versions.get(so.parent_id)  # None after the oldest
+        table = _concat_segments(segments)
+        if self.max_rows is not None:
+            table = table.truncate(after=self.max_rows - 1)
+        return table
+
     def duplicate(self, to_wf_module):
-        key = _build_key(to_wf_module.workflow_id, to_wf_module.id)
-        minio.copy(self.bucket, key, f'{self.bucket}/{self.key}')
-
-        return to_wf_module.stored_objects.create(
-            stored_at=self.stored_at,
-            hash=self.hash,
-            metadata=self.metadata,
-            bucket=self.bucket,
-            key=key,
-            size=self.size
-        )
+        """
+        Copy this StoredObject to another WfModule, sharing its S3 file.
+
+        Files are never modified after they're written, so sharing is safe and
+        costs no S3 requests. Each StoredObject referencing a file counts as
+        a reference: we delete the file along with the last one.
 
+        We lock this StoredObject's row until the copy commits. Otherwise, a
+        concurrent delete of this StoredObject wouldn't see our uncommitted
+        copy, and it would delete the file the copy points to. If that
+        delete wins the lock instead, raise StoredObject.DoesNotExist.
 
-@receiver(pre_delete, sender=StoredObject)
-def _delete_from_s3_pre_delete(sender, instance, **kwargs):
+        An accumulated version (one with a `parent`) is copied as one whole
+        table, so the copy needn't carry our history.
+        """
+        if self.parent_id is not None:
+            so = StoredObject.create_table(to_wf_module, self.get_table(),
+                                           metadata=self.metadata)
+            so.stored_at = self.stored_at
+            so.save(update_fields=['stored_at'])
+            return so
+
+        with transaction.atomic():
+            # raises StoredObject.DoesNotExist
+            StoredObject.objects.select_for_update().only('id') \
+                    .get(pk=self.pk)
+            return to_wf_module.stored_objects.create(
+                stored_at=self.stored_at,
+                hash=self.hash,
+                metadata=self.metadata,
+                bucket=self.bucket,
+                key=self.key,
+                size=self.size,
+                parquet_footer=self.parquet_footer
+            )
+
+
+@receiver(post_delete, sender=StoredObject)
+def _delete_from_s3_post_delete(sender, instance, **kwargs):
     """
-    Delete file from S3, pre-delete.
+    Delete file from S3, if no other StoredObject references it.
 
-    Why pre-delete and not post-delete? Because our user expects the file to be
-    _gone_, completely, forever -- that's what "delete" means to the user. If
-    deletion fails, we need the link to remain in our database -- that's how
-    the user will know it isn't deleted.
+    Why post-delete? Because our user expects the file to be _gone_,
+    completely, forever -- that's what "delete" means to the user. Django
+    sends post_delete within the deletion's transaction: if S3 deletion fails,
+    the transaction rolls back and the link remains in our database -- that's
+    how the user will know it isn't deleted. And unlike pre_delete, by
+    post_delete the rows deleted alongside this one (say, a duplicate in the
+    same cascade) are gone, so the reference count is accurate.
+
+    Two transactions deleting StoredObjects that share a file would each see
+    the other's (not-yet-deleted) row, and neither would delete the file. So
+    we count references under an advisory lock on the file, held until
+    commit: the second deleter waits for the first to commit, and then its
+    count sees the first's delete. (Locking the sharing rows with
+    `select_for_update()` instead would deadlock: each deleter already holds
+    the row it deleted.)
     """
-    if instance.bucket and instance.key:
+    if not instance.bucket or not instance.key:
+        return
+
+    _lock_file(instance.bucket, instance.key)
+    if not StoredObject.objects.filter(
+        bucket=instance.bucket,
+        key=instance.key
+    ).exists():
         minio.remove(instance.bucket, instance.key)
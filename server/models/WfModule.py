@@ -1,8 +1,10 @@
-from typing import Optional, Union
+import copy
+from typing import Any, Dict, List, Optional, Tuple, Union
 from django.contrib.postgres.fields import JSONField
 from django.db import models
 from cjworkbench.types import ProcessResult
-from server import minio
+from server import minio, parquet
+from server.migrated_params_cache import hash_params, migrated_params_cache
 from server.models import loaded_module
 from .fields import ColumnsField
 from .Params import Params
@@ -57,6 +59,45 @@ class WfModule(models.Model):
             is_deleted=False
         )
 
+    @classmethod
+    def load_live_in_workflow(cls, workflow: Workflow) -> List['WfModule']:
+        """
+        List not-deleted WfModules in `workflow`, ready to serialize.
+
+        Serializing WfModules from `live_in_workflow()` costs several queries
+        per WfModule: its Tab, its ModuleVersion and its fetched-data versions.
+        This loads all of them for all WfModules in three queries total.
+
+        Each WfModule's `list_fetched_data_versions()` is a snapshot: it won't
+        see data fetched after this call.
+        """
+        wf_modules = list(
+            cls.live_in_workflow(workflow)
+            .select_related('tab')
+            .order_by('tab__position', 'order')
+        )
+        if not wf_modules:
+            return []
+
+        module_versions = ModuleVersion.objects.latest_many(
+            wfm.module_id_name for wfm in wf_modules
+        )
+
+        fetched_data_versions = {wfm.id: [] for wfm in wf_modules}
+        for wf_module_id, stored_at, read in (
+            StoredObject.objects
+            .filter(wf_module_id__in=fetched_data_versions.keys())
+            .order_by('-stored_at')
+            .values_list('wf_module_id', 'stored_at', 'read')
+        ):
+            fetched_data_versions[wf_module_id].append((stored_at, read))
+
+        for wfm in wf_modules:
+            wfm._module_version = module_versions.get(wfm.module_id_name)
+            wfm._fetched_data_versions = fetched_data_versions[wfm.id]
+
+        return wf_modules
+
     tab = models.ForeignKey(
         Tab,
         related_name='wf_modules',
@@ -114,6 +155,27 @@ class WfModule(models.Model):
     cached_render_result_quick_fixes = JSONField(blank=True, default=list)
     cached_render_result_columns = ColumnsField(null=True, blank=True)
     cached_render_result_nrows = models.IntegerField(null=True, blank=True)
+    # Parquet file size and footer, so readers needn't query S3 to find them.
+    # NULL for files written before we stored them (and footer is NULL for
+    # huge footers).
+    cached_render_result_parquet_size = models.IntegerField(null=True,
+                                                            blank=True)
+    cached_render_result_parquet_footer = models.BinaryField(null=True,
+                                                             blank=True)
+    # Content-addressed Parquet file (see CachedRenderResult.BlobPrefix). NULL
+    # for results written before we wrote blobs. Indexed, because
+    # delete_unreferenced_blobs() looks up each unreferenced-looking key.
+    cached_render_result_parquet_key = models.CharField(null=True, blank=True,
+                                                        max_length=100,
+                                                        db_index=True)
+    # Fingerprints of the result and of everything that went into render(),
+    # so we can reuse a stale result instead of re-rendering. NULL for results
+    # cached before we stored them.
+    cached_render_result_fingerprint = models.CharField(null=True, blank=True,
+                                                        max_length=32)
+    cached_render_result_input_fingerprint = models.CharField(null=True,
+                                                              blank=True,
+                                                              max_length=32)
 
     # TODO once we auto-compute stale module outputs, nix is_busy -- it will
     # be implied by the fact that the cached output revision is wrong.
@@ -201,6 +263,22 @@ class WfModule(models.Model):
                                                              metadata=metadata)
         return new_version.stored_at if new_version else None
 
+    # Prepends to current version, because that's what fetch() read to
+    # decide which rows are new. (The latest version may have rows from
+    # after the current version.)
+    # Note: does not switch to new version automatically
+    def store_prepended_rows(self, table, metadata='', max_rows=None):
+        reference_so = StoredObject.objects.filter(
+            wf_module=self,
+            stored_at=self.stored_data_version
+        ).first()
+
+        new_version = StoredObject.create_prepended_table(self, reference_so,
+                                                          table,
+                                                          metadata=metadata,
+                                                          max_rows=max_rows)
+        return new_version.stored_at if new_version else None
+
     def retrieve_fetched_table(self):
         try:
             return self.stored_objects.get(
@@ -219,6 +297,10 @@ class WfModule(models.Model):
         return ProcessResult(table, self.fetch_error)
 
     def list_fetched_data_versions(self):
+        if hasattr(self, '_fetched_data_versions'):
+            # set by load_live_in_workflow()
+            return list(self._fetched_data_versions)
+
         return list(self.stored_objects
                     .order_by('-stored_at')
                     .values_list('stored_at', 'read'))
@@ -237,16 +319,41 @@ class WfModule(models.Model):
         if self.module_version is None:
             return Params(ParamDTypeDict({}), {}, {})
 
-        schema = self.module_version.param_schema
-        lm = (
-            # we don't import LoadedModule directly, because we'll mock it
-            # out in unit tests.
-            loaded_module.LoadedModule.for_module_version_sync(
-                self.module_version
+        module_version = self.module_version
+        schema = module_version.param_schema
+        if module_version.last_update_time is None:
+            cache_key = None  # unsaved ModuleVersion: its spec may change
+            values = None
+        else:
+            cache_key = (module_version.id_name,
+                         module_version.source_version_hash,
+                         module_version.last_update_time,
+                         hash_params(self.params))
+            values = migrated_params_cache.get(cache_key)
+
+        if values is None:
+            lm = (
+                # we don't import LoadedModule directly, because we'll mock it
+                # out in unit tests.
+                loaded_module.LoadedModule.for_module_version_sync(
+                    module_version
+                )
             )
-        )
-        # raises ValueError if there's a problem migrating, which indicates programmer error (probably module author)
-        values = lm.migrate_params(schema, self.params)
+            # raises ValueError if there's a problem migrating, which indicates programmer error (probably module author)
+            values = lm.migrate_params(schema, self.params)
+            if cache_key is not None:
+                migrated_params_cache.put(cache_key, values)
+
+        if (
+            migrated_params_cache.write_back
+            and cache_key is not None
+            and self.pk is not None
+            and values != self.params
+        ):
+            self._write_back_migrated_params(values)
+            # Migrating already-migrated params is a no-op
+            migrated_params_cache.put(cache_key[:3] + (hash_params(values),),
+                                      values)
 
         # "migrate" secrets: exactly the id_names specified in module_version
         # spec, with values maybe None
@@ -257,6 +364,21 @@ class WfModule(models.Model):
 
         return Params(schema, values, secrets)
 
+    def _write_back_migrated_params(self, values: Dict[str, Any]) -> None:
+        """
+        Store `values` as our params, so nobody needs to migrate them again.
+
+        This doesn't change what any module sees, so it isn't a Delta. If
+        somebody else changed params since we read them, do nothing.
+        """
+        n_updated = (
+            WfModule.objects
+            .filter(id=self.id, params=self.params)
+            .update(params=values)
+        )
+        if n_updated:
+            self.params = copy.deepcopy(values)  # caller may modify `values`
+
     # re-render entire workflow when a module goes ready or error, on the
     # assumption that new output data is available
     def set_ready(self):
@@ -304,32 +426,35 @@ class WfModule(models.Model):
             new_wfm.cached_render_result_delta_id = \
                 new_wfm.last_relevant_delta_id
             for attr in ('status', 'error', 'json', 'quick_fixes', 'columns',
-                         'nrows'):
+                         'nrows', 'parquet_size', 'parquet_footer',
+                         'parquet_key', 'fingerprint', 'input_fingerprint'):
                 full_attr = f'cached_render_result_{attr}'
                 setattr(new_wfm, full_attr, getattr(self, full_attr))
 
             new_wfm.save()  # so there is a new_wfm.id for parquet_key
 
             # Now new_wfm.cached_render_result will return a
-            # CachedRenderResult, because all the DB values are set. It'll have
-            # a .parquet_key ... but there won't be a file there (because we
-            # never wrote it).
-            parquet_key = new_wfm.cached_render_result.parquet_key
-
-            try:
-                minio.copy(
-                    minio.CachedRenderResultsBucket,
-                    parquet_key,
-                    '%(Bucket)s/%(Key)s' % {
-                        'Bucket': minio.CachedRenderResultsBucket,
-                        'Key': cached_result.parquet_key,
-                    }
-                )
-            except minio.error.NoSuchKey:
-                # DB and filesystem are out of sync. CachedRenderResult handles
-                # such cases gracefully. So `new_result` will behave exactly
-                # like `cached_result`.
-                pass
+            # CachedRenderResult, because all the DB values are set. If it's a
+            # blob, both WfModules point to the same file and we're done.
+            # Otherwise, it'll have a .parquet_key ... but there won't be a
+            # file there (because we never wrote it).
+            if cached_result.blob_key is None:
+                parquet_key = new_wfm.cached_render_result.parquet_key
+
+                try:
+                    minio.copy(
+                        minio.CachedRenderResultsBucket,
+                        parquet_key,
+                        '%(Bucket)s/%(Key)s' % {
+                            'Bucket': minio.CachedRenderResultsBucket,
+                            'Key': cached_result.parquet_key,
+                        }
+                    )
+                except minio.error.NoSuchKey:
+                    # DB and filesystem are out of sync. CachedRenderResult
+                    # handles such cases gracefully. So `new_result` will
+                    # behave exactly like `cached_result`.
+                    pass
         else:
             new_wfm.save()
 
@@ -375,13 +500,24 @@ class WfModule(models.Model):
             return None
         return result
 
-    def cache_render_result(self, delta_id: int,
-                            result: ProcessResult) -> CachedRenderResult:
+    def cache_render_result(
+        self,
+        delta_id: int,
+        result: ProcessResult,
+        blob: Optional[Tuple[str, parquet.FileInfo]] = None,
+        fingerprint: Optional[str] = None,
+        input_fingerprint: Optional[str] = None
+    ) -> CachedRenderResult:
         """
         Save the given ProcessResult for later viewing.
 
         Raise AssertionError if `delta_id` is not what we expect.
 
+        Pass `blob` if you already uploaded the Parquet file using
+        `CachedRenderResult.write_parquet()`. Pass `fingerprint` and
+        `input_fingerprint` (see `worker.execute.fingerprint`) so a later render
+        can reuse this result.
+
         Since this alters data, be sure to call it within a lock:
 
             with wf_module.workflow.cooperative_lock():
@@ -391,7 +527,33 @@ class WfModule(models.Model):
         assert delta_id == self.last_relevant_delta_id
         assert result is not None
 
-        return CachedRenderResult.assign_wf_module(self, delta_id, result)
+        return CachedRenderResult.assign_wf_module(
+            self,
+            delta_id,
+            result,
+            blob,
+            fingerprint=fingerprint,
+            input_fingerprint=input_fingerprint
+        )
+
+    def reuse_stale_render_result(
+        self,
+        stale_result: CachedRenderResult
+    ) -> CachedRenderResult:
+        """
+        Make the stale `stale_result` our fresh cached render result.
+
+        Call this when rendering at `last_relevant_delta_id` would reproduce
+        `stale_result` exactly. It updates `cached_render_result_delta_id` (and
+        copies the Parquet file on S3's side, if it isn't a blob).
+
+        Since this alters data, be sure to call it within a lock.
+        """
+        return CachedRenderResult.reassign_wf_module(
+            self,
+            self.last_relevant_delta_id,
+            stale_result
+        )
 
     def clear_cached_render_result(self) -> None:
         """
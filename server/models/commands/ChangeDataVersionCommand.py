@@ -47,8 +47,11 @@ class ChangeDataVersionCommand(ChangesWfModuleOutputs, Delta):
         Of course, it's impossible for us to know whether anybody is viewing
         self.workflow. So we _broadcast_ to them and ask _them_ to request a
         render if they're listening. This gives N render requests (one per
-        Websockets cconsumer) instead of 1, but we assume the extra render
-        requests will be no-ops.
+        Websockets cconsumer) instead of 1, but workers coalesce pending
+        requests for the same workflow.
+
+        We queue one or the other, never both: either would render the same
+        delta.
 
         From the user's point of view:
 
@@ -64,8 +67,12 @@ class ChangeDataVersionCommand(ChangesWfModuleOutputs, Delta):
             * The Django page-load view queues a render when needed.
         """
         if await _workflow_has_notifications(self.workflow):
+            # Render for the emails -- which also renders for anybody
+            # watching, so don't ask them to request another render. Emails
+            # aren't urgent: let interactive renders go first.
             await rabbitmq.queue_render(self.workflow.id,
-                                        self.workflow.last_delta_id)
+                                        self.workflow.last_delta_id,
+                                        background=True)
         else:
             await websockets.queue_render_if_listening(
                 self.workflow.id,
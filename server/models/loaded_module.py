@@ -10,11 +10,11 @@ import sys
 import time
 import traceback
 from types import ModuleType
-from typing import Any, Awaitable, Callable, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
 from django.contrib.auth.models import User
 import pandas as pd
 from cjworkbench.sync import database_sync_to_async
-from cjworkbench.types import ProcessResult, RenderColumn
+from cjworkbench.types import ProcessResult, RenderColumn, RowsToPrepend
 from . import module_loader
 from .module_version import ModuleVersion
 from .Params import Params
@@ -158,12 +158,15 @@ class LoadedModule:
         get_input_dataframe: Callable[[], Awaitable[pd.DataFrame]],
         get_stored_dataframe: Callable[[], Awaitable[pd.DataFrame]],
         get_workflow_owner: Callable[[], Awaitable[User]]
-    ) -> ProcessResult:
+    ) -> Union[ProcessResult, RowsToPrepend]:
         """
         Process `params` with module `fetch` method, to build a ProcessResult.
 
         If the `fetch` method raises an exception, this method will return an
         error string. It is always an error for a module to raise an exception.
+
+        If the `fetch` method returns `RowsToPrepend`, return `RowsToPrepend`
+        with the rows validated (or a ProcessResult error if they're invalid).
         """
         kwargs = {}
         spec = inspect.getfullargspec(self.fetch_impl)
@@ -220,12 +223,18 @@ class LoadedModule:
 
         time2 = time.time()
 
+        rows_to_prepend = None
+        if isinstance(out, RowsToPrepend):
+            rows_to_prepend = out
+            out = out.dataframe
+
         if out is None:
             shape = (-1, -1)
         else:
             try:
                 out = ProcessResult.coerce(out)
             except ValueError as err:
+                rows_to_prepend = None
                 logger.exception(
                     '%s.fetch gave invalid output. workflow=%d, params=%s'
                     % (self.module_id_name, workflow_id,
@@ -241,6 +250,8 @@ class LoadedModule:
                     self.name, shape[0], shape[1],
                     int((time2 - time1) * 1000))
 
+        if rows_to_prepend is not None and out is not None:
+            return RowsToPrepend(out.dataframe, rows_to_prepend.max_rows)
         return out
 
     @classmethod
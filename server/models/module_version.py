@@ -1,4 +1,6 @@
-from typing import Any, Dict, Optional
+from dataclasses import dataclass
+import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
 from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -20,6 +22,81 @@ def _django_validate_module_spec(spec: Any) -> None:
         raise ValidationError(str(err))
 
 
+def _iter_nested_dtypes(dtype: ParamDType) -> Iterable[ParamDType]:
+    """
+    Yield `dtype` and every dtype inside it, at any depth.
+
+    (`dtype.iter_dfs_dtypes()` only yields direct children. A Column can hide
+    deeper: `Multichartseries` is a List of Dicts of Column.)
+    """
+    yield dtype
+    for child in dtype.iter_dfs_dtypes():
+        if child is not dtype:
+            yield from _iter_nested_dtypes(child)
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    """
+    A module spec's parsed parameters, plus facts about them.
+
+    Parsing `spec['parameters']` is slow, and we need the result several times
+    per step per render (and per step per page load). Each process parses each
+    ModuleVersion's spec once and shares the result: don't mutate it.
+    """
+
+    param_fields: Tuple[ParamSpec, ...]
+    param_schema: ParamDType.Dict
+    has_tab_params: bool
+    has_column_params: bool
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any]) -> 'CompiledSchema':
+        param_fields = tuple(ParamSpec.from_dict(d)
+                             for d in spec['parameters'])
+
+        if 'param_schema' in spec:
+            # Module author wrote a schema in the YAML, to define storage of
+            # 'custom' parameters
+            param_schema = ParamDType.parse({
+                'type': 'dict',
+                'properties': spec['param_schema']
+            })
+        else:
+            # Usual case: infer schema from module parameter types. Use of
+            # dict here means schema is not sensitive to parameter ordering,
+            # which is good
+            param_schema = ParamDType.Dict(dict((f.id_name, f.dtype)
+                                                for f in param_fields
+                                                if f.dtype is not None))
+
+        dtypes = list(_iter_nested_dtypes(param_schema))
+        return cls(
+            param_fields=param_fields,
+            param_schema=param_schema,
+            has_tab_params=any(
+                isinstance(dtype, (ParamDType.Tab, ParamDType.Multitab))
+                for dtype in dtypes
+            ),
+            has_column_params=any(
+                isinstance(dtype, (ParamDType.Column, ParamDType.Multicolumn))
+                for dtype in dtypes
+            )
+        )
+
+
+_compiled_schemas: Dict[Tuple[str, str, datetime.datetime],
+                        CompiledSchema] = {}
+"""
+Process-wide cache of CompiledSchema, keyed by
+`(id_name, source_version_hash, last_update_time)`.
+
+A ModuleVersion's spec never changes without its `last_update_time` changing,
+so entries never go stale. There is one entry per ModuleVersion a process has
+seen: few enough that we needn't evict.
+"""
+
+
 class ModuleVersionManager(models.Manager):
     """
     Juggle internal and external modules.
@@ -98,6 +175,38 @@ class ModuleVersionManager(models.Manager):
         except IndexError:
             raise ModuleVersion.DoesNotExist
 
+    def latest_many(self, id_names: Iterable[str]) -> Dict[str, 'ModuleVersion']:
+        """
+        Like `latest()`, for many id_names at once: one query at most.
+
+        Return a dict from id_name to ModuleVersion. id_names that have no
+        ModuleVersion are omitted.
+        """
+        self._ensure_internal_loaded()
+
+        id_names = set(id_names)
+        ret = {id_name: self.internal[id_name]
+               for id_name in id_names
+               if id_name in self.internal}
+        external_id_names = id_names - ret.keys()
+        if not external_id_names:
+            return ret
+
+        latest = (
+            self.get_queryset()
+            .filter(id_name=OuterRef('id_name'))
+            .order_by('-last_update_time')
+            .values('id')
+        )[:1]
+        for module_version in (
+            self.get_queryset()
+            .filter(id_name__in=external_id_names)
+            .annotate(_latest=Subquery(latest))
+            .filter(id=F('_latest'))
+        ):
+            ret[module_version.id_name] = module_version
+        return ret
+
 
 class ModuleVersion(models.Model):
     """
@@ -186,26 +295,29 @@ class ModuleVersion(models.Model):
     def html_output(self):
         return self.spec.get('html_output', False)
 
+    @property
+    def compiled_schema(self) -> CompiledSchema:
+        if self.last_update_time is None:
+            # Not saved, so nothing stops the caller from editing `spec`.
+            # (Only unit tests do this.)
+            return CompiledSchema.from_spec(self.spec)
+
+        key = (self.id_name, self.source_version_hash, self.last_update_time)
+        try:
+            return _compiled_schemas[key]
+        except KeyError:
+            compiled_schema = CompiledSchema.from_spec(self.spec)
+            _compiled_schemas[key] = compiled_schema
+            return compiled_schema
+
     @property
     def param_fields(self):
-        return [ParamSpec.from_dict(d) for d in self.spec['parameters']]
+        return list(self.compiled_schema.param_fields)
 
     # Returns a dict of DTypes for all parameters
     @property
     def param_schema(self):
-        if 'param_schema' in self.spec:
-            # Module author wrote a schema in the YAML, to define storage of 'custom' parameters
-            json_schema = self.spec['param_schema']
-            return ParamDType.parse({
-                'type': 'dict',
-                'properties': json_schema
-            })
-        else:
-            # Usual case: infer schema from module parameter types
-            # Use of dict here means schema is not sensitive to parameter ordering, which is good
-            return ParamDType.Dict(dict((f.id_name, f.dtype)
-                                        for f in self.param_fields
-                                        if f.dtype is not None))
+        return self.compiled_schema.param_schema
 
     @property
     def default_params(self):
@@ -515,12 +515,7 @@ class DependencyGraph:
                     continue
 
                 schema = module_version.param_schema
-                if all(
-                    ((not isinstance(dtype, ParamDType.Tab)
-                      and not isinstance(dtype, ParamDType.Multitab))
-                     for dtype in schema.iter_dfs_dtypes())
-                ):
-                    # There are no tab params.
+                if not module_version.compiled_schema.has_tab_params:
                     steps[wf_module.id] = cls.Step(set())
                     continue
 
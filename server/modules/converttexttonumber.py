@@ -3,6 +3,7 @@ from enum import Enum
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 import numpy as np
 import pandas as pd
+from pandas.api.extensions import take
 from pandas.api.types import is_numeric_dtype
 import re
 
@@ -224,9 +225,17 @@ class Form:
         return table
 
     def convert_series(self, series) -> Tuple[pd.Series, ErrorCount]:
-        number_texts = series.str.extract(self.regex, expand=False)
+        # Run the regex once per distinct value, not once per row. For a
+        # categorical, factorize() reuses its codes; otherwise, it's one
+        # hashing pass. Null rows get code -1.
+        codes, uniques = pd.factorize(series)
+        texts = pd.Series(np.asarray(uniques), dtype=object)
+        number_texts = texts.str.extract(self.regex, expand=False)
         number_texts = self.unformat_number_text(number_texts)
-        numbers = pd.to_numeric(number_texts, errors='coerce')
+        unique_numbers = pd.to_numeric(number_texts, errors='coerce').values
+        numbers = pd.Series(take(unique_numbers, codes, allow_fill=True,
+                                 fill_value=np.nan),
+                            index=series.index)
 
         return numbers, ErrorCount.from_diff(series, numbers)
 
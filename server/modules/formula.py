@@ -1,6 +1,13 @@
+from dataclasses import dataclass
 import itertools
+from typing import List, Optional, Union
 from formulas import Parser
+from formulas.builder import AstBuilder
+from formulas.tokens.function import Function
+from formulas.tokens.operand import Number, Range, String
+from formulas.tokens.operator import Operator
 import pandas as pd
+from pandas.api.types import is_categorical_dtype
 import numpy as np
 from .utils import build_globals_for_eval
 from server.sanitizedataframe import sanitize_series
@@ -125,15 +132,286 @@ def eval_excel_all_rows(code, table):
     return pd.Series(newcol)
 
 
+# ---- Column-wise Excel evaluation ----
+#
+# Calling the compiled formula once per row is slow: each call runs the
+# `formulas` module's dispatcher. For simple formulas over whole columns, we
+# compute each operator once, with numpy, over entire columns.
+#
+# We only handle cases where we're sure to reproduce `formulas`' per-row
+# results. For anything else -- unknown functions, text-number mixes, and any
+# row that would produce an Excel error such as #DIV/0! -- we raise
+# _Unsupported and the caller evaluates row by row, as before.
+
+
+class _Unsupported(Exception):
+    """The formula can't be evaluated column-wise; evaluate row by row."""
+
+
+class _TreeBuilder(AstBuilder):
+    """
+    AstBuilder that also records the expression tree.
+
+    `formulas` calls `append()` with tokens in postfix order. Operators and
+    functions consume the last `n_args` nodes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tree = []  # stack of (token, [child, ...])
+
+    def append(self, token):
+        super().append(token)
+        if isinstance(token, (Operator, Function)):
+            n_args = token.get_n_args
+            children = self.tree[len(self.tree) - n_args:]
+            del self.tree[len(self.tree) - n_args:]
+            self.tree.append((token, children))
+        else:
+            self.tree.append((token, []))
+
+
+class _TreeParser(Parser):
+    ast_builder = _TreeBuilder
+
+
+@dataclass(frozen=True)
+class _Values:
+    """
+    A formula node's value in every row.
+
+    `kind` is 'number', 'bool' or 'text' -- or 'range' for a multi-column
+    range, whose `values` is a list of 'number' arrays. `values` and `errors`
+    may be scalars, which numpy broadcasts. `errors` is True where `formulas`
+    would have produced an Excel error.
+    """
+
+    kind: str
+    values: Union[np.ndarray, List[np.ndarray]]
+    errors: Union[np.ndarray, bool] = False
+
+
+def _row_dtype(table: pd.DataFrame) -> Optional[np.dtype]:
+    """
+    Return the dtype `table.values` would have, or `None` for `object`.
+
+    `eval_excel_all_rows()` reads `table.values`. If every column is numeric,
+    ints become floats there; otherwise they stay ints.
+    """
+    dtypes = list(table.dtypes)
+    if all(dtype in (np.int64, np.float64) for dtype in dtypes):
+        return np.result_type(*dtypes)
+    if all(dtype in (np.int64, np.float64, np.object_)
+           or is_categorical_dtype(dtype) for dtype in dtypes):
+        return None
+    raise _Unsupported()
+
+
+def _eval_reference(token, table: pd.DataFrame) -> _Values:
+    attr = token.attr
+    if (
+        attr.get('r1') != '1' or attr.get('r2') != '1'
+        or attr.get('sheet') or attr.get('excel')
+        or 'n1' not in attr or 'n2' not in attr
+    ):
+        raise _Unsupported()  # row-wise evaluation will explain the error
+
+    indices = range(int(attr['n1']) - 1, int(attr['n2']))
+    if indices.start < 0 or indices.stop > len(table.columns):
+        raise _Unsupported()
+
+    row_dtype = _row_dtype(table)
+    columns = []
+    for index in indices:
+        series = table.iloc[:, index]
+        if series.dtype in (np.int64, np.float64):
+            values = series.values
+            if row_dtype is not None:
+                values = values.astype(row_dtype, copy=False)
+            columns.append(_Values('number', values))
+        elif not series.isna().any():
+            # Text. (We don't know how `formulas` handles null text.)
+            columns.append(_Values('text', np.asarray(series, dtype=object)))
+        else:
+            raise _Unsupported()
+
+    if len(columns) == 1:
+        return columns[0]
+    if any(column.kind != 'number' for column in columns):
+        raise _Unsupported()
+    return _Values('range', [column.values for column in columns])
+
+
+def _to_float(value: _Values) -> np.ndarray:
+    # `formulas` calls float() on each operand
+    if value.kind not in ('number', 'bool'):
+        raise _Unsupported()
+    return np.asarray(value.values, dtype=np.float64)
+
+
+def _eval_arithmetic(name: str, args: List[_Values]) -> _Values:
+    xs = [_to_float(arg) for arg in args]
+    with np.errstate(all='ignore'):
+        if name == 'u-':
+            result = -xs[0]
+        elif name == '+':
+            result = xs[0] + xs[1]
+        elif name == '-':
+            result = xs[0] - xs[1]
+        elif name == '*':
+            result = xs[0] * xs[1]
+        elif name == '/':
+            result = xs[0] / xs[1]  # x/0 is non-finite: an error
+        else:  # '^'
+            result = np.power(xs[0], xs[1])
+    # NaN and infinity become #NUM! or #DIV/0!
+    errors = _any_errors(args) | ~np.isfinite(result)
+    return _Values('number', result, errors)
+
+
+def _eval_comparison(name: str, args: List[_Values]) -> _Values:
+    x, y = args
+    if x.kind != y.kind or x.kind not in ('number', 'bool', 'text'):
+        # `formulas` compares (type, value) tuples; we don't.
+        raise _Unsupported()
+    errors = _any_errors(args)
+    if x.kind == 'number':
+        # NaN comparisons depend on object identity. Don't go there.
+        errors = errors | np.isnan(x.values) | np.isnan(y.values)
+    op = {
+        '=': np.equal,
+        '<>': np.not_equal,
+        '<': np.less,
+        '<=': np.less_equal,
+        '>': np.greater,
+        '>=': np.greater_equal,
+    }[name]
+    return _Values('bool', op(x.values, y.values), errors)
+
+
+def _eval_concatenate(args: List[_Values]) -> _Values:
+    if any(arg.kind != 'text' for arg in args):
+        raise _Unsupported()  # we'd need to format numbers like `formulas`
+    return _Values('text', np.add(args[0].values, args[1].values,
+                                  dtype=object),
+                   _any_errors(args))
+
+
+def _eval_sum(args: List[_Values], n_rows: int) -> _Values:
+    # Like `sum()`: start with int 0, then add, left to right.
+    total = np.zeros(n_rows, dtype=np.int64)
+    for arg in args:
+        if arg.kind == 'number':
+            total = total + arg.values
+        elif arg.kind == 'range':
+            for values in arg.values:
+                total = total + values
+        else:
+            # SUM() skips Python bools but adds numpy bools, and text is
+            # complicated.
+            raise _Unsupported()
+    return _Values('number', total, _any_errors(args))
+
+
+def _eval_if(args: List[_Values]) -> _Values:
+    if len(args) != 3:
+        raise _Unsupported()
+    condition, x, y = args
+    if condition.kind not in ('number', 'bool'):
+        raise _Unsupported()  # text condition is #VALUE!
+    if x.kind != y.kind or x.kind not in ('number', 'bool', 'text'):
+        raise _Unsupported()  # mixed types would become a text column
+
+    mask = np.asarray(condition.values).astype(bool)  # NaN is True
+    x_values = np.asarray(x.values)
+    y_values = np.asarray(y.values)
+    if x_values.dtype != y_values.dtype and mask.all():
+        values = np.broadcast_to(x_values, mask.shape)  # e.g., stay int
+    elif x_values.dtype != y_values.dtype and not mask.any():
+        values = np.broadcast_to(y_values, mask.shape)
+    else:
+        values = np.where(mask, x_values, y_values)
+    errors = condition.errors | np.where(mask, x.errors, y.errors)
+    if x.kind == 'number':
+        errors = errors | ~np.isfinite(values)  # #NUM!
+    return _Values(x.kind, values, errors)
+
+
+def _any_errors(args: List[_Values]):
+    errors = False
+    for arg in args:
+        errors = errors | arg.errors
+    return errors
+
+
+def _eval_node(node, table: pd.DataFrame) -> _Values:
+    token, children = node
+    if isinstance(token, Range):
+        return _eval_reference(token, table)
+    if isinstance(token, Number):
+        value = token.compile()  # int, float or bool
+        kind = 'bool' if isinstance(value, bool) else 'number'
+        return _Values(kind, np.array(value))
+    if isinstance(token, String):
+        return _Values('text', np.array(token.compile(), dtype=object))
+
+    args = [_eval_node(child, table) for child in children]
+    if any(arg.kind == 'range' for arg in args) and not (
+        isinstance(token, Function) and token.name.upper() == 'SUM'
+    ):
+        raise _Unsupported()
+
+    if isinstance(token, Function):
+        name = token.name.upper()
+        if name == 'SUM':
+            return _eval_sum(args, len(table))
+        if name == 'IF':
+            return _eval_if(args)
+    elif isinstance(token, Operator):
+        name = token.name.lower()
+        if name in ('u-', '+', '-', '*', '/', '^'):
+            return _eval_arithmetic(name, args)
+        if name in ('=', '<>', '<', '<=', '>', '>='):
+            return _eval_comparison(name, args)
+        if name == '&':
+            return _eval_concatenate(args)
+
+    raise _Unsupported()
+
+
+def eval_excel_all_rows_vectorized(tree, table: pd.DataFrame) -> pd.Series:
+    """
+    Compute `eval_excel_all_rows()`'s result, column-wise.
+
+    Raise _Unsupported if we can't guarantee the same result.
+    """
+    if not len(table):
+        raise _Unsupported()  # row-wise is instant anyway
+
+    result = _eval_node(tree, table)
+    if result.kind == 'range' or np.any(result.errors):
+        raise _Unsupported()
+
+    values = np.broadcast_to(result.values, (len(table),))
+    if result.kind == 'text':
+        return pd.Series(values, dtype=object)
+    else:
+        return pd.Series(values.copy())
+
+
 def excel_formula(table, formula, all_rows):
     try:
         # 0 is a list of tokens, 1 is the function builder object
-        code = Parser().ast(formula)[1].compile()
+        builder = _TreeParser().ast(formula)[1]
+        code = builder.compile()
     except Exception as e:
         raise ValueError(f"Couldn't parse formula: {str(e)}")
 
     if all_rows:
-        newcol = eval_excel_all_rows(code, table)
+        try:
+            newcol = eval_excel_all_rows_vectorized(builder.tree[-1], table)
+        except _Unsupported:
+            newcol = eval_excel_all_rows(code, table)
         newcol = autocast_series_dtype(sanitize_series(newcol))
     else:
         # the whole column is blank except first row
@@ -5,6 +5,7 @@ import io
 import math
 import multiprocessing
 import os.path
+import pickle
 import sys
 import traceback
 from typing import Any, Dict, Tuple
@@ -16,6 +17,12 @@ from .utils import build_globals_for_eval, PythonFeatureDisabledError
 TIMEOUT = 30.0  # seconds
 
 
+# Fork, always. The child inherits our imported numpy and pandas, and it
+# inherits the input table by copy-on-write -- no pickling. ("spawn" and
+# "forkserver" would re-import modules and pickle the table.)
+_context = multiprocessing.get_context('fork')
+
+
 html_path = os.path.join(os.path.dirname(__file__), 'pythoncode.html')
 
 
@@ -94,7 +101,10 @@ def inner_eval(code, table, sender):
         if error is not None:
             result[1] = error
 
-        return sender.send(tuple(result))
+        # Protocol 4 pickles each numpy block as one buffer (not value by
+        # value). If pickling fails, we exit and the parent reports it.
+        data = pickle.dumps(tuple(result), protocol=pickle.HIGHEST_PROTOCOL)
+        return sender.send_bytes(data)
 
     try:
         compiled_code = compile(code, 'user input', 'exec')
@@ -177,25 +187,34 @@ def safe_eval_process(code, table, timeout=TIMEOUT):
     process with restricted execution (a sandbox). The sandbox forbids key
     Python features (such as opening files).
     """
-    recver, sender = multiprocessing.Pipe(duplex=False)
-    subprocess = multiprocessing.Process(target=inner_eval, name='pythoncode',
-                                         daemon=True,
-                                         args=[code, table, sender])
+    recver, sender = _context.Pipe(duplex=False)
+    subprocess = _context.Process(target=inner_eval, name='pythoncode',
+                                  daemon=True, args=[code, table, sender])
     subprocess.start()
-    # TODO make this async
-    if recver.poll(timeout):
-        result = recver.recv()
-    else:
-        subprocess.terminate()  # in case the timeout was exceeded
+    # Close our copy of the sending end. Now, if the child exits without
+    # sending, `recver` sees EOF right away and we needn't wait for `timeout`.
+    sender.close()
+
+    try:
+        if recver.poll(timeout):
+            result = pickle.loads(recver.recv_bytes())
+        else:
+            result = (
+                pandas.DataFrame(),
+                f'Python subprocess did not respond in {timeout}s',
+                {'output': ''}
+            )
+    except EOFError:
         result = (
-            pandas.DataFrame(), 
-            f'Python subprocess did not respond in {timeout}s',
+            pandas.DataFrame(),
+            'Python subprocess exited without returning a result',
             {'output': ''}
         )
-
-    # we got our result; clean up like an assassin
-    subprocess.terminate()  # TODO subprocess.kill() in Python 3.7
-    subprocess.join()
+    finally:
+        # we got our result; clean up like an assassin
+        subprocess.kill()
+        subprocess.join()
+        recver.close()
 
     return result
 
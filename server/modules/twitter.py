@@ -10,6 +10,7 @@ from oauthlib import oauth1
 from oauthlib.common import urlencode
 import pandas as pd
 import yarl  # expose aiohttp's innards -- ick.
+from cjworkbench.types import RowsToPrepend
 from server import oauth
 
 
@@ -325,27 +326,6 @@ async def get_new_tweets(access_token, querytype, query, old_tweets):
                                            match.group(2), last_id)
 
 
-# Combine this set of tweets with previous set of tweets
-def merge_tweets(old_table, new_table):
-    if old_table is None or old_table.empty:
-        return new_table
-    elif new_table is None or new_table.empty:
-        return old_table
-    else:
-        # The new tweets all go before the old tweets.
-        #
-        # We tend to add columns to our output in successive versions of the
-        # Twitter module. `new_table` has the correct list of columns;
-        # `old_table` may be incomplete. `new_table` has the correct list of
-        # columns; `old_table` may be incomplete.
-        #
-        # sort=False: use the ordering in new_table. (pandas 0.23 corrects the
-        # previous unintuitive behavior in DataFrame.append().)
-        free = settings.TWITTER_MAX_ROWS_PER_TABLE - len(new_table)
-        old_table = old_table.iloc[:free]
-        return new_table.append(old_table, ignore_index=True, sort=False)
-
-
 # Render just returns previously retrieved tweets
 def render(table, params, *, fetch_result):
     if fetch_result is None:
@@ -390,7 +370,11 @@ async def fetch(params, *, get_stored_dataframe):
             old_tweets = await get_stored_tweets(get_stored_dataframe)
             tweets = await get_new_tweets(access_token, querytype, query,
                                           old_tweets)
-            tweets = merge_tweets(old_tweets, tweets)
+            # The new tweets all go before the old tweets. Workbench stores
+            # just the new ones, pointing to the old ones.
+            max_rows = settings.TWITTER_MAX_ROWS_PER_TABLE
+            return RowsToPrepend(tweets.truncate(after=max_rows - 1),
+                                 max_rows=max_rows)
         else:
             tweets = await get_new_tweets(access_token, querytype,
                                           query, None)
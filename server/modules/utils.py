@@ -1,11 +1,13 @@
 import builtins
+from collections import OrderedDict
 from contextlib import contextmanager
 import io
 import json
 import re
 import shutil
+import sys
 import tempfile
-from typing import Any, Dict, Callable, Iterator, Optional
+from typing import Any, Dict, Callable, Iterator, List, Optional, Union
 import aiohttp
 from asgiref.sync import async_to_sync
 from async_generator import asynccontextmanager  # TODO python 3.7 native
@@ -16,7 +18,9 @@ from django.db.models.fields.files import FieldFile
 from django.db import transaction
 import numpy as np
 import pandas as pd
-from pandas.api.types import is_numeric_dtype, is_datetime64_dtype
+from pandas.api.extensions import take
+from pandas.api.types import infer_dtype, is_numeric_dtype, \
+        is_datetime64_dtype
 import xlrd
 import yarl  # aiohttp innards -- yuck!
 from cjworkbench.sync import database_sync_to_async
@@ -189,8 +193,121 @@ def wrap_text(bytesio: io.BytesIO, text_encoding: _TextEncoding):
         yield textio
 
 
+_ParseChunkCells = 2000000
+"""
+Number of cells (rows * columns) `_parse_table()` tokenizes at a time.
+
+Pandas' CSV tokenizer copies every data byte of its input, plus a pointer per
+cell, before converting anything. Reading in chunks bounds that cost: only one
+chunk's tokens are in memory at a time.
+"""
+
+
+_ParseFirstChunkRows = 1000
+"""
+Rows in the first chunk `_parse_table()` reads, before it knows how wide the
+table is.
+"""
+
+
+_LookupEntryBytes = 100
+"""
+Approximate RAM a `_CategoricalColumnBuilder` spends per distinct value, on
+top of the `str` itself: its dict slot, plus its pointer in the categories
+Index that `build()` creates.
+"""
+
+
+class _CategoricalColumnBuilder:
+    """
+    Build one categorical column out of chunks of str categoricals.
+
+    Every chunk's categories are merged into a single dictionary, so each
+    distinct value is stored once no matter how many chunks contain it; each
+    chunk's values become int codes into that dictionary.
+
+    Meanwhile, we infer the column's type: we test whether each value we
+    haven't seen before looks numeric, so every distinct value is parsed as a
+    number at most once.
+
+    `skip()` considers a chunk's values when inferring the type, but does not
+    store them. We use it for rows past `MAX_ROWS_PER_TABLE`: they'd be
+    truncated anyway, but they'd have been autocast before truncation.
+
+    `n_bytes` estimates the RAM we hold: codes plus distinct values.
+    """
+
+    def __init__(self):
+        self._lookup = {}  # category => code
+        self._code_arrays = []
+        self._maybe_numeric = True
+        self._any_nonempty = False
+        self.n_bytes = 0
+
+    def _infer(self, new_categories: List[str]) -> None:
+        if not self._any_nonempty:
+            self._any_nonempty = any(c != '' for c in new_categories)
+        if self._maybe_numeric:
+            try:
+                pd.to_numeric(np.array(new_categories, dtype=object))
+            except (ValueError, TypeError):
+                self._maybe_numeric = False
+
+    def append(self, values: pd.Categorical) -> None:
+        lookup = self._lookup
+        n_before = len(lookup)
+        new_categories = []
+        # chunk code => our code. The extra -1 at the end maps chunk code -1
+        # (null) to our -1.
+        recode = np.empty(len(values.categories) + 1, dtype=np.int32)
+        recode[-1] = -1
+        for i, category in enumerate(values.categories):
+            code = lookup.setdefault(category, len(lookup))
+            if code >= n_before:
+                new_categories.append(category)
+            recode[i] = code
+        self._infer(new_categories)
+        codes = recode[values.codes]
+        self._code_arrays.append(codes)
+        self.n_bytes += codes.nbytes + sum(
+            sys.getsizeof(c) + _LookupEntryBytes for c in new_categories
+        )
+
+    def skip(self, values: pd.Categorical) -> None:
+        self._infer([c for c in values.categories if c not in self._lookup])
+
+    def build(self) -> Union[pd.Categorical, np.ndarray]:
+        """
+        Return a Categorical with sorted categories, or a numeric array.
+
+        This matches `autocast_series_dtype()` on
+        `read_csv(..., dtype='category')` output.
+        """
+        if self._code_arrays:
+            codes = np.concatenate(self._code_arrays)
+        else:
+            codes = np.array([], dtype=np.int32)
+        self._code_arrays = []  # free memory as we go
+        categories = pd.Index(list(self._lookup), dtype=object)
+        self._lookup = {}
+
+        if self._maybe_numeric and self._any_nonempty:
+            numbers = pd.to_numeric(categories.values)
+            if (codes == -1).any():
+                numbers = np.append(numbers, np.nan)
+            return numbers[codes]
+
+        # Sort categories, as read_csv() does
+        order = categories.argsort()
+        new_codes = np.empty(len(order) + 1, dtype=np.int32)
+        new_codes[order] = np.arange(len(order), dtype=np.int32)
+        new_codes[-1] = -1
+        return pd.Categorical.from_codes(new_codes[codes], categories[order])
+
+
 def _parse_table(bytesio: io.BytesIO, sep: Optional[str],
-                 text_encoding: _TextEncoding) -> pd.DataFrame:
+                 text_encoding: _TextEncoding
+                 ) -> Union[pd.DataFrame, ProcessResult]:
     with wrap_text(bytesio, text_encoding) as textio:
         if not sep:
             sep = _detect_separator(textio)
@@ -204,27 +321,72 @@ def _parse_table(bytesio: io.BytesIO, sep: Optional[str],
         # 3. Per-column, convert dtypes to array
         # 4. Smoosh arrays together into a pd.DataFrame.
         #
-        # When `low_memory=True`, all this happens in a bigger loop, so
-        # that the tokenized data structure is smaller.
-        #
-        # `low_memory=True` forces re-coding categories. That's `O(Ch * N
-        # * Ca lg Ca)`, where Ch is number of column-chunks (9,000 * 60
-        # in this case), N is number of records, Ch is number of chunks
-        # (8, in this case), and Ca is the number of categories.
-        #
-        # This `rc11.txt` file has enormous `Ch`: 9,000 * 60 = 540,000.
-        # `general.csv` (our 1.2GB file) is much smaller, at ~4,000, even
-        # though it has 250x more rows. Pandas doesn't let us adjust
-        # chunk size, and its heuristic is terrible for`rc11.txt`.
+        # We used to pass `low_memory=False`, which tokenizes the whole file
+        # at once: an extra ~1GB for our 1.2GB `general.csv`. (Pandas'
+        # `low_memory=True` chunking is no good: its chunk-size heuristic
+        # is terrible for very wide files such as `rc11.txt`, and it
+        # re-codes every chunk's categories.)
         #
-        # Let's try `low_memory=False`. That makes the CPU cost
-        # `O(N * Co * Ca lg Ca)`, where Co is the number of columns. Memory
-        # usage grows by the number of cells. In the case of `general.csv`,
-        # the cost is an extra 1GB.
-        data = pd.read_csv(textio, dtype='category', sep=sep,
-                           na_filter=False, low_memory=False)
+        # Instead, we read chunks of about `_ParseChunkCells` cells and
+        # merge each chunk's categories into one growing dictionary per
+        # column (see `_CategoricalColumnBuilder`). We never hold more than
+        # one chunk's tokens, and we stop keeping rows once we have
+        # `MAX_ROWS_PER_TABLE` rows or once the builders hold more than
+        # `MAX_BYTES_PER_TABLE` bytes (which one chunk may overshoot). Past
+        # that, we only count rows and infer types, just as if we'd parsed
+        # everything and then truncated.
+        reader = pd.read_csv(textio, dtype='category', sep=sep,
+                             na_filter=False, iterator=True)
+        max_rows = settings.MAX_ROWS_PER_TABLE
+        max_bytes = settings.MAX_BYTES_PER_TABLE
+        columns = None
+        builders = None
+        n_rows = 0
+        n_kept = 0
+        n_bytes = 0
+        chunk_size = _ParseFirstChunkRows
+        while True:
+            try:
+                chunk = reader.get_chunk(chunk_size)
+            except StopIteration:
+                break
+
+            if builders is None:
+                columns = chunk.columns
+                builders = [_CategoricalColumnBuilder() for _ in columns]
+                chunk_size = max(1, _ParseChunkCells // max(1, len(columns)))
+
+            if n_bytes > max_bytes:
+                max_rows = n_kept  # keep no more rows
+            n_keep = max(0, min(len(chunk), max_rows - n_rows))
+            for i, builder in enumerate(builders):
+                values = chunk.iloc[:, i].values
+                if n_keep == len(chunk):
+                    builder.append(values)
+                elif n_keep == 0:
+                    builder.skip(values)
+                else:
+                    builder.append(values[:n_keep].remove_unused_categories())
+                    builder.skip(values[n_keep:])
+            n_rows += len(chunk)
+            n_kept += n_keep
+            n_bytes = sum(builder.n_bytes for builder in builders)
+
+        if builders is None:
+            return pd.DataFrame()
+
+        arrays = OrderedDict()
+        for i, column in enumerate(columns):
+            arrays[column] = builders[i].build()
+            builders[i] = None  # free its dictionary
+        data = pd.DataFrame(arrays, columns=columns)
         data.reset_index(drop=True, inplace=True)  # empty => RangeIndex
-        autocast_dtypes_in_place(data)
+
+        if n_rows > max_rows:
+            # Same warning as ProcessResult.truncate_in_place_if_too_big()
+            return ProcessResult(data, error=(
+                'Truncated output from %d rows to %d' % (n_rows, len(data))
+            ))
         return data
 
 
@@ -598,41 +760,57 @@ def autocast_series_dtype(series: pd.Series) -> pd.Series:
 
     If the series is all-null, do nothing.
 
-    Avoid spurious calls to this function: it's expensive.
+    Avoid spurious calls to this function: it's expensive. (Categorical series
+    are cheaper: we parse each category once, not each row.)
 
     TODO handle dates and maybe booleans.
     """
     if series.dtype == object:
-        nulls = series.isnull()
-        if (nulls | (series == '')).all():
-            return series
         try:
             # If it all looks like numbers (like in a CSV), cast to number.
-            return pd.to_numeric(series)
+            #
+            # With text, to_numeric() raises at the first non-number, so text
+            # columns cost next to nothing here.
+            numbers = pd.to_numeric(series)
         except (ValueError, TypeError):
             # Otherwise, we want all-string. Is that what we already have?
+            # infer_dtype() scans in C and stops at the first non-str.
             #
             # TODO assert that we already have all-string, and nix this
             # spurious conversion.
-            array = series[~nulls].array
-            if any(type(x) != str for x in array):
+            if infer_dtype(series, skipna=True) != 'string':
+                nulls = series.isnull()
                 series = series.astype(str)
                 series[nulls] = None
             return series
+
+        if numbers.isnull().all() and (series.isnull() | (series == '')).all():
+            # All-null or all-empty is text, not number
+            return series
+        return numbers
     elif hasattr(series, 'cat'):
-        # Categorical series. Try to infer type of series.
+        # Categorical series. Try to infer type of series from the categories
+        # it uses, then map each row's code to its category's number.
         #
         # Assume categories are all str: after all, we're assuming the input is
         # "sane" and "sane" means only str categories are valid.
-        if (series.isnull() | (series == '')).all():
+        #
+        # factorize() hashes int codes, not str values; its `uniques` are the
+        # categories in use. Null rows get code -1.
+        codes, uniques = pd.factorize(series)
+        uniques = np.asarray(uniques)
+        if (uniques == '').all():
             return series
         try:
-            return pd.to_numeric(series)
+            numbers = pd.to_numeric(uniques)
         except (ValueError, TypeError):
             # We don't cast categories to str here -- because we have no
             # callers that would create categories that aren't all-str. If we
             # ever do, this is where we should do the casting.
             return series
+        return pd.Series(take(numbers, codes, allow_fill=True,
+                              fill_value=np.nan),
+                         index=series.index, name=series.name)
     else:
         assert is_numeric_dtype(series) or is_datetime64_dtype(series)
         return series
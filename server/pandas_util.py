@@ -1,4 +1,7 @@
+import hashlib
+import pandas as pd
 from pandas import DataFrame
+from pandas.api.types import infer_dtype, is_categorical_dtype
 from pandas.util import hash_pandas_object
 
 
@@ -7,3 +10,52 @@ def hash_table(table: DataFrame) -> str:
     h = hash_pandas_object(table).sum()  # xor would be nice, but whatevs
     h = h if h > 0 else -h               # stay positive (sum often overflows)
     return str(h)
+
+
+def hash_table_contents(table: DataFrame) -> str:
+    """
+    Build a 32-character hex digest of column names, dtypes, values and order.
+
+    Unlike `hash_table()` (which sums row hashes), this changes when rows are
+    reordered, so it can identify a table's contents. Categorical columns'
+    categories (and their order, and whether they're ordered) count, too.
+    """
+    md5 = hashlib.md5()
+    for name, dtype in table.dtypes.items():
+        md5.update(repr((str(name), str(dtype))).encode('utf-8'))
+        if is_categorical_dtype(dtype):
+            md5.update(repr((len(dtype.categories), dtype.ordered))
+                       .encode('utf-8'))
+            md5.update(hash_pandas_object(dtype.categories).values.tobytes())
+    md5.update(hash_pandas_object(table, index=True).values.tobytes())
+    return md5.hexdigest()
+
+
+def share_repeated_strings(table: DataFrame) -> None:
+    """
+    Make equal strings in each text column the same Python object, in place.
+
+    Readers that decode strings one cell at a time (e.g., fastparquet reading
+    a PLAIN-encoded text column) allocate one `str` per cell: ~50 bytes of
+    overhead plus the text. A column of 1M copies of "New York" costs ~57MB.
+    Afterwards, it costs one pointer per cell (8MB) plus one `str`.
+
+    Only `object` columns whose values are all `str` (or null) change. Dtypes,
+    values and null objects (`None` stays `None`) don't change, so modules
+    can't tell the difference. (Other `object` columns are left alone:
+    factorize() would merge hash-equal values such as `1` and `True`.)
+    """
+    for column in table.columns:
+        values = table[column].values
+        if values.dtype != object:
+            continue
+        if infer_dtype(values, skipna=True) != 'string':
+            continue
+        codes, uniques = pd.factorize(values)
+        if len(uniques) == 0 or len(uniques) == len(values):
+            continue  # nothing repeats (or everything is null)
+        shared = uniques.take(codes)
+        nulls = codes == -1
+        if nulls.any():
+            shared[nulls] = values[nulls]  # take() wrapped these around
+        table[column] = shared
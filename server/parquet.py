@@ -1,15 +1,18 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+import errno
 import functools
 import io
-from pathlib import Path
-import tempfile
+import struct
 from urllib3.exceptions import ProtocolError
 import fastparquet
-from typing import Any, Callable
+from typing import Any, Callable, Iterator, List, Optional
 from fastparquet import ParquetFile
 import pandas
 import snappy
 import warnings
 from server import minio
+from server.pandas_util import share_repeated_strings
 
 
 # Workaround for https://github.com/dask/fastparquet/issues/394
@@ -18,7 +21,41 @@ warnings.filterwarnings("ignore", category=FutureWarning,
                         module='fastparquet.util', lineno=221)
 
 
-def _minio_open_random(bucket, key):
+RowGroupSize = 10000
+"""
+Number of rows per Parquet row group, when writing.
+
+Readers that only want a few rows (e.g., the table viewer) decode only the row
+groups that hold those rows. Smaller row groups mean less decoding per request;
+larger row groups mean better compression and a smaller footer.
+"""
+
+
+MaxFooterSize = 64 * 1024
+"""
+Largest footer `write()` will return for storing in the database.
+
+The footer grows with (number of columns) * (number of row groups). Huge
+footers would bloat every query that loads a WfModule, so we don't return
+them; readers of those files will discover the footer from S3 instead.
+"""
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    """
+    Facts about a Parquet file on S3 that let us read it without discovery.
+
+    `footer` is the file's last bytes: the serialized FileMetaData (schema,
+    row groups, and each column chunk's byte offsets), then its length, then
+    b'PAR1'. It may be `None` if it's too large to store.
+    """
+
+    size: int
+    footer: Optional[bytes] = None
+
+
+def _minio_open_random(bucket, key, file_info: Optional[FileInfo] = None):
     if key.endswith('/_metadata'):
         # fastparquet insists upon trying for the 'hive' storage schema before
         # settling on the 'simple' storage schema. At no time have we ever
@@ -26,12 +63,19 @@ def _minio_open_random(bucket, key):
         # files; therefore we can skip hitting minio here.
         raise FileNotFoundError
 
-    # TODO store column metadata in the database, so we don't need to read it
-    # from S3. Then consider minio.FullReadMinioFile, which could be faster.
-    # (We'll want to benchmark.) Another option is to use the 'hive' format and
+    # If we stored the footer in the database, fastparquet reads the header
+    # from RAM and each column chunk is an exact ranged GET. Otherwise, we
+    # start with a request that discovers the file size and footer.
+    #
+    # TODO consider minio.FullReadMinioFile, which could be faster. (We'll
+    # want to benchmark.) Another option is to use the 'hive' format and
     # FullReadMinioFile; but that choice would be hard to un-choose, so let's
     # not rush into it.
-    raw = minio.RandomReadMinioFile(bucket, key)
+    if file_info is not None and file_info.footer is not None:
+        raw = minio.RandomReadMinioFile(bucket, key, size=file_info.size,
+                                        tail=file_info.footer)
+    else:
+        raw = minio.RandomReadMinioFile(bucket, key)
 
     # fastparquet actually expects a _buffered_ reader -- it expects `read()`
     # to always return a buffer of the same length it requests.
@@ -43,6 +87,8 @@ def _minio_open_random(bucket, key):
 def _minio_open_full(bucket, key):
     """
     Optimized open call, for when we know we'll read the entire file.
+
+    The file is downloaded in one request, into memory.
     """
     if key.endswith('/_metadata'):
         # fastparquet insists upon trying for the 'hive' storage schema before
@@ -52,8 +98,8 @@ def _minio_open_full(bucket, key):
         raise FileNotFoundError
 
     # Don't worry about needing a _buffered_ reader here (like we worry in
-    # _minio_open_random). FullReadMinioFile actually does a regular open() on
-    # a regular file -- so it will behave exactly as fastparquet expects.
+    # _minio_open_random). FullReadMinioFile reads from an io.BytesIO, which
+    # always returns as many bytes as fastparquet requests.
     return minio.FullReadMinioFile(bucket, key)
 
 
@@ -103,25 +149,117 @@ def read_header(bucket: str, key: str,
 
 
 def read(bucket: str, key: str, to_pandas_args=[],
-         to_pandas_kwargs={}) -> pandas.DataFrame:
+         to_pandas_kwargs={},
+         file_info: Optional[FileInfo] = None) -> pandas.DataFrame:
     """
     Load a Pandas DataFrame from disk or raise FileNotFoundError or
     FastparquetCouldNotHandleFile.
 
+    Repeated text values in the result share memory (see
+    `share_repeated_strings()`), so text-heavy tables don't cost many times
+    their on-disk size. Categorical columns stay categorical: fastparquet
+    writes and reads them dictionary-encoded.
+
     May raise OSError (e.g., FileNotFoundError) or
     FastparquetCouldNotHandleFile. The latter comes from
     https://github.com/dask/fastparquet/issues/375 -- we used to write with
     pyarrow, and fastparquet fails on some files with large strings. Those
     files are so old we won't attempt to support them.
+
+    Pass `file_info` (from `write()`) to skip the footer-discovery request
+    when reading only some of the file. (A full read is a single request that
+    includes the footer, so it doesn't need `file_info`.)
     """
     if to_pandas_args or to_pandas_kwargs:
-        open_with = _minio_open_random
+        open_with = functools.partial(_minio_open_random, file_info=file_info)
     else:
         open_with = _minio_open_full
 
-    try:
+    with _translate_fastparquet_errors():
+        pf = read_header(bucket, key, open_with=open_with)
+        dataframe = pf.to_pandas(*to_pandas_args, **to_pandas_kwargs)
+
+    share_repeated_strings(dataframe)
+    return dataframe
+
+
+def read_slice(bucket: str, key: str, columns: Optional[List[str]],
+               start_row: int, end_row: int,
+               file_info: Optional[FileInfo] = None) -> pandas.DataFrame:
+    """
+    Load rows `[start_row, end_row)` of `columns` as a Pandas DataFrame.
+
+    Only the footer and the row groups that overlap the requested rows are
+    fetched and decoded. (The footer tells us each row group's row count and
+    byte offsets; `RandomReadMinioFile` only fetches the blocks fastparquet
+    seeks to.)
+
+    The returned DataFrame has a fresh RangeIndex. If a categorical column's
+    categories differ between row groups, the column will be `object` dtype.
+
+    Pass `file_info` (from `write()`) to skip the footer-discovery request.
+
+    Raise the same errors as `read()`.
+    """
+    open_with = functools.partial(_minio_open_random, file_info=file_info)
+    with _translate_fastparquet_errors():
         pf = read_header(bucket, key, open_with=open_with)
-        return pf.to_pandas(*to_pandas_args, **to_pandas_kwargs)
+        if columns is None:
+            columns = pf.columns
+
+        dataframes = []
+        rg_end = 0
+        # Open once: with a file-like input, fastparquet's per-row-group
+        # read_row_group_file() would close our file after the first one.
+        with pf.open(pf.fn, 'rb') as f:
+            for rg in pf.row_groups:
+                rg_start = rg_end
+                rg_end += rg.num_rows
+                if rg_end <= start_row:
+                    continue
+                if rg_start >= end_row:
+                    break
+                dataframe = pf.read_row_group(rg, columns, None, infile=f)
+                dataframes.append(dataframe.iloc[
+                    max(0, start_row - rg_start):end_row - rg_start
+                ])
+
+        if not dataframes:
+            # Empty selection: allocate a zero-row table with the right dtypes
+            dataframe, _ = pf.pre_allocate(0, columns, None, None)
+            return dataframe
+
+    return pandas.concat(dataframes, ignore_index=True)
+
+
+def iter_row_groups(bucket: str, key: str,
+                    file_info: Optional[FileInfo] = None
+                    ) -> Iterator[pandas.DataFrame]:
+    """
+    Yield the file's contents as Pandas DataFrames, one per row group.
+
+    Only one row group is in memory at a time (plus the footer and a few S3
+    blocks), so callers can stream huge tables.
+
+    Pass `file_info` (from `write()`) to skip the footer-discovery request.
+
+    Raise the same errors as `read()` -- possibly after yielding some row
+    groups.
+    """
+    open_with = functools.partial(_minio_open_random, file_info=file_info)
+    with _translate_fastparquet_errors():
+        pf = read_header(bucket, key, open_with=open_with)
+        # iter_row_groups() opens the file once for all row groups
+        yield from pf.iter_row_groups()
+
+
+@contextmanager
+def _translate_fastparquet_errors():
+    """
+    Convert fastparquet bugs into FastparquetCouldNotHandleFile.
+    """
+    try:
+        yield
     except snappy.UncompressError as err:
         if str(err) == 'Error while decompressing: invalid input':
             # Assume Fastparquet is reporting the wrong bug.
@@ -134,19 +272,63 @@ def read(bucket: str, key: str, to_pandas_args=[],
         raise FastparquetIssue375
 
 
-def write(bucket: str, key: str, table: pandas.DataFrame) -> int:
+def _footer_from_tail(tail: bytes) -> Optional[bytes]:
+    """
+    Find the FileMetaData, its length and the b'PAR1' magic at the end of a
+    file, given its last bytes.
+
+    Return `None` if `tail` is too short to hold the footer.
+    """
+    footer_length = struct.unpack('<i', tail[-8:-4])[0]
+    if footer_length + 8 > len(tail):
+        return None
+    return tail[-(footer_length + 8):]
+
+
+def read_file_info(bucket: str, key: str) -> FileInfo:
+    """
+    Find an existing file's size and footer, in one request.
+
+    Raise FileNotFoundError if the file does not exist.
+    """
+    try:
+        response = minio.get_object_with_data(bucket, key,
+                                              Range=f'bytes=-{MaxFooterSize}')
+    except minio.error.NoSuchKey:
+        raise FileNotFoundError(errno.ENOENT, f'No file at {bucket}/{key}')
+    tail = response['Body']
+    if 'ContentRange' in response:
+        size = int(response['ContentRange'].split('/')[1])
+    else:
+        size = len(tail)  # the file is shorter than the range
+    return FileInfo(size, _footer_from_tail(tail))
+
+
+def write(bucket: str, key: str, table: pandas.DataFrame) -> FileInfo:
     """
     Write a Pandas DataFrame to a minio file, overwriting if needed.
 
-    Return number of bytes written.
+    Return a FileInfo: number of bytes written, plus the footer (unless it's
+    larger than `MaxFooterSize`). Callers may store it in the database and pass
+    it to `read()` and `read_slice()` later.
 
     We aim to keep the file format "stable": all future versions of
     parquet.read() should support all files written by today's version of this
     function.
+
+    The file is split into row groups of `RowGroupSize` rows, so `read_slice()`
+    can skip the rows it does not need.
+
+    Nothing touches local disk: fastparquet encodes into a
+    `minio.MultipartUploadMinioFile`, which uploads parts while fastparquet
+    encodes the next row groups.
     """
-    with tempfile.NamedTemporaryFile() as tf:
-        fastparquet.write(tf.name, table, compression='SNAPPY',
-                          object_encoding='utf8')
-        minio.fput_file(bucket, key, Path(tf.name))
-        tf.seek(0, io.SEEK_END)
-        return tf.tell()
+    with minio.MultipartUploadMinioFile(bucket, key,
+                                        tail_size=MaxFooterSize) as f:
+        # fastparquet closes `f` when it's done, completing the upload (or, if
+        # it raises, aborting it)
+        fastparquet.write(key, table, compression='SNAPPY',
+                          object_encoding='utf8',
+                          row_group_offsets=RowGroupSize,
+                          open_with=lambda path, mode: f)
+    return FileInfo(f.tell(), _footer_from_tail(f.tail))
@@ -20,14 +20,18 @@ async def get_connection():
     return ret
 
 
-async def queue_render(workflow_id: int, delta_id: int):
+async def queue_render(workflow_id: int, delta_id: int,
+                       background: bool = False):
     """
     Queue render in RabbitMQ.
 
     Spurious renders are fine: these messages are tiny.
+
+    Pass `background=True` if nobody is waiting to see the render: workers
+    render other requests first.
     """
     connection = await get_connection()
-    await connection.queue_render(workflow_id, delta_id)
+    await connection.queue_render(workflow_id, delta_id, background)
 
 
 async def queue_fetch(wf_module):
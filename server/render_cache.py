@@ -0,0 +1,151 @@
+from collections import OrderedDict
+import logging
+import threading
+from typing import Optional, Tuple
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+CacheKey = Tuple[int, int, int]  # (workflow_id, wf_module_id, delta_id)
+
+
+def _dataframe_size(dataframe: pd.DataFrame) -> int:
+    """
+    Estimate how many bytes of RAM `dataframe` occupies.
+
+    `deep=True` costs a scan of each object column -- but that's far cheaper
+    than the S3 request plus Parquet decode we're trying to avoid.
+    """
+    return int(dataframe.memory_usage(index=True, deep=True).sum())
+
+
+class RenderResultCache:
+    """
+    In-process, byte-bounded LRU cache of cached-render-result DataFrames.
+
+    Keys are `(workflow_id, wf_module_id, delta_id)`. Those three numbers
+    identify a Parquet file in `minio.CachedRenderResultsBucket` -- and that
+    file never changes once it's written -- so a cache hit is always correct.
+
+    The worker writes a render result and then, a few milliseconds later,
+    reads it back as another tab's input (or as the input of the next render
+    of this tab). This cache lets us skip that S3 round-trip and decode.
+
+    Modules may modify their input DataFrames in place, so we never hand out
+    a DataFrame we're storing: `put()` and `get()` both copy. Copying an
+    object column copies pointers, not strings, so it's cheap.
+
+    When `max_bytes == 0` (the default), the cache is disabled. Web servers
+    don't use it; workers enable it in `worker.main`.
+
+    All methods are thread-safe: renders happen on executor threads.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+        self._entries = OrderedDict()  # key => (dataframe, n_bytes)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: CacheKey) -> Optional[pd.DataFrame]:
+        """
+        Return a copy of the cached DataFrame, or `None` on cache miss.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            try:
+                dataframe, _ = self._entries[key]
+            except KeyError:
+                self.n_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.n_hits += 1
+
+        return dataframe.copy()
+
+    def put(self, key: CacheKey, dataframe: pd.DataFrame) -> None:
+        """
+        Store a copy of `dataframe`, evicting least-recently-used entries.
+
+        If `dataframe` alone is larger than `max_bytes`, don't store it.
+        """
+        if not self.enabled:
+            return
+
+        size = _dataframe_size(dataframe)
+        if size > self.max_bytes:
+            self.discard(key)
+            return
+
+        dataframe = dataframe.copy()
+
+        with self._lock:
+            self._remove_entry(key)
+            self._entries[key] = (dataframe, size)
+            self.n_bytes += size
+            while self.n_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.n_bytes -= evicted_size
+                self.n_evictions += 1
+
+    def discard(self, key: CacheKey) -> None:
+        """Remove `key` from the cache, if it's there."""
+        with self._lock:
+            self._remove_entry(key)
+
+    def discard_wf_module(self, workflow_id: int, wf_module_id: int) -> None:
+        """
+        Remove every delta of the given WfModule from the cache.
+
+        Call this when deleting the WfModule's Parquet files.
+        """
+        with self._lock:
+            keys = [k for k in self._entries
+                    if k[0] == workflow_id and k[1] == wf_module_id]
+            for key in keys:
+                self._remove_entry(key)
+
+    def clear(self) -> None:
+        """Remove all entries. Counters are not reset."""
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        """
+        Return a dict of counters, for logging.
+        """
+        with self._lock:
+            return {
+                'n_entries': len(self._entries),
+                'n_bytes': self.n_bytes,
+                'max_bytes': self.max_bytes,
+                'n_hits': self.n_hits,
+                'n_misses': self.n_misses,
+                'n_evictions': self.n_evictions,
+            }
+
+    def _remove_entry(self, key: CacheKey) -> None:
+        # assumes self._lock is held
+        try:
+            _, size = self._entries.pop(key)
+        except KeyError:
+            return
+        self.n_bytes -= size
+
+
+render_cache = RenderResultCache()
+"""
+The process-wide cache. Disabled until someone sets `max_bytes`.
+"""
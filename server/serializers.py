@@ -96,6 +96,10 @@ class TabSerializer(serializers.ModelSerializer):
     wf_module_ids = serializers.SerializerMethodField()
 
     def get_wf_module_ids(self, obj):
+        if 'wf_modules' in self.context:
+            # The caller loaded the workflow's WfModules already: don't query
+            return [wfm.id for wfm in self.context['wf_modules']
+                    if wfm.tab_id == obj.id]
         return list(obj.live_wf_modules.values_list('id', flat=True))
 
     class Meta:
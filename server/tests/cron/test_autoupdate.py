@@ -19,6 +19,10 @@ class SuccessfulRenderLock:
     def render_lock(cls, workflow_id: int):
         return cls(workflow_id)
 
+    @classmethod
+    async def find_locked_workflow_ids(cls, workflow_ids):
+        return frozenset()
+
     async def __aenter__(self):
         pass
 
@@ -26,6 +30,12 @@ class SuccessfulRenderLock:
         pass
 
 
+class FailedRenderLock(SuccessfulRenderLock):
+    @classmethod
+    async def find_locked_workflow_ids(cls, workflow_ids):
+        return frozenset(workflow_ids)
+
+
 class UpdatesTests(DbTestCase):
     @patch('server.rabbitmq.queue_fetch')
     @patch('server.websockets.ws_client_send_delta_async',
@@ -77,3 +87,23 @@ class UpdatesTests(DbTestCase):
         )
 
         self.assertEqual(mock_queue_fetch.call_count, 1)
+
+    @patch('server.rabbitmq.queue_fetch')
+    @patch('django.utils.timezone.now',
+           lambda: parser.parse('Aug 28 1999 2:35PM UTC'))
+    def test_queue_fetches_skips_locked_workflows(self, mock_queue_fetch):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wfm = tab.wf_modules.create(
+            order=0,
+            auto_update_data=True,
+            last_update_check=parser.parse('Aug 28 1999 2:24PM UTC'),
+            next_update=parser.parse('Aug 28 1999 2:34PM UTC'),
+            update_interval=600
+        )
+
+        self.run_with_async_db(autoupdate.queue_fetches(FailedRenderLock))
+
+        mock_queue_fetch.assert_not_called()
+        wfm.refresh_from_db()
+        self.assertFalse(wfm.is_busy)
@@ -60,9 +60,15 @@ class ChangeDataVersionCommandTests(DbTestCase):
         self.assertEqual(self.wf_module.last_relevant_delta_id, v2)
         self.assertEqual(self.wf_module.stored_data_version, date1)
 
+    @patch('server.websockets.queue_render_if_listening')
     @patch('server.rabbitmq.queue_render')
-    def test_change_version_queue_render_if_notifying(self, queue_render):
+    def test_change_version_queue_render_if_notifying(
+        self,
+        queue_render,
+        queue_render_if_listening
+    ):
         queue_render.return_value = future_none
+        queue_render_if_listening.return_value = future_none
 
         df1 = pd.DataFrame({'A': [1]})
         df2 = pd.DataFrame({'B': [2]})
@@ -79,7 +85,10 @@ class ChangeDataVersionCommandTests(DbTestCase):
             new_version=date2
         ))
 
-        queue_render.assert_called_with(self.wf_module.workflow_id, delta.id)
+        queue_render.assert_called_with(self.wf_module.workflow_id, delta.id,
+                                        background=True)
+        # That render is for watchers, too: don't render twice
+        queue_render_if_listening.assert_not_called()
 
     @patch('server.websockets.queue_render_if_listening', async_noop)
     @patch('server.rabbitmq.queue_render', async_noop)
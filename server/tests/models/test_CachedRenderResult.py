@@ -2,7 +2,7 @@ import datetime
 import pandas
 from cjworkbench.types import Column, ColumnType, ProcessResult, QuickFix
 from server import minio
-from server.models import Workflow, WfModule
+from server.models import CachedRenderResult, Workflow, WfModule
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase
 
@@ -36,13 +36,8 @@ class CachedRenderResultTests(DbTestCase):
         self.assertEqual(cached.delta_id, self.delta.id)
         self.assertEqual(cached.result, result)
 
-        self.assertEqual(
-            cached.parquet_key,
-            (
-                f'wf-{self.workflow.id}/wfm-{self.wf_module.id}'
-                f'/delta-{self.delta.id}.dat'
-            )
-        )
+        self.assertTrue(cached.parquet_key.startswith('blobs/'))
+        self.assertEqual(cached.parquet_key, cached.blob_key)
 
         db_wf_module = WfModule.objects.get(id=self.wf_module.id)
         from_db = db_wf_module.cached_render_result
@@ -50,6 +45,20 @@ class CachedRenderResultTests(DbTestCase):
         self.assertEqual(cached.delta_id, self.delta.id)
         self.assertEqual(from_db.result, result)
 
+    def test_read_columns_with_footer_from_db(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1], 'b': ['x']}))
+        self.wf_module.cache_render_result(self.delta.id, result)
+
+        db_wf_module = WfModule.objects.get(id=self.wf_module.id)
+        from_db = db_wf_module.cached_render_result
+        self.assertIsNotNone(from_db.file_info.footer)
+        self.assertEqual(
+            from_db.file_info.size,
+            minio.stat(minio.CachedRenderResultsBucket,
+                       from_db.parquet_key).size
+        )
+        self.assertEqual(list(from_db.read_dataframe(['b'])['b']), ['x'])
+
     def test_set_to_empty(self):
         result = ProcessResult(pandas.DataFrame({'a': [1]}))
         self.wf_module.cache_render_result(self.delta.id, result)
@@ -62,6 +71,8 @@ class CachedRenderResultTests(DbTestCase):
         db_wf_module.refresh_from_db()
         self.assertIsNone(db_wf_module.cached_render_result)
 
+        # The blob is garbage now. Garbage collection deletes it.
+        CachedRenderResult.delete_unreferenced_blobs(datetime.timedelta(0))
         self.assertFalse(minio.exists(minio.CachedRenderResultsBucket,
                                       parquet_key))
 
@@ -132,6 +143,7 @@ class CachedRenderResultTests(DbTestCase):
 
         parquet_key = self.wf_module.cached_render_result.parquet_key
         self.wf_module.delete()
+        CachedRenderResult.delete_unreferenced_blobs(datetime.timedelta(0))
         self.assertFalse(minio.exists(minio.CachedRenderResultsBucket,
                                       parquet_key))
         # Note: we _don't_ test soft-delete. Soft-deleted modules aren't
@@ -176,3 +188,86 @@ class CachedRenderResultTests(DbTestCase):
 
         dup_cached_result = dup.cached_render_result
         self.assertIsNone(dup_cached_result)
+
+    def test_duplicate_shares_blob(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        self.wf_module.cache_render_result(self.delta.id, result)
+
+        workflow2 = Workflow.objects.create()
+        tab2 = workflow2.tabs.create(position=0)
+        InitWorkflowCommand.create(workflow2)
+        dup = self.wf_module.duplicate(tab2)
+
+        self.assertEqual(dup.cached_render_result.parquet_key,
+                         self.wf_module.cached_render_result.parquet_key)
+
+    def test_identical_tables_share_blob(self):
+        wf_module2 = self.tab.wf_modules.create(
+            order=1,
+            last_relevant_delta_id=self.delta.id
+        )
+        self.wf_module.cache_render_result(
+            self.delta.id,
+            ProcessResult(pandas.DataFrame({'a': [1]}))
+        )
+        wf_module2.cache_render_result(
+            self.delta.id,
+            ProcessResult(pandas.DataFrame({'a': [1]}))
+        )
+        key = self.wf_module.cached_render_result.parquet_key
+        self.assertEqual(wf_module2.cached_render_result.parquet_key, key)
+        # The second write read the footer from the existing blob
+        self.assertIsNotNone(wf_module2.cached_render_result.file_info.footer)
+        self.assertEqual(wf_module2.cached_render_result.file_info,
+                         self.wf_module.cached_render_result.file_info)
+
+        # Deleting one reference doesn't delete the blob
+        self.wf_module.delete()
+        CachedRenderResult.delete_unreferenced_blobs(datetime.timedelta(0))
+        self.assertTrue(minio.exists(minio.CachedRenderResultsBucket, key))
+
+    def test_write_parquet_reuploads_deleted_blob(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        key, _ = CachedRenderResult.write_parquet(self.workflow.id,
+                                                  self.wf_module.id,
+                                                  self.delta.id, result)
+        # delete_unreferenced_blobs() may delete it right before we touch it
+        minio.remove(minio.CachedRenderResultsBucket, key)
+
+        key2, file_info = CachedRenderResult.write_parquet(self.workflow.id,
+                                                           self.wf_module.id,
+                                                           self.delta.id,
+                                                           result)
+        self.assertEqual(key2, key)
+        self.assertEqual(
+            minio.stat(minio.CachedRenderResultsBucket, key).size,
+            file_info.size
+        )
+
+    def test_assign_reuploads_blob_deleted_after_write_parquet(self):
+        result = ProcessResult(pandas.DataFrame({'a': [1]}))
+        blob = CachedRenderResult.write_parquet(self.workflow.id,
+                                                self.wf_module.id,
+                                                self.delta.id, result)
+        # delete_unreferenced_blobs() may delete it after we touch it but
+        # before we reference it
+        minio.remove(minio.CachedRenderResultsBucket, blob[0])
+
+        self.wf_module.cache_render_result(self.delta.id, result, blob)
+
+        self.assertTrue(minio.exists(minio.CachedRenderResultsBucket,
+                                     blob[0]))
+        self.wf_module.refresh_from_db()
+        self.assertEqual(self.wf_module.cached_render_result.result, result)
+
+    def test_garbage_collection_grace_period(self):
+        self.wf_module.cache_render_result(
+            self.delta.id,
+            ProcessResult(pandas.DataFrame({'a': [1]}))
+        )
+        key = self.wf_module.cached_render_result.parquet_key
+        self.wf_module.clear_cached_render_result()
+
+        # A fresh blob may be about to be referenced: keep it
+        self.assertEqual(CachedRenderResult.delete_unreferenced_blobs(), 0)
+        self.assertTrue(minio.exists(minio.CachedRenderResultsBucket, key))
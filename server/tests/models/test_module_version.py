@@ -134,3 +134,43 @@ class ModuleVersionTest(DbTestCase):
         }, source_version_hash='a')
 
         self.assertEqual(mv1.id, mv2.id)
+
+    def test_compiled_schema_shared(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'x', 'type': 'string'}]
+        }, source_version_hash='a')
+        mv2 = ModuleVersion.objects.get(id=mv.id)
+        self.assertIs(mv2.param_schema, mv.param_schema)
+
+    def test_compiled_schema_overwrite_version(self):
+        mv1 = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'x', 'type': 'string'}]
+        }, source_version_hash='a')
+        mv1.param_schema  # cache it
+        mv2 = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean', 'parameters': []
+        }, source_version_hash='a')
+        self.assertEqual(repr(mv2.param_schema), repr(ParamDType.Dict({})))
+
+    def test_compiled_schema_facts(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [
+                {'id_name': 'tabs', 'type': 'multitab'},
+                {'id_name': 'foo', 'type': 'string'},
+            ]
+        }, source_version_hash='a')
+        self.assertTrue(mv.compiled_schema.has_tab_params)
+        self.assertFalse(mv.compiled_schema.has_column_params)
+
+    def test_compiled_schema_nested_column_params(self):
+        mv = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [
+                {'id_name': 'y_columns', 'type': 'multichartseries'},
+            ]
+        }, source_version_hash='a')
+        self.assertTrue(mv.compiled_schema.has_column_params)
+        self.assertFalse(mv.compiled_schema.has_tab_params)
@@ -1,8 +1,13 @@
 from datetime import datetime
+import importlib
 import io
 import json
 from pathlib import Path
+import threading
+import time
+from unittest.mock import patch
 from django.conf import settings
+from django.db import connection, transaction
 import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
@@ -11,6 +16,10 @@ from server.models import StoredObject, Workflow
 from server.tests.utils import DbTestCase
 
 
+# `server.models.StoredObject` is the class; we want the module
+storedobject_module = importlib.import_module('server.models.StoredObject')
+
+
 class StoredObjectTests(DbTestCase):
     def setUp(self):
         super().setUp()
@@ -91,6 +100,80 @@ class StoredObjectTests(DbTestCase):
         table3 = so3.get_table()
         assert_frame_equal(table3, df2)
 
+    def test_create_prepended_table(self):
+        so1 = StoredObject.create_table(self.wfm1, pd.DataFrame({'A': [1, 2]}))
+        so2 = StoredObject.create_prepended_table(
+            self.wfm1,
+            so1,
+            pd.DataFrame({'A': [3], 'B': ['x']})
+        )
+        self.assertEqual(so2.parent, so1)
+        self.assertEqual(so2.chain_length, 2)
+        assert_frame_equal(so2.get_table(), pd.DataFrame({
+            'A': [3, 1, 2],
+            'B': ['x', np.nan, np.nan],
+        }))
+        # the old version is unchanged
+        assert_frame_equal(so1.get_table(), pd.DataFrame({'A': [1, 2]}))
+
+    def test_create_prepended_table_max_rows(self):
+        so1 = StoredObject.create_table(self.wfm1,
+                                        pd.DataFrame({'A': [1, 2, 3]}))
+        so2 = StoredObject.create_prepended_table(self.wfm1, so1,
+                                                  pd.DataFrame({'A': [4]}),
+                                                  max_rows=2)
+        assert_frame_equal(so2.get_table(), pd.DataFrame({'A': [4, 1]}))
+
+        so3 = StoredObject.create_prepended_table(self.wfm1, so2,
+                                                  pd.DataFrame({'A': [5, 6]}),
+                                                  max_rows=2)
+        # so3's own rows are enough: don't read the older segments
+        minio.remove(so1.bucket, so1.key)
+        minio.remove(so2.bucket, so2.key)
+        assert_frame_equal(so3.get_table(), pd.DataFrame({'A': [5, 6]}))
+
+    def test_create_prepended_table_empty_is_no_version(self):
+        so1 = StoredObject.create_table(self.wfm1, pd.DataFrame({'A': [1]}))
+        self.assertIsNone(StoredObject.create_prepended_table(
+            self.wfm1,
+            so1,
+            pd.DataFrame({'A': []})
+        ))
+
+    @patch.object(storedobject_module, 'MaxChainLength', 2)
+    def test_create_prepended_table_compacts_long_chain(self):
+        so1 = StoredObject.create_table(self.wfm1, pd.DataFrame({'A': [1]}))
+        so2 = StoredObject.create_prepended_table(self.wfm1, so1,
+                                                  pd.DataFrame({'A': [2]}))
+        so3 = StoredObject.create_prepended_table(self.wfm1, so2,
+                                                  pd.DataFrame({'A': [3]}),
+                                                  max_rows=2)
+        self.assertIsNone(so3.parent)
+        self.assertEqual(so3.chain_length, 1)
+        assert_frame_equal(so3.get_table(), pd.DataFrame({'A': [3, 2]}))
+
+    def test_create_table_if_different_from_prepended_table(self):
+        so1 = StoredObject.create_table(self.wfm1, pd.DataFrame({'A': [1]}))
+        so2 = StoredObject.create_prepended_table(self.wfm1, so1,
+                                                  pd.DataFrame({'A': [2]}))
+        # same as so2's own rows, but not the same as its table
+        so3 = StoredObject.create_table_if_different(self.wfm1, so2,
+                                                     pd.DataFrame({'A': [2]}))
+        self.assertIsNotNone(so3)
+
+    def test_duplicate_prepended_table(self):
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, pd.DataFrame({'A': [1]}))
+        so2 = StoredObject.create_prepended_table(self.wfm1, so1,
+                                                  pd.DataFrame({'A': [2]}))
+        so3 = so2.duplicate(wfm2)
+
+        # The copy is one whole table
+        self.assertIsNone(so3.parent)
+        self.assertEqual(so3.stored_at, so2.stored_at)
+        self.assertEqual(wfm2.stored_objects.count(), 1)
+        assert_frame_equal(so3.get_table(), pd.DataFrame({'A': [2, 1]}))
+
     def test_duplicate_table(self):
         table = pd.DataFrame({'A': [1]})
 
@@ -98,14 +181,81 @@ class StoredObjectTests(DbTestCase):
         so1 = StoredObject.create_table(self.wfm1, table)
         so2 = so1.duplicate(self.wfm2)
 
-        # new StoredObject should have same time, same metadata,
-        # different file with same contents
+        # new StoredObject should have same time, same metadata, same file
         self.assertEqual(so1.stored_at, so2.stored_at)
         self.assertEqual(so1.metadata, so2.metadata)
         self.assertEqual(so1.size, so2.size)
         self.assertEqual(so1.bucket, so2.bucket)
-        self.assertNotEqual(so1.key, so2.key)
+        self.assertEqual(so1.key, so2.key)
+        assert_frame_equal(so2.get_table(), table)
+
+    def test_delete_duplicate_keeps_shared_file(self):
+        table = pd.DataFrame({'A': [1]})
+
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        so2 = so1.duplicate(wfm2)
+
+        so1.delete()
         assert_frame_equal(so2.get_table(), table)
+        so2.delete()
+        self.assertFalse(minio.exists(so2.bucket, so2.key))
+
+    def test_concurrent_deletes_of_duplicates_delete_shared_file(self):
+        table = pd.DataFrame({'A': [1]})
+
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        so2 = so1.duplicate(wfm2)
+
+        def delete_so2():
+            try:
+                so2.delete()
+            finally:
+                connection.close()  # this thread's connection
+
+        with transaction.atomic():
+            so1.delete()
+            # so2's delete can't see our uncommitted delete. It must wait for
+            # our commit before it counts references.
+            thread = threading.Thread(target=delete_so2)
+            thread.start()
+            with connection.cursor() as cursor:
+                for _ in range(100):
+                    cursor.execute("""
+                        SELECT COUNT(*) FROM pg_locks
+                        WHERE locktype = 'advisory' AND NOT granted
+                    """)
+                    if cursor.fetchone()[0]:
+                        break
+                    time.sleep(0.05)
+                else:
+                    self.fail('so2.delete() did not wait for our lock')
+        thread.join()
+
+        self.assertFalse(minio.exists(so1.bucket, so1.key))
+
+    def test_duplicate_deleted_table(self):
+        table = pd.DataFrame({'A': [1]})
+
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        # Someone deleted so1 (and its file) after we loaded it
+        StoredObject.objects.filter(id=so1.id).delete()
+
+        with self.assertRaises(StoredObject.DoesNotExist):
+            so1.duplicate(wfm2)
+        self.assertEqual(wfm2.stored_objects.count(), 0)
+
+    def test_delete_workflow_with_duplicates_deletes_shared_file(self):
+        table = pd.DataFrame({'A': [1]})
+
+        wfm2 = self.wfm1.tab.wf_modules.create(order=1)
+        so1 = StoredObject.create_table(self.wfm1, table)
+        so1.duplicate(wfm2)
+
+        self.workflow.delete()  # deletes both StoredObjects at once
+        self.assertFalse(minio.exists(so1.bucket, so1.key))
 
     def test_read_file_fastparquet_issue_375(self):
         path = (
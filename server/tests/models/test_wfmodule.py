@@ -1,6 +1,10 @@
 import io
+from unittest.mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import pandas as pd
-from server.models import ModuleVersion, Workflow
+from server.migrated_params_cache import migrated_params_cache
+from server.models import ModuleVersion, WfModule, Workflow
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase, mock_csv_table
 
@@ -202,3 +206,75 @@ class WfModuleTests(DbTestCase):
             module_id_name='floob'
         )
         self.assertIsNone(wf_module.module_version)
+
+    def test_load_live_in_workflow(self):
+        workflow = Workflow.create_and_init()
+        tab1 = workflow.tabs.first()
+        tab2 = workflow.tabs.create(position=1, slug='tab-2')
+        module_version = ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'floob',
+            'name': 'Floob',
+            'category': 'Clean',
+            'parameters': []
+        })
+        wfm1 = tab1.wf_modules.create(order=0, module_id_name='floob')
+        stored_object = wfm1.store_fetched_table(mock_csv_table)
+        tab1.wf_modules.create(order=1, module_id_name='floob',
+                               is_deleted=True)
+        wfm2 = tab2.wf_modules.create(order=0, module_id_name='missing')
+
+        with CaptureQueriesContext(connection) as queries:
+            wf_modules = WfModule.load_live_in_workflow(workflow)
+            self.assertEqual([wfm.id for wfm in wf_modules],
+                             [wfm1.id, wfm2.id])
+            self.assertEqual(wf_modules[0].tab_slug, tab1.slug)
+            self.assertEqual(wf_modules[0].module_version, module_version)
+            self.assertEqual(
+                wf_modules[0].list_fetched_data_versions(),
+                [(stored_object, False)]
+            )
+            self.assertIsNone(wf_modules[1].module_version)
+            self.assertEqual(wf_modules[1].list_fetched_data_versions(), [])
+        self.assertEqual(len(queries), 3)
+
+    def _test_get_params_migrate(self, write_back):
+        calls = []
+
+        class MockLoadedModule:
+            def __init__(self, *args):
+                pass
+
+            def migrate_params(self, schema, values):
+                calls.append(values)
+                return {'foo': values['oldfoo']}
+
+        workflow = Workflow.create_and_init()
+        ModuleVersion.create_or_replace_from_spec({
+            'id_name': 'x', 'name': 'x', 'category': 'Clean',
+            'parameters': [{'id_name': 'foo', 'type': 'string'}]
+        })
+        wf_module = workflow.tabs.first().wf_modules.create(
+            order=0,
+            module_id_name='x',
+            params={'oldfoo': 'bar'}
+        )
+
+        with patch('server.models.loaded_module.LoadedModule.'
+                   'for_module_version_sync', MockLoadedModule), \
+                patch.object(migrated_params_cache, 'write_back', write_back):
+            self.assertEqual(wf_module.get_params().values, {'foo': 'bar'})
+            wf_module.refresh_from_db()
+            wf_module.get_params().values['foo'] = 'modified'
+            self.assertEqual(wf_module.get_params().values, {'foo': 'bar'})
+
+        self.assertEqual(calls, [{'oldfoo': 'bar'}])  # migrated once
+        wf_module.refresh_from_db()
+        return wf_module.params
+
+    def test_get_params_cache_migrate_params(self):
+        params = self._test_get_params_migrate(write_back=False)
+        self.assertEqual(params, {'oldfoo': 'bar'})
+
+    def test_get_params_write_back_migrated_params(self):
+        params = self._test_get_params_migrate(write_back=True)
+        self.assertEqual(params, {'foo': 'bar'})
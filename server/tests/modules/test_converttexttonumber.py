@@ -112,6 +112,22 @@ class TestExtractNumbers(unittest.TestCase):
         result = form.convert_table(table)
         assert_frame_equal(result, pd.DataFrame({'A': [1.0, 2.1, 3.2]}))
 
+    def test_extract_any_from_category_with_repeats_and_nulls(self):
+        table = pd.DataFrame({'A': ['x1', np.nan, 'x1', 'y']},
+                             dtype='category')
+        form = Form(['A'], True, InputNumberType.ANY)
+        result = form.convert_table(table.copy())
+        self.assertEqual(result, (
+            "'y' in row 4 of 'A' cannot be converted. Overall, there is 1 "
+            "error in 1 column. Select 'Convert non-numbers to null' to set "
+            "these values to null."
+        ))
+
+        form = Form(['A'], True, InputNumberType.ANY, error_means_null=True)
+        result = form.convert_table(table)
+        assert_frame_equal(result,
+                           pd.DataFrame({'A': [1.0, np.nan, 1.0, np.nan]}))
+
     def test_extract_any_us(self):
         table = pd.DataFrame({'A': ['1,234', '2,345.67', '3.456']})
         form = Form(['A'], True, InputNumberType.ANY, InputLocale.US)
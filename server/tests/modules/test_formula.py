@@ -146,6 +146,28 @@ class FormulaTests(unittest.TestCase):
             })
         )
 
+    def test_excel_all_rows_if(self):
+        self._test(
+            pd.DataFrame({'A': [1, 4], 'B': [2, 3]}),
+            {'formula_excel': '=IF(A1>B1, A1, B1*10)', 'all_rows': True},
+            pd.DataFrame({'A': [1, 4], 'B': [2, 3], 'R': [20.0, 4.0]})
+        )
+
+    def test_excel_all_rows_concatenate_text(self):
+        self._test(
+            pd.DataFrame({'A': ['foo', 'bar']}),
+            {'formula_excel': '=A1&"!"', 'all_rows': True},
+            pd.DataFrame({'A': ['foo', 'bar'], 'R': ['foo!', 'bar!']})
+        )
+
+    def test_excel_all_rows_divide_by_zero(self):
+        # Excel errors are text, just like when we evaluate row by row
+        self._test(
+            pd.DataFrame({'A': [1, 2], 'B': [2, 0]}),
+            {'formula_excel': '=A1/B1', 'all_rows': True},
+            pd.DataFrame({'A': [1, 2], 'B': [2, 0], 'R': ['0.5', '#DIV/0!']})
+        )
+
     def test_excel_text_formula(self):
         self._test(
             pd.DataFrame({'A': ['foo', 'bar']}),
@@ -131,6 +131,15 @@ def process(table):
 """, EMPTY_DATAFRAME, timeout=0.0001)
         self.assertEqual(error, 'Python subprocess did not respond in 0.0001s')
 
+    def test_report_unsendable_retval_without_waiting_for_timeout(self):
+        # The child can't pickle a lambda, so it dies without sending
+        _, error, __ = safe_eval_process("""
+def process(table):
+    return pd.DataFrame({'A': [lambda: 1]})
+""", EMPTY_DATAFRAME, timeout=600)
+        self.assertEqual(error,
+                         'Python subprocess exited without returning a result')
+
     def test_invalid_retval(self):
         _, error, output = safe_eval_process("""
 def process(table):
@@ -7,7 +7,7 @@ import dateutil
 from django.test import SimpleTestCase, override_settings
 import pandas as pd
 from pandas.testing import assert_frame_equal
-from cjworkbench.types import ProcessResult
+from cjworkbench.types import ProcessResult, RowsToPrepend
 from server.modules import twitter
 from .util import MockParams
 
@@ -900,9 +900,9 @@ class TwitterTests(SimpleTestCase):
                    accumulate=True)
 
         result = fetch(params, mock_tweet_table)
-        expected = pd.concat([mock_tweet_table2, mock_tweet_table],
-                             ignore_index=True, sort=False)
-        assert_frame_equal(result, expected)
+        # Return only the new tweets: Workbench prepends them to the old ones
+        self.assertIsInstance(result, RowsToPrepend)
+        assert_frame_equal(result.dataframe, mock_tweet_table2)
 
         # query should start where we left off
         self.assertEqual(
@@ -935,13 +935,24 @@ class TwitterTests(SimpleTestCase):
                    accumulate=True)
 
         result = fetch(params, mock_tweet_table)
-        expected = pd.concat([
-            mock_tweet_table2.iloc[[0]],
-            mock_tweet_table2.iloc[[1]],
-            mock_tweet_table.iloc[[0]]
-            # The rest is truncated
-        ], ignore_index=True, sort=False)
-        assert_frame_equal(result, expected)
+        # Workbench truncates when it compacts stored versions
+        self.assertEqual(result.max_rows, 3)
+        assert_frame_equal(result.dataframe, mock_tweet_table2)
+
+    @override_settings(TWITTER_MAX_ROWS_PER_TABLE=1)
+    @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
+    @patch('aiohttp.ClientSession')
+    def test_accumulate_truncate_new_tweets(self, session):
+        session.return_value = MockAiohttpSession([
+            mock_statuses2,
+            []
+        ])
+
+        params = P(querytype='user_timeline', username='foouser',
+                   accumulate=True)
+
+        result = fetch(params, mock_tweet_table)
+        assert_frame_equal(result.dataframe, mock_tweet_table2.iloc[[0]])
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -954,7 +965,7 @@ class TwitterTests(SimpleTestCase):
         ])
 
         result = fetch(P(accumulate=True), None)
-        assert_frame_equal(result, mock_tweet_table)
+        assert_frame_equal(result.dataframe, mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -967,7 +978,7 @@ class TwitterTests(SimpleTestCase):
         ])
 
         result = fetch(P(accumulate=True), pd.DataFrame())  # missing columns
-        assert_frame_equal(result, mock_tweet_table)
+        assert_frame_equal(result.dataframe, mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -980,7 +991,7 @@ class TwitterTests(SimpleTestCase):
 
         result = fetch(P(accumulate=True), pd.DataFrame())  # missing columns
         expected = mock_tweet_table[0:0].reset_index(drop=True)  # empty table
-        assert_frame_equal(result, expected)
+        assert_frame_equal(result.dataframe, expected)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -992,7 +1003,8 @@ class TwitterTests(SimpleTestCase):
         ])
 
         result = fetch(P(accumulate=True), mock_tweet_table)  # missing columns
-        assert_frame_equal(result, mock_tweet_table)
+        # No new rows: Workbench won't store a new version
+        self.assertTrue(result.dataframe.empty)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -1000,9 +1012,9 @@ class TwitterTests(SimpleTestCase):
         # https://www.pivotaltracker.com/story/show/160258591
         # 'id', 'retweet_count' and 'favorite_count' had wrong type after
         # accumulating an empty table. Now the bad data is in our database;
-        # let's convert back to the type we want.
-        session.return_value = MockAiohttpSession([
-            # Fix it _no matter what_ -- even if we aren't adding any data
+        # let's convert back to the type we want. (We don't rewrite it: we
+        # only prepend new tweets. render() converts the stored data.)
+        session.return_value = mock_session = MockAiohttpSession([
             []
         ])
 
@@ -1012,8 +1024,13 @@ class TwitterTests(SimpleTestCase):
         bad_table = bad_table.astype(str)
         bad_table[nulls] = None
 
-        result = fetch(P(accumulate=True), bad_table)
-        assert_frame_equal(result, mock_tweet_table)
+        fetch(P(accumulate=True), bad_table.copy())
+        self.assertIn('since_id=795017539831103489',
+                      str(mock_session.requests[0].url))
+
+        result = twitter.render(pd.DataFrame(), P(accumulate=True),
+                                fetch_result=ProcessResult(bad_table))
+        assert_frame_equal(result['dataframe'], mock_tweet_table)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -1024,7 +1041,7 @@ class TwitterTests(SimpleTestCase):
         ])
 
         # Actually fetch!
-        result = fetch(P(querytype='search', query='cat'))
+        result = fetch(P(querytype='search', query='cat', accumulate=False))
         self.assertEqual([str(req.url) for req in mock_session.requests], [
             (
                 'https://api.twitter.com/1.1/search/tweets.json'
@@ -1051,7 +1068,8 @@ class TwitterTests(SimpleTestCase):
         # Actually fetch!
         result = fetch(
             P(querytype='lists_statuses',
-              listurl='https://twitter.com/thatuser/lists/theirlist')
+              listurl='https://twitter.com/thatuser/lists/theirlist',
+              accumulate=False)
         )
         self.assertEqual([str(req.url) for req in mock_session.requests], [
             (
@@ -1115,11 +1133,9 @@ class TwitterTests(SimpleTestCase):
             .drop('retweeted_status_screen_name', axis=1)
 
         result = fetch(P(accumulate=True), old_format_table)
-
-        expected = pd.concat([mock_tweet_table2, mock_tweet_table],
-                             ignore_index=True, sort=False)
-        expected.loc[3:5, 'retweeted_status_screen_name'] = None
-        assert_frame_equal(result, expected)
+        # New tweets have all columns. (StoredObject.get_table() fills the
+        # old tweets' missing column with nulls.)
+        assert_frame_equal(result.dataframe, mock_tweet_table2)
 
     @patch('server.oauth.OAuthService.lookup_or_none', mock_auth)
     @patch('aiohttp.ClientSession')
@@ -1131,7 +1147,7 @@ class TwitterTests(SimpleTestCase):
             []
         ])
 
-        result = fetch(P())
+        result = fetch(P(accumulate=False))
         self.assertEqual(result['text'][0], (
             "RT @JacopoOttaviani: \u26a1\ufe0f I'm playing with "
             "@workbenchdata: absolutely mindblowing. It's like a fusion "
@@ -1149,7 +1165,7 @@ class TwitterTests(SimpleTestCase):
             []
         ])
 
-        result = fetch(P())
+        result = fetch(P(accumulate=False))
         lang = result['lang'][0]
         self.assertNotEqual(lang, 'und')
         self.assertTrue(pd.isnull(lang))
@@ -242,6 +242,52 @@ class ParseBytesIoTest(SimpleTestCase):
         expected = ProcessResult(pd.DataFrame({'A': ['B'], 'C': ['NA']}))
         self.assertEqual(result, expected)
 
+    @patch('server.modules.utils._ParseFirstChunkRows', 2)
+    @patch('server.modules.utils._ParseChunkCells', 6)  # 2 rows per chunk
+    def test_csv_chunked(self):
+        result = parse_bytesio(io.BytesIO(
+            b'A,B,C\n'
+            b'x,1,1\n'
+            b'y,2,2\n'
+            b'x,3,\n'
+            b'z,4,4\n'
+            b'y,5.5,hi'
+        ), 'text/csv', 'utf-8')
+        expected = ProcessResult(pd.DataFrame({
+            'A': pd.Categorical(['x', 'y', 'x', 'z', 'y']),
+            'B': [1.0, 2.0, 3.0, 4.0, 5.5],
+            'C': pd.Categorical(['1', '2', '', '4', 'hi']),
+        }))
+        self.assertEqual(result, expected)
+        # Categories are sorted, as read_csv() would sort them
+        self.assertEqual(list(result.dataframe['A'].cat.categories),
+                         ['x', 'y', 'z'])
+
+    @override_settings(MAX_ROWS_PER_TABLE=2)
+    @patch('server.modules.utils._ParseFirstChunkRows', 3)
+    def test_csv_truncate(self):
+        result = parse_bytesio(io.BytesIO(b'A,B\nx,1\ny,2\nz,3\nw,hi'),
+                               'text/csv', 'utf-8')
+        # Rows past the limit still count when inferring types
+        expected = ProcessResult(pd.DataFrame({
+            'A': pd.Categorical(['x', 'y']),
+            'B': pd.Categorical(['1', '2']),
+        }), error='Truncated output from 4 rows to 2')
+        self.assertEqual(result, expected)
+
+    @override_settings(MAX_BYTES_PER_TABLE=1)
+    @patch('server.modules.utils._ParseFirstChunkRows', 2)
+    @patch('server.modules.utils._ParseChunkCells', 4)  # 2 rows per chunk
+    def test_csv_truncate_bytes(self):
+        result = parse_bytesio(io.BytesIO(b'A,B\nx,1\ny,2\nz,3\nw,hi'),
+                               'text/csv', 'utf-8')
+        # We keep the chunk that passed the limit, and no more
+        expected = ProcessResult(pd.DataFrame({
+            'A': pd.Categorical(['x', 'y']),
+            'B': pd.Categorical(['1', '2']),
+        }), error='Truncated output from 4 rows to 2')
+        self.assertEqual(result, expected)
+
     def test_xls(self):
         with (TestDataPath / 'example.xls').open('rb') as file:
             result = parse_bytesio(file, 'application/vnd.ms-excel', None)
@@ -456,6 +502,19 @@ class AutocastDtypesTest(unittest.TestCase):
         expected = pd.DataFrame({'A': [np.nan, np.nan, 1.0]}, dtype=np.float64)
         assert_frame_equal(table, expected)
 
+    def test_autocast_int_from_str_categories_ignore_unused(self):
+        table = pd.DataFrame({'A': pd.Categorical(['1', '2', '1'],
+                                                  ['1', '2', 'unused'])})
+        autocast_dtypes_in_place(table)
+        expected = pd.DataFrame({'A': [1, 2, 1]})
+        assert_frame_equal(table, expected)
+
+    def test_autocast_float_from_str_categories_with_null(self):
+        table = pd.DataFrame({'A': ['1', np.nan, '1']}, dtype='category')
+        autocast_dtypes_in_place(table)
+        expected = pd.DataFrame({'A': [1.0, np.nan, 1.0]})
+        assert_frame_equal(table, expected)
+
     def test_autocast_str_categories_from_str_categories(self):
         table = pd.DataFrame({'A': ['1', '2.1', 'Yay']}, dtype='category')
         autocast_dtypes_in_place(table)  # should be no-op
@@ -0,0 +1,50 @@
+import datetime
+import unittest
+from server.migrated_params_cache import hash_params, MigratedParamsCache
+
+
+_now = datetime.datetime(2019, 1, 1)
+
+
+def _key(params, id_name='x'):
+    return (id_name, 'abc', _now, hash_params(params))
+
+
+class MigratedParamsCacheTest(unittest.TestCase):
+    def test_hash_params_ignores_key_order(self):
+        self.assertEqual(hash_params({'a': 1, 'b': 2}),
+                         hash_params({'b': 2, 'a': 1}))
+        self.assertNotEqual(hash_params({'a': 1}), hash_params({'a': 2}))
+
+    def test_hit_and_miss(self):
+        cache = MigratedParamsCache()
+        cache.put(_key({'a': 1}), {'a': 2})
+        self.assertEqual(cache.get(_key({'a': 1})), {'a': 2})
+        self.assertIsNone(cache.get(_key({'a': 1}, id_name='y')))
+        stats = cache.stats()
+        self.assertEqual(stats['n_hits'], 1)
+        self.assertEqual(stats['n_misses'], 1)
+
+    def test_get_returns_copy(self):
+        cache = MigratedParamsCache()
+        params = {'a': [1]}
+        cache.put(_key({}), params)
+        params['a'].append(2)  # modifying the original mustn't modify cache
+        cache.get(_key({}))['a'].append(3)  # neither must modifying a result
+        self.assertEqual(cache.get(_key({})), {'a': [1]})
+
+    def test_evict_least_recently_used(self):
+        cache = MigratedParamsCache(max_entries=2)
+        cache.put(_key({'a': 1}), {})
+        cache.put(_key({'a': 2}), {})
+        cache.get(_key({'a': 1}))  # now {'a': 2} is least-recently used
+        cache.put(_key({'a': 3}), {})
+        self.assertIsNone(cache.get(_key({'a': 2})))
+        self.assertIsNotNone(cache.get(_key({'a': 1})))
+        self.assertIsNotNone(cache.get(_key({'a': 3})))
+
+    def test_disabled(self):
+        cache = MigratedParamsCache(max_entries=0)
+        cache.put(_key({}), {})
+        self.assertIsNone(cache.get(_key({})))
+        self.assertEqual(cache.stats()['n_misses'], 0)
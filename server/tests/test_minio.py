@@ -80,20 +80,38 @@ class RandomReadMinioFileTest(unittest.TestCase):
         self.assertEqual(file.read(2), b'56')
         self.assertEqual(file.read(2), b'')
 
-    def test_read_stops_at_block_boundary(self):
-        # https://docs.python.org/3/library/io.html#io.RawIOBase:
-        # Read up to size bytes from the object and return them. As a
-        # convenience, if size is unspecified or -1, all bytes until EOF are
-        # returned. Otherwise, only one system call is ever made. Fewer than
-        # size bytes may be returned if the operating system call returns fewer
-        # than size bytes.
+    def test_read_spans_blocks_in_one_request(self):
         _put(b'123456')
         file = minio.RandomReadMinioFile(Bucket, Key, block_size=2)
-        self.assertEqual(file.read(4), b'12')
-        self.assertEqual(file.read(4), b'34')
-        self.assertEqual(file.read(4), b'56')
+        self.assertEqual(file.n_requests, 1)  # block 1, to find size
+        self.assertEqual(file.read(5), b'12345')
+        self.assertEqual(file.n_requests, 2)  # blocks 2 and 3 together
+        self.assertEqual(file.n_bytes_fetched, 6)
+        self.assertEqual(file.read(4), b'6')
         self.assertEqual(file.read(4), b'')
 
+    def test_read_coalesces_only_missing_blocks(self):
+        _put(b'12345678')
+        file = minio.RandomReadMinioFile(Bucket, Key, block_size=2)
+        file.seek(4)
+        file.read(2)  # fetch block 3
+        file.seek(0)
+        self.assertEqual(file.read(), b'12345678')
+        # requests: block 1 (init); block 3; block 2; block 4
+        self.assertEqual(file.n_requests, 4)
+        self.assertEqual(file.n_bytes_fetched, 8)
+
+    def test_prefetch_next_blocks(self):
+        _put(b'123456')
+        file = minio.RandomReadMinioFile(Bucket, Key, block_size=2,
+                                         prefetch_blocks=2)
+        file.seek(2)
+        self.assertEqual(file.read(2), b'34')
+        # Block 3 is prefetched in the background. Wait for it...
+        file.close()
+        self.assertEqual(file.n_requests, 3)
+        self.assertEqual(file.n_bytes_fetched, 6)
+
     def test_read_starting_mid_block(self):
         _put(b'123456')
         file = minio.RandomReadMinioFile(Bucket, Key, block_size=3)
@@ -112,6 +130,20 @@ class RandomReadMinioFileTest(unittest.TestCase):
         file.seek(1)
         self.assertEqual(file.read(), b'23456')
 
+    def test_known_size_and_tail_skips_requests(self):
+        _put(b'123456')
+        file = minio.RandomReadMinioFile(Bucket, Key, block_size=2, size=6,
+                                         tail=b'456')
+        _clear()  # prove we don't read from S3
+        file.seek(-3, io.SEEK_END)
+        self.assertEqual(file.read(), b'456')
+
+    def test_known_size_fetches_body(self):
+        _put(b'123456')
+        file = minio.RandomReadMinioFile(Bucket, Key, block_size=2, size=6,
+                                         tail=b'56')
+        self.assertEqual(file.read(), b'123456')
+
     @patch.object(StreamingBody, 'read')
     def test_recover_after_read_protocolerror(self, read_mock):
         # Patch DownloadChunkIterator: first attempt to stream bytes raises
@@ -124,3 +156,84 @@ class RandomReadMinioFileTest(unittest.TestCase):
             file = minio.RandomReadMinioFile(Bucket, Key)
             self.assertEqual(file.read(), b'123456')
             self.assertRegex(logs.output[0], 'Retrying exception')
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        minio.ensure_bucket_exists(Bucket)
+        minio.remove_recursive(Bucket, 'batch/')
+
+    def tearDown(self):
+        minio.remove_recursive(Bucket, 'batch/')
+
+    def _keys(self):
+        return sorted(o['Key'] for o in minio.iter_objects(Bucket, 'batch/'))
+
+    def test_copy_many_and_remove_many(self):
+        minio.put_bytes(Bucket, 'batch/a', b'a')
+        minio.copy_many(Bucket, [(f'batch/{i}', f'{Bucket}/batch/a')
+                                 for i in range(3)])
+        self.assertEqual(self._keys(),
+                         ['batch/0', 'batch/1', 'batch/2', 'batch/a'])
+        minio.remove_many(Bucket, ['batch/0', 'batch/1', 'batch/missing'])
+        self.assertEqual(self._keys(), ['batch/2', 'batch/a'])
+
+    def test_remove_recursive_more_than_one_page(self):
+        minio.put_bytes(Bucket, 'batch/a', b'a')
+        minio.copy_many(Bucket, [(f'batch/{i:04d}', f'{Bucket}/batch/a')
+                                 for i in range(1001)])
+        minio.remove_recursive(Bucket, 'batch/')
+        self.assertEqual(self._keys(), [])
+
+    def test_operation_stats(self):
+        minio.put_bytes(Bucket, 'batch/a', b'a')
+        self.assertGreater(
+            minio.operation_stats()['put_object']['n_requests'],
+            0
+        )
+
+
+class MultipartUploadMinioFileTest(unittest.TestCase):
+    def setUp(self):
+        minio.ensure_bucket_exists(Bucket)
+        _clear()
+
+    def tearDown(self):
+        _clear()
+
+    def test_small_file(self):
+        with minio.MultipartUploadMinioFile(Bucket, Key, tail_size=4) as f:
+            f.write(b'123')
+            f.write(b'456')
+            self.assertEqual(f.tell(), 6)
+        self.assertEqual(f.tail, b'3456')
+        self.assertEqual(minio.get_object_with_data(Bucket, Key)['Body'],
+                         b'123456')
+
+    def test_multipart(self):
+        part_size = 5 * 1024 * 1024
+        data = bytes(range(256)) * (part_size * 2 // 256) + b'end'
+        with minio.MultipartUploadMinioFile(Bucket, Key, tail_size=10,
+                                            part_size=part_size) as f:
+            for i in range(0, len(data), 1000000):
+                f.write(data[i:i + 1000000])
+        self.assertEqual(minio.get_object_with_data(Bucket, Key)['Body'],
+                         data)
+        self.assertEqual(f.tail, data[-10:])
+
+    def test_tail_spans_parts(self):
+        part_size = 5 * 1024 * 1024
+        with minio.MultipartUploadMinioFile(Bucket, Key, tail_size=4,
+                                            part_size=part_size) as f:
+            f.write(b'x' * (part_size - 2) + b'12')  # uploads a part
+            f.write(b'34')
+        self.assertEqual(f.tail, b'1234')
+
+    def test_abort_on_error(self):
+        part_size = 5 * 1024 * 1024
+        with self.assertRaises(ZeroDivisionError):
+            with minio.MultipartUploadMinioFile(Bucket, Key,
+                                                part_size=part_size) as f:
+                f.write(b'x' * (part_size + 1))
+                1 / 0
+        self.assertFalse(minio.exists(Bucket, Key))
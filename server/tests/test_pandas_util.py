@@ -0,0 +1,28 @@
+import unittest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from server.pandas_util import share_repeated_strings
+
+
+class ShareRepeatedStringsTest(unittest.TestCase):
+    def test_share_equal_strings(self):
+        # build strings at runtime, so Python can't intern them
+        table = pd.DataFrame({'A': [''.join(['a', 'b']), ''.join(['a', 'b']),
+                                    'c']})
+        share_repeated_strings(table)
+        self.assertIs(table['A'][0], table['A'][1])
+        assert_frame_equal(table, pd.DataFrame({'A': ['ab', 'ab', 'c']}))
+
+    def test_keep_null_objects(self):
+        table = pd.DataFrame({'A': ['a', None, 'a', np.nan]})
+        share_repeated_strings(table)
+        self.assertIsNone(table['A'][1])
+        self.assertIsInstance(table['A'][3], float)  # NaN
+
+    def test_ignore_non_str_objects(self):
+        # factorize() would call 1 and True the same value
+        table = pd.DataFrame({'A': [1, True, 1, True]}, dtype=object)
+        share_repeated_strings(table)
+        self.assertEqual([type(v) for v in table['A']],
+                         [int, bool, int, bool])
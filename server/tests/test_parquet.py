@@ -1,6 +1,9 @@
 from contextlib import contextmanager
 from pathlib import Path
 import unittest
+from unittest.mock import patch
+import pandas
+from pandas.testing import assert_frame_equal
 from server import minio, parquet
 
 
@@ -42,3 +45,79 @@ class ParquetTest(unittest.TestCase):
         with self._file_on_s3('fastparquet-issue-375-snappy.par'):
             with self.assertRaises(parquet.FastparquetIssue375):
                 parquet.read(bucket, key)
+
+    def test_read_slice_across_row_groups(self):
+        table = pandas.DataFrame({
+            'A': range(parquet.RowGroupSize * 2 + 5),
+            'B': 'x',
+        })
+        try:
+            parquet.write(bucket, key, table)
+            start = parquet.RowGroupSize - 2
+            end = parquet.RowGroupSize + 3
+            result = parquet.read_slice(bucket, key, ['A'], start, end)
+            assert_frame_equal(
+                result,
+                table[['A']][start:end].reset_index(drop=True)
+            )
+        finally:
+            minio.remove(bucket, key)
+
+    def test_read_slice_empty(self):
+        table = pandas.DataFrame({'A': [1, 2]})
+        try:
+            parquet.write(bucket, key, table)
+            result = parquet.read_slice(bucket, key, ['A'], 5, 10)
+            self.assertEqual(list(result.columns), ['A'])
+            self.assertEqual(len(result), 0)
+        finally:
+            minio.remove(bucket, key)
+
+    def test_write_returns_footer(self):
+        table = pandas.DataFrame({'A': [1, 2], 'B': ['x', 'y']})
+        try:
+            file_info = parquet.write(bucket, key, table)
+            self.assertEqual(file_info.size, minio.stat(bucket, key).size)
+            data = minio.get_object_with_data(bucket, key)['Body']
+            self.assertTrue(data.endswith(file_info.footer))
+            assert_frame_equal(parquet.read(bucket, key), table)
+        finally:
+            minio.remove(bucket, key)
+
+    def test_read_columns_uses_file_info(self):
+        table = pandas.DataFrame({'A': [1, 2], 'B': ['x', 'y']})
+        try:
+            file_info = parquet.write(bucket, key, table)
+            with patch.object(minio, 'RandomReadMinioFile',
+                              wraps=minio.RandomReadMinioFile) as open_mock:
+                result = parquet.read(bucket, key, [], {'columns': ['A']},
+                                      file_info=file_info)
+            open_mock.assert_called_with(bucket, key, size=file_info.size,
+                                         tail=file_info.footer)
+            assert_frame_equal(result, table[['A']])
+        finally:
+            minio.remove(bucket, key)
+
+    def test_read_shares_repeated_strings(self):
+        table = pandas.DataFrame({
+            # build strings at runtime, so Python can't intern them
+            'A': [''.join(['a', 'b']), ''.join(['a', 'b']), None, 'c'],
+            'B': pandas.Series(['x', 'x', 'y', None], dtype='category'),
+        })
+        try:
+            parquet.write(bucket, key, table)
+            result = parquet.read(bucket, key)
+            assert_frame_equal(result, table)
+            self.assertIs(result['A'][0], result['A'][1])
+        finally:
+            minio.remove(bucket, key)
+
+    def test_read_keeps_null_text_as_none(self):
+        table = pandas.DataFrame({'A': ['a', 'a', None]})
+        try:
+            parquet.write(bucket, key, table)
+            result = parquet.read(bucket, key)
+            self.assertIs(result['A'][0], result['A'][1])
+            self.assertIsNone(result['A'][2])  # not NaN
+        finally:
+            minio.remove(bucket, key)
@@ -0,0 +1,62 @@
+import unittest
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from server.render_cache import RenderResultCache
+
+
+def _table(n: int) -> pd.DataFrame:
+    return pd.DataFrame({'A': range(n)}, dtype='int64')
+
+
+class RenderResultCacheTest(unittest.TestCase):
+    def test_disabled_by_default(self):
+        cache = RenderResultCache()
+        cache.put((1, 2, 3), _table(1))
+        self.assertIsNone(cache.get((1, 2, 3)))
+        self.assertEqual(cache.stats()['n_misses'], 0)
+
+    def test_hit_and_miss(self):
+        cache = RenderResultCache(max_bytes=10000)
+        cache.put((1, 2, 3), _table(3))
+        assert_frame_equal(cache.get((1, 2, 3)), _table(3))
+        self.assertIsNone(cache.get((1, 2, 4)))
+        stats = cache.stats()
+        self.assertEqual(stats['n_hits'], 1)
+        self.assertEqual(stats['n_misses'], 1)
+
+    def test_get_returns_copy(self):
+        cache = RenderResultCache(max_bytes=10000)
+        table = _table(3)
+        cache.put((1, 2, 3), table)
+        table['A'] = 99  # modifying the original mustn't modify the cache
+        cache.get((1, 2, 3))['A'] = 99  # neither must modifying a result
+        assert_frame_equal(cache.get((1, 2, 3)), _table(3))
+
+    def test_evict_least_recently_used(self):
+        size = int(_table(100).memory_usage(deep=True).sum())
+        cache = RenderResultCache(max_bytes=size * 2)
+        cache.put((1, 1, 1), _table(100))
+        cache.put((1, 2, 1), _table(100))
+        cache.get((1, 1, 1))  # now (1, 2, 1) is least-recently used
+        cache.put((1, 3, 1), _table(100))
+        self.assertIsNone(cache.get((1, 2, 1)))
+        self.assertIsNotNone(cache.get((1, 1, 1)))
+        self.assertIsNotNone(cache.get((1, 3, 1)))
+        self.assertEqual(cache.stats()['n_evictions'], 1)
+        self.assertEqual(cache.stats()['n_bytes'], size * 2)
+
+    def test_skip_table_larger_than_cache(self):
+        cache = RenderResultCache(max_bytes=10)
+        cache.put((1, 2, 3), _table(100))
+        self.assertIsNone(cache.get((1, 2, 3)))
+        self.assertEqual(cache.stats()['n_bytes'], 0)
+
+    def test_discard_wf_module(self):
+        cache = RenderResultCache(max_bytes=10000)
+        cache.put((1, 2, 3), _table(1))
+        cache.put((1, 2, 4), _table(1))
+        cache.put((1, 5, 4), _table(1))
+        cache.discard_wf_module(1, 2)
+        self.assertIsNone(cache.get((1, 2, 3)))
+        self.assertIsNone(cache.get((1, 2, 4)))
+        self.assertIsNotNone(cache.get((1, 5, 4)))
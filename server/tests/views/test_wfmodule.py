@@ -312,3 +312,50 @@ class WfModuleTests(LoggedInTestCase):
         self.assertEqual(json.loads(response.content), {
             'error': 'column "C" not found'
         })
+
+    @patch('server.parquet.RowGroupSize', 3)
+    def test_public_output_csv_streams_row_groups(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get('/public/moduledata/live/%d.csv'
+                                   % self.wf_module2.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            test_data.to_csv(index=False).encode('utf-8')
+        )
+
+    @patch('server.parquet.RowGroupSize', 3)
+    def test_public_output_json_streams_row_groups(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get('/public/moduledata/live/%d.json'
+                                   % self.wf_module2.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)),
+                         test_data_json['rows'])
+
+    def test_public_output_raises_if_file_disappears(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(test_data))
+        self.wf_module2.save()
+
+        response = self.client.get('/public/moduledata/live/%d.csv'
+                                   % self.wf_module2.id)
+        minio.remove(minio.CachedRenderResultsBucket,
+                     self.wf_module2.cached_render_result.parquet_key)
+        # Raise, so the server aborts the response instead of truncating it
+        with self.assertRaises(OSError):
+            b''.join(response.streaming_content)
+
+    def test_public_output_csv_empty_table(self):
+        self.wf_module2.cache_render_result(2, ProcessResult(
+            pd.DataFrame({'A': [], 'B': []})
+        ))
+        self.wf_module2.save()
+
+        response = self.client.get('/public/moduledata/live/%d.csv'
+                                   % self.wf_module2.id)
+        self.assertEqual(b''.join(response.streaming_content), b'A,B\n')
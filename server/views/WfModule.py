@@ -1,12 +1,13 @@
 from datetime import timedelta
 import json
 import re
+from typing import Iterator
 import pandas as pd
 from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.http import HttpRequest, HttpResponse, \
-        Http404, HttpResponseNotFound, JsonResponse
+        Http404, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.views.decorators.clickjacking import xframe_options_exempt
@@ -15,7 +16,7 @@ from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from cjworkbench.types import ProcessResult
-from server.models import WfModule
+from server.models import CachedRenderResult, WfModule
 from server import rabbitmq
 import server.utils
 from server.utils import units_to_seconds
@@ -155,27 +156,31 @@ def wfmodule_detail(request, pk, format=None):
 # Now reading a maximum of 101 columns directly from cache parquet
 def _make_render_tuple(cached_result, startrow=None, endrow=None):
     """Build (startrow, endrow, json_rows) data."""
-    if not cached_result:
-        dataframe = pd.DataFrame()
-    else:
-        columns = cached_result.columns[
-            # Return one row more than configured, so the client knows there
-            # are "too many rows".
-            :(settings.MAX_COLUMNS_PER_CLIENT_REQUEST + 1)
-        ]
-        column_names = [c.name for c in columns]
-        dataframe = cached_result.read_dataframe(column_names)
-
-    nrows = len(dataframe)
     if startrow is None:
         startrow = 0
     if endrow is None:
         endrow = startrow + _MaxNRowsPerRequest
 
+    if not cached_result:
+        nrows = 0
+    else:
+        nrows = cached_result.nrows
+
     startrow = max(0, startrow)
     endrow = min(nrows, endrow, startrow + _MaxNRowsPerRequest)
 
-    table = dataframe[startrow:endrow]
+    if not cached_result or endrow <= startrow:
+        table = pd.DataFrame()
+    else:
+        columns = cached_result.columns[
+            # Return one row more than configured, so the client knows there
+            # are "too many rows".
+            :(settings.MAX_COLUMNS_PER_CLIENT_REQUEST + 1)
+        ]
+        column_names = [c.name for c in columns]
+        # Only read the row groups we need
+        table = cached_result.read_dataframe_slice(column_names, startrow,
+                                                   endrow)
 
     # table.to_json() renders a JSON string. It can't render a dict that we
     # encode later, so let's not even try. Just return the string.
@@ -338,48 +343,87 @@ def wfmodule_tile(request, pk, delta_id, tile_row, tile_column):
     cbegin = N_COLUMNS_PER_TILE * int(tile_column)
     cend = N_COLUMNS_PER_TILE * (int(tile_column) + 1)
 
-    # TODO handle races in the following file reads....
-    df = cached_result.read_dataframe(
-        columns=cached_result.column_names[cbegin:cend]
-    )
-
     rbegin = N_ROWS_PER_TILE * int(tile_row)
     rend = N_ROWS_PER_TILE * (int(tile_row) + 1)
 
-    df = df.iloc[rbegin:rend]
+    # TODO handle races in the following file reads....
+    df = cached_result.read_dataframe_slice(
+        [c.name for c in cached_result.columns[cbegin:cend]],
+        rbegin,
+        rend
+    )
 
     json_string = df.to_json(orient='values', date_format='iso')
 
     return HttpResponse(json_string, content_type='application/json')
 
 
+def _stream_csv(cached_result: CachedRenderResult) -> Iterator[str]:
+    """
+    Yield CSV text, one row group at a time.
+    """
+    # Header first, from the database: the file may have zero row groups
+    yield pd.DataFrame(columns=[c.name for c in cached_result.columns]) \
+        .to_csv(index=False)
+    for dataframe in cached_result.iter_dataframe_row_groups():
+        yield dataframe.to_csv(index=False, header=False)
+
+
+def _stream_json_records(cached_result: CachedRenderResult) -> Iterator[str]:
+    """
+    Yield a JSON Array of Objects, one row group at a time.
+    """
+    yield '['
+    need_comma = False
+    for dataframe in cached_result.iter_dataframe_row_groups():
+        if dataframe.empty:
+            continue
+        records = dataframe.to_json(orient='records')  # '[{...},{...}]'
+        if need_comma:
+            yield ','
+        yield records[1:-1]
+        need_comma = True
+    yield ']'
+
+
 # Public access to wfmodule output. Basically just /render with different auth
 # and output format
 # NOTE: does not support startrow/endrow at the moment
 @api_view(['GET'])
 @renderer_classes((JSONRenderer,))
 def wfmodule_public_output(request, pk, type, format=None):
+    if type not in ('csv', 'json'):
+        raise Http404()
+
     wf_module = _lookup_wf_module_for_read(pk, request)
     workflow = wf_module.workflow
 
+    # Hold the lock only to read database columns. We stream from S3 after
+    # releasing it, so a huge download doesn't block writers.
     with workflow.cooperative_lock():
         wf_module.refresh_from_db()
         cached_result = wf_module.cached_render_result
-        if cached_result:
-            result = cached_result.result  # slow! Reads from S3
+
+    if cached_result is None:
+        # We don't have a cached result, and we don't know how long it'll
+        # take to get one.
+        async_to_sync(rabbitmq.queue_render)(workflow.id,
+                                             workflow.last_delta_id)
+        # The user will simply need to try again....
+        dataframe = ProcessResult().dataframe
+        if type == 'json':
+            d = dataframe.to_json(orient='records')
+            return HttpResponse(d, content_type="application/json")
         else:
-            # We don't have a cached result, and we don't know how long it'll
-            # take to get one.
-            async_to_sync(rabbitmq.queue_render)(workflow.id,
-                                                 workflow.last_delta_id)
-            # The user will simply need to try again....
-            result = ProcessResult()
+            d = dataframe.to_csv(index=False)
+            return HttpResponse(d, content_type="text/csv")
 
+    # If the file disappears mid-stream (say, a re-render deleted it), our
+    # generator raises and the server aborts the connection: the client sees
+    # a failed download, not a short one.
     if type == 'json':
-        d = result.dataframe.to_json(orient='records')
-        return HttpResponse(d, content_type="application/json")
-    elif type == 'csv':
-        d = result.dataframe.to_csv(index=False)
-        return HttpResponse(d, content_type="text/csv")
+        return StreamingHttpResponse(_stream_json_records(cached_result),
+                                     content_type="application/json")
     else:
-        raise Http404()
+        return StreamingHttpResponse(_stream_csv(cached_result),
+                                     content_type="text/csv")
@@ -47,11 +47,13 @@ def make_init_state(request, workflow=None, modules=None):
                 ).data
 
                 tabs = list(workflow.live_tabs)
-                ret['tabs'] = dict((str(tab.slug), TabSerializer(tab).data)
+                wf_modules = WfModule.load_live_in_workflow(workflow)
+                tab_context = {'wf_modules': wf_modules}
+                ret['tabs'] = dict((str(tab.slug),
+                                    TabSerializer(tab,
+                                                  context=tab_context).data)
                                    for tab in tabs)
 
-                wf_modules = list(WfModule.live_in_workflow(workflow))
-
                 ret['wfModules'] = {str(wfm.id): WfModuleSerializer(wfm).data
                                     for wfm in wf_modules}
         except Workflow.DoesNotExist:
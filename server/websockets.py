@@ -98,14 +98,18 @@ class WorkflowConsumer(AsyncJsonWebsocketConsumer):
             }
 
             tabs = list(workflow.live_tabs)
-            ret['updateTabs'] = dict((tab.slug, TabSerializer(tab).data)
+            wf_modules = WfModule.load_live_in_workflow(workflow)
+            tab_context = {'wf_modules': wf_modules}
+            ret['updateTabs'] = dict((tab.slug,
+                                      TabSerializer(tab,
+                                                    context=tab_context).data)
                                      for tab in tabs)
-            wf_modules = list(WfModule.live_in_workflow(workflow.id))
             ret['updateWfModules'] = dict((str(wfm.id),
                                            WfModuleSerializer(wfm).data)
                                           for wfm in wf_modules)
 
-            if workflow.are_all_render_results_fresh():
+            if all(wfm.cached_render_result is not None
+                   for wfm in wf_modules):
                 needs_render = None
             else:
                 needs_render = (workflow.id, workflow.last_delta_id)
@@ -0,0 +1,97 @@
+"""
+Fingerprints that tell us when a render would repeat a previous render.
+
+A step's _output fingerprint_ summarizes its ProcessResult: table data, column
+names and types, error, json and quick fixes. Two results with the same output
+fingerprint are (barring hash collisions) the same result.
+
+A step's _input fingerprint_ summarizes everything its `render()` sees: module
+code, params, tab name, fetched data and the previous step's output
+fingerprint. If a stale cached result has the same input fingerprint we would
+compute now, rendering would just reproduce it -- so we can reuse it instead.
+"""
+from functools import lru_cache
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional
+from cjworkbench.types import ProcessResult
+from server.pandas_util import hash_table_contents
+
+
+_RootPath = Path(__file__).parent.parent.parent
+_RenderCodeGlobs = [
+    # Internal modules all have source_version_hash='internal', so we need to
+    # find out whether _their code_ changed.
+    'server/modules/**/*.py',
+    # Code that coerces every module's output
+    'server/models/loaded_module.py',
+    'server/sanitizedataframe.py',
+    'cjworkbench/types.py',
+]
+
+
+@lru_cache(maxsize=1)
+def _render_code_hash() -> str:
+    """
+    Hash the source of the code that runs during every render.
+
+    When we deploy a new version of Workbench, fingerprints change and no
+    stale result is reused.
+    """
+    md5 = hashlib.md5()
+    for glob in _RenderCodeGlobs:
+        for path in sorted(_RootPath.glob(glob)):
+            md5.update(path.read_bytes())
+    return md5.hexdigest()
+
+
+def _hash_json(value: Any) -> str:
+    data = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+
+def result_fingerprint(result: ProcessResult,
+                       table_hash: Optional[str] = None) -> str:
+    """
+    Fingerprint a ProcessResult's contents.
+
+    This scans every value in the table. It's much faster than a render, but
+    it's not free: call it in an executor thread. (Or pass `table_hash`, if
+    you already computed `hash_table_contents(result.dataframe)`.)
+    """
+    if table_hash is None:
+        table_hash = hash_table_contents(result.dataframe)
+    return _hash_json([
+        table_hash,
+        [c.to_dict() for c in result.columns],
+        result.error,
+        result.json,
+        [qf.to_dict() for qf in result.quick_fixes],
+    ])
+
+
+def input_fingerprint(module_version, param_values: Any, tab_name: str,
+                      fetch_version: Any,
+                      input_result_fingerprint: str) -> Optional[str]:
+    """
+    Fingerprint the arguments to a render, or return `None` if we can't.
+
+    `fetch_version` identifies the fetched data the render reads (e.g.,
+    `(stored_data_version, fetch_error)`).
+
+    Don't call this for steps with tab params: their input includes other tabs'
+    outputs, which this fingerprint doesn't cover.
+    """
+    if module_version is None:
+        return None  # module was deleted; render() will return an error
+
+    return _hash_json([
+        _render_code_hash(),
+        module_version.id_name,
+        module_version.source_version_hash,
+        param_values,
+        tab_name,
+        fetch_version,
+        input_result_fingerprint,
+    ])
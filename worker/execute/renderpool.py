@@ -0,0 +1,243 @@
+"""
+Render modules in a pool of long-lived worker processes.
+
+Module render() functions are CPU-bound Python, so rendering on threads
+gives almost no speedup: the GIL serializes them. A RenderPool keeps
+`n_processes` warm processes -- Django set up, internal modules imported,
+external modules memoized after first use -- and sends each render to an idle
+one.
+
+Processes come from a "forkserver" we start before the worker opens database
+or RabbitMQ connections, so no process inherits a socket it might corrupt. The
+forkserver sets up Django once (see `worker.renderpool_preload`), and every
+child inherits that.
+"""
+import asyncio
+import atexit
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import pickle
+import resource
+from typing import Any, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj: Any) -> bytes:
+    # Protocol 4 pickles each numpy block as one buffer (not value by value),
+    # and it handles objects over 4GB.
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _render_loaded_module(module_version, input_result, params, tab_name,
+                          fetch_result) -> 'ProcessResult':
+    from server.models.loaded_module import LoadedModule
+    loaded_module = LoadedModule.for_module_version_sync(module_version)
+    return loaded_module.render(input_result, params, tab_name, fetch_result)
+
+
+def _format_exception(err: Exception) -> str:
+    message = str(err)
+    if message:
+        return f'{type(err).__name__}: {message}'
+    else:
+        return type(err).__name__  # e.g., MemoryError
+
+
+def _child_main(conn: Connection, memory_limit: int,
+                render: Callable) -> None:
+    """
+    Render jobs from `conn`, forever (until the parent closes it).
+
+    Each job is a pickled `(module_version, input_result, params, tab_name,
+    fetch_result)` tuple, which we pass to `render()`; each response is a
+    pickled ProcessResult.
+    """
+    if memory_limit:
+        # A render that exceeds this raises MemoryError, which becomes an
+        # error message.
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+
+    while True:
+        try:
+            message = conn.recv_bytes()
+        except EOFError:
+            # Parent is gone. Skip finalizers: they're the parent's business.
+            os._exit(0)
+
+        try:
+            result = render(*pickle.loads(message))
+        except Exception as err:
+            # LoadedModule.render() catches the module's own errors; this is
+            # for the rest (e.g., loading the module). Keep the process: it's
+            # still fine.
+            from cjworkbench.types import ProcessResult
+            logger.exception('Exception in render process')
+            result = ProcessResult(error=_format_exception(err))
+        conn.send_bytes(_dumps(result))
+
+
+class RenderProcess:
+    """A child process and the Connection we use to talk to it."""
+
+    def __init__(self, context, memory_limit: int,
+                 render: Callable):
+        self.conn, child_conn = context.Pipe()
+        # Not daemon: modules such as pythoncode start their own processes,
+        # and daemon processes can't have children. The child exits when
+        # `self.conn` is closed.
+        self.process = context.Process(target=_child_main,
+                                       args=(child_conn, memory_limit, render),
+                                       daemon=False)
+        self.process.start()
+        child_conn.close()
+
+    def render(self, message: bytes, timeout: float) -> Optional[bytes]:
+        """
+        Send `message` and return the response (blocking).
+
+        Return `None` if the process took longer than `timeout` seconds.
+        Raise EOFError if the process died.
+        """
+        self.conn.send_bytes(message)
+        if not self.conn.poll(timeout):
+            return None
+        return self.conn.recv_bytes()
+
+    def kill(self) -> None:
+        self.conn.close()
+        self.process.kill()
+        self.process.join()
+
+
+class RenderPool:
+    """
+    A fixed-size pool of RenderProcesses.
+
+    Usage:
+
+        pool = RenderPool(2, time_limit=300, memory_limit=2 * 1024**3)
+        result = await pool.render(module_version, input_result, params,
+                                   tab_name, fetch_result)
+
+    Child processes call `LoadedModule.render()`. Tests may pass another
+    module-level function as `render`.
+    """
+
+    def __init__(self, n_processes: int, time_limit: float,
+                 memory_limit: int = 0,
+                 render: Callable = _render_loaded_module):
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self._render = render
+        self._context = multiprocessing.get_context('forkserver')
+        self._context.set_forkserver_preload(['pandas', 'numpy',
+                                              'worker.renderpool_preload'])
+        self._processes = set()  # every live process: idle or rendering
+        # Start processes now, before the caller opens any connections
+        self._initial_processes = [self._spawn() for _ in range(n_processes)]
+        self._idle = None  # asyncio.Queue, created on the event loop
+
+    def close(self) -> None:
+        """
+        Kill every process -- even ones that are rendering.
+
+        Our processes aren't daemons, so multiprocessing joins them on exit.
+        They only exit when we close their connections: without close(), the
+        parent would hang on exit.
+        """
+        processes = self._processes
+        self._processes = set()
+        for process in processes:
+            process.kill()
+
+    def _spawn(self) -> RenderProcess:
+        process = RenderProcess(self._context, self.memory_limit,
+                                self._render)
+        self._processes.add(process)
+        return process
+
+    def _get_idle_queue(self) -> asyncio.Queue:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for process in self._initial_processes:
+                self._idle.put_nowait(process)
+            self._initial_processes = []
+        return self._idle
+
+    async def render(self, module_version, input_result,
+                     params: Dict[str, Any], tab_name: str,
+                     fetch_result) -> 'ProcessResult':
+        """
+        Render in a child process; return a ProcessResult.
+
+        Like `LoadedModule.render()`, this never raises: a crash or timeout
+        becomes an error message. In either case we replace the process.
+        """
+        from cjworkbench.types import ProcessResult
+
+        message = _dumps((module_version, input_result, params, tab_name,
+                          fetch_result))
+
+        idle = self._get_idle_queue()
+        process = await idle.get()
+        loop = asyncio.get_event_loop()
+        try:
+            response = await loop.run_in_executor(None, process.render,
+                                                  message, self.time_limit)
+        except (EOFError, OSError):
+            logger.exception('Render process died rendering %s',
+                             module_version.id_name)
+            self._replace(process)
+            return ProcessResult(error=(
+                'The module crashed. It may have run out of memory.'
+            ))
+        except BaseException:
+            # e.g., CancelledError. We don't know the process's state.
+            self._replace(process)
+            raise
+
+        if response is None:
+            logger.info('Render of %s timed out after %ds',
+                        module_version.id_name, self.time_limit)
+            self._replace(process)
+            return ProcessResult(error=(
+                'The module took longer than %d seconds to render, so we '
+                'stopped it.' % self.time_limit
+            ))
+
+        idle.put_nowait(process)
+        return pickle.loads(response)
+
+    def _replace(self, process: RenderProcess) -> None:
+        """Kill `process` and add a new one to the idle queue."""
+        self._processes.discard(process)
+        process.kill()
+        self._idle.put_nowait(self._spawn())
+
+
+_pool: Optional[RenderPool] = None
+
+
+def start(n_processes: int, time_limit: float, memory_limit: int = 0) -> None:
+    """
+    Make `get_pool()` return a RenderPool.
+
+    Call this on startup, before opening any connections. The pool closes
+    when the interpreter exits.
+    """
+    global _pool
+    _pool = RenderPool(n_processes, time_limit, memory_limit)
+    # Registered after multiprocessing's own exit handler, so it runs first:
+    # multiprocessing would wait forever for our processes to exit.
+    atexit.register(_pool.close)
+
+
+def get_pool() -> Optional[RenderPool]:
+    """
+    Return the RenderPool, or `None` if we render on threads.
+    """
+    return _pool
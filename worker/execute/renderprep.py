@@ -57,11 +57,16 @@ class RenderContext:
         self.input_table_shape = input_table_shape
         self.tab_shapes = tab_shapes
         self.params = params
+        self._input_columns = None  # lazy: only column params read it
 
     def output_columns_for_tab_parameter(self, tab_parameter):
         if tab_parameter is None:
-            # Common case: param selects from the input table
-            return {c.name: c for c in self.input_table_shape.columns}
+            # Common case: param selects from the input table. A
+            # multichartseries asks once per series, so build this once.
+            if self._input_columns is None:
+                self._input_columns = {c.name: c for c
+                                       in self.input_table_shape.columns}
+            return self._input_columns
 
         # Rare case: there's a "tab" parameter, and the column selector is
         # selecting from _that_ tab's output columns.
@@ -83,7 +88,7 @@ class RenderContext:
 
 def get_param_values(
     params: Params,
-    context: RenderContext,
+    context: Optional[RenderContext],
 ) -> Dict[str, Any]:
     """
     Convert `params` to a dict we'll pass to a module `render()` function.
@@ -98,6 +103,9 @@ def get_param_values(
         * Raise `PromptingError` if a chosen column is of the wrong type
           (so the caller can render a ProcessResult with errors and quickfixes)
 
+    `context` may be `None` if the schema has no tab or column params
+    (see `CompiledSchema`): then nothing reads it.
+
     This uses database connections, and it's slow! (It needs to load input tab
     data.) Be sure the Workflow is locked while you call it.
     """
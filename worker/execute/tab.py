@@ -1,3 +1,4 @@
+import asyncio
 from functools import lru_cache
 import logging
 from typing import Dict, List, Optional, Set, Tuple
@@ -5,7 +6,10 @@ from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import ProcessResult, StepResultShape
 from server.models import Params, WfModule, Workflow, Tab
 from server.models.param_spec import ParamDType
-from .wf_module import execute_wfmodule, locked_wf_module
+from . import fingerprint
+from .wf_module import execute_wfmodule_pipelined, \
+        find_reusable_render_result, locked_wf_module, \
+        reuse_wfmodule_pipelined
 
 
 _memoize = lru_cache(maxsize=1)
@@ -88,6 +92,12 @@ class TabFlow:
         """
         ret = set()
         for wf_module, params in self.steps:
+            module_version = wf_module.module_version
+            if (
+                module_version is None
+                or not module_version.compiled_schema.has_tab_params
+            ):
+                continue
             schema = params.schema
             slugs = set(schema.find_leaf_values_with_dtype(ParamDType.Tab,
                                                            params.values))
@@ -96,29 +106,63 @@ class TabFlow:
 
 
 @database_sync_to_async
-def _load_input_from_cache(workflow: Workflow,
-                           flow: TabFlow) -> ProcessResult:
+def _load_result_from_cache(
+    workflow: Workflow,
+    wf_module: WfModule
+) -> Tuple[ProcessResult, Optional[str]]:
+    """
+    Read `wf_module`'s fresh cached result and its fingerprint (if stored).
+    """
+    # raises UnneededExecution
+    with locked_wf_module(workflow, wf_module) as safe_wfm:
+        crr = safe_wfm.cached_render_result
+        assert crr is not None  # otherwise it's not fresh, see?
+
+        # Read the entire input Parquet file.
+        return (crr.result, crr.fingerprint)
+
+
+async def _load_input_from_cache(
+    workflow: Workflow,
+    flow: TabFlow
+) -> Tuple[ProcessResult, Optional[str]]:
+    """
+    Read the input to `flow.stale_steps[0]`, and its fingerprint.
+
+    The fingerprint is `None` if there are no stale steps.
+    """
     last_fresh_wfm = flow.last_fresh_wf_module
     if last_fresh_wfm is None:
-        return ProcessResult()
+        result, result_fingerprint = ProcessResult(), None
     else:
         # raises UnneededExecution
-        with locked_wf_module(workflow, last_fresh_wfm) as safe_wfm:
-            crr = safe_wfm.cached_render_result
-            assert crr is not None  # otherwise it's not fresh, see?
+        result, result_fingerprint = await _load_result_from_cache(
+            workflow,
+            last_fresh_wfm
+        )
+
+    if result_fingerprint is None and flow.stale_steps:
+        # It was cached before we stored fingerprints
+        loop = asyncio.get_event_loop()
+        result_fingerprint = await loop.run_in_executor(
+            None,
+            fingerprint.result_fingerprint,
+            result
+        )
 
-            # Read the entire input Parquet file.
-            return crr.result
+    return result, result_fingerprint
 
 
 async def execute_tab_flow(
     workflow: Workflow,
     flow: TabFlow,
     tab_shapes: Dict[str, Optional[StepResultShape]]
-) -> ProcessResult:
+) -> StepResultShape:
     """
     Ensure `flow.tab.live_wf_modules` all cache fresh render results.
 
+    Return the shape of the tab's output.
+
     `tab_shapes.keys()` must be ordered as the Workflow's tabs are.
 
     Raise `UnneededExecution` if something changes underneath us such that we
@@ -131,14 +175,95 @@ async def execute_tab_flow(
     logger.debug('Rendering Tab(%d, %s - %s)', workflow.id, flow.tab_slug,
                  flow.tab.name)
 
+    if not flow.stale_steps:
+        # Nothing to render: we're an input into another tab. Our output is
+        # the last step's, which we loaded along with `flow` -- no need to
+        # read its table.
+        wf_module = flow.last_fresh_wf_module
+        if wf_module is None:
+            result = ProcessResult()
+            return StepResultShape(result.status, result.table_shape)
+        crr = wf_module.cached_render_result
+        return StepResultShape(crr.status, crr.table_shape)
+
     # Execute one module at a time.
     #
     # We don't hold any lock throughout the loop: the loop can take a long
     # time; it might be run multiple times simultaneously (even on
     # different computers); and `await` doesn't work with locks.
-    last_result = await _load_input_from_cache(workflow, flow)
-    for wf_module, params in flow.stale_steps:
-        last_result = await execute_wfmodule(workflow, wf_module, params,
-                                             flow.tab_name, last_result,
-                                             tab_shapes)
-    return last_result
+    #
+    # Steps are pipelined: we feed each step's output straight into the next
+    # step's render while the previous output is still being saved. Each
+    # in-progress save holds its result in RAM until it's done.
+    #
+    # If a step's input fingerprint matches its stale cached result's, we
+    # reuse that result instead of rendering. (Typically, a fetch returned the
+    # same data as last time, and every later step would reproduce its
+    # previous output.) We only read a reused result from S3 if a later step
+    # needs to render with it.
+    last_result, last_fingerprint = await _load_input_from_cache(workflow,
+                                                                 flow)
+    # When last_result is None, we reused `reused_wf_module`'s cached result
+    # and haven't read it.
+    last_shape = None
+    reused_wf_module = None
+    saves = []
+    try:
+        for wf_module, params in flow.stale_steps:
+            # If a save found the tab is stale, stop rendering the rest
+            for save in saves:
+                if save.done() and save.exception() is not None:
+                    raise save.exception()
+
+            previous_save = saves[-1] if saves else None
+
+            input_fingerprint, stale_result = \
+                await find_reusable_render_result(workflow, wf_module,
+                                                  params, flow.tab_name,
+                                                  last_fingerprint)
+            if stale_result is not None:
+                save = reuse_wfmodule_pipelined(workflow, wf_module,
+                                                stale_result, previous_save)
+                saves.append(save)
+                last_result = None
+                last_fingerprint = stale_result.fingerprint
+                last_shape = StepResultShape(stale_result.status,
+                                             stale_result.table_shape)
+                reused_wf_module = wf_module
+                continue
+
+            if last_result is None:
+                # We reused the previous step's result; now we need its data.
+                # Wait for it to be fresh, then read it.
+                await previous_save  # may raise UnneededExecution
+                last_result, _ = await _load_result_from_cache(
+                    workflow,
+                    reused_wf_module
+                )
+
+            last_result, last_fingerprint, save = \
+                await execute_wfmodule_pipelined(
+                    workflow,
+                    wf_module,
+                    params,
+                    flow.tab_name,
+                    last_result,
+                    tab_shapes,
+                    previous_save,
+                    input_fingerprint
+                )
+            saves.append(save)
+    finally:
+        # Other tabs read our output from the database, and our caller assumes
+        # we're finished when we return. So wait for every save -- even if
+        # rendering failed, because earlier saves are still valid.
+        save_results = await asyncio.gather(*saves, return_exceptions=True)
+
+    for save_result in save_results:
+        if isinstance(save_result, BaseException):
+            raise save_result  # e.g., UnneededExecution
+
+    if last_result is None:
+        return last_shape
+    else:
+        return StepResultShape(last_result.status, last_result.table_shape)
@@ -4,13 +4,15 @@ import datetime
 from typing import Any, Dict, Optional, Tuple
 from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import ProcessResult, StepResultShape, TableShape
-from server import notifications
-from server.models import LoadedModule, Params, WfModule, Workflow
+from server import notifications, parquet
+from server.models import CachedRenderResult, LoadedModule, Params, \
+        WfModule, Workflow
 from server.notifications import OutputDelta
+from server.pandas_util import hash_table_contents
 from server import websockets
 from .types import TabCycleError, TabOutputUnreachableError, \
         UnneededExecution, PromptingError
-from . import renderprep
+from . import fingerprint, renderpool, renderprep
 
 
 @contextlib.contextmanager
@@ -60,7 +62,9 @@ def _execute_wfmodule_pre(
     First step of execute_wfmodule().
 
     Return a Tuple in this order:
-        * loaded_module: a ModuleVersion for dispatching render
+        * module_version: the ModuleVersion to render
+        * loaded_module: a LoadedModule for dispatching render (or `None` if
+          we'll render in a `renderpool` process, which loads its own)
         * fetch_result: optional ProcessResult for dispatching render
         * param_values: a dict for dispatching render
 
@@ -80,24 +84,57 @@ def _execute_wfmodule_pre(
     with locked_wf_module(workflow, wf_module) as safe_wf_module:
         module_version = safe_wf_module.module_version
         fetch_result = safe_wf_module.get_fetch_result()
-        render_context = renderprep.RenderContext(
-            workflow.id,
-            input_table_shape,
-            tab_shapes,
-            params  # ugh
-        )
+        if (
+            module_version is not None
+            and not module_version.compiled_schema.has_tab_params
+            and not module_version.compiled_schema.has_column_params
+        ):
+            # No param reads input columns or other tabs: cleaning only
+            # coerces values, and needs no context.
+            render_context = None
+        else:
+            render_context = renderprep.RenderContext(
+                workflow.id,
+                input_table_shape,
+                tab_shapes,
+                params  # ugh
+            )
         param_values = renderprep.get_param_values(params, render_context)
-        loaded_module = LoadedModule.for_module_version_sync(module_version)
+        if renderpool.get_pool() is None:
+            loaded_module = LoadedModule.for_module_version_sync(
+                module_version
+            )
+        else:
+            loaded_module = None
+
+        return (module_version, loaded_module, fetch_result, param_values)
+
 
-        return (loaded_module, fetch_result, param_values)
+def _write_parquet(workflow: Workflow, wf_module: WfModule, delta_id: int,
+                   result: ProcessResult,
+                   table_hash: str) -> Tuple[str, parquet.FileInfo]:
+    """
+    Upload `result` to S3, without touching the database.
+
+    This is the slow part of saving. It needs no lock, so it needn't block
+    other steps' database work.
+    """
+    return CachedRenderResult.write_parquet(workflow.id, wf_module.id,
+                                            delta_id, result, table_hash)
 
 
 @database_sync_to_async
 def _execute_wfmodule_save(workflow: Workflow, wf_module: WfModule,
-                           result: ProcessResult) -> OutputDelta:
+                           result: ProcessResult,
+                           blob: Tuple[str, parquet.FileInfo],
+                           output_fingerprint: str,
+                           input_fingerprint: Optional[str]) -> OutputDelta:
     """
     Call wf_module.cache_render_result() and build OutputDelta.
 
+    `blob` is the key and FileInfo of the Parquet file we already uploaded; we
+    commit to the database only after that upload succeeded.
+
     All this runs synchronously within a database lock. (It's a separate
     function so that when we're done awaiting it, we can continue executing in
     a context that doesn't use a database thread.)
@@ -118,7 +155,10 @@ def _execute_wfmodule_save(workflow: Workflow, wf_module: WfModule,
 
         safe_wf_module.cache_render_result(
             safe_wf_module.last_relevant_delta_id,
-            result
+            result,
+            blob,
+            fingerprint=output_fingerprint,
+            input_fingerprint=input_fingerprint
         )
 
         if safe_wf_module.notifications and result != stale_result:
@@ -130,6 +170,210 @@ def _execute_wfmodule_save(workflow: Workflow, wf_module: WfModule,
             return None  # nothing to email
 
 
+async def _save_wfmodule_and_notify(
+    workflow: Workflow,
+    wf_module: WfModule,
+    delta_id: int,
+    result: ProcessResult,
+    table_hash: str,
+    output_fingerprint: str,
+    input_fingerprint: Optional[str],
+    previous_save: Optional[asyncio.Task]
+) -> None:
+    """
+    Cache `result`, then tell websocket clients and email users about it.
+
+    Uploads may run concurrently; but we only commit after `previous_save` is
+    done, so steps become fresh in order.
+
+    Raise UnneededExecution if the WfModule has changed in the interim.
+    """
+    # Upload outside of any database lock
+    loop = asyncio.get_event_loop()
+    blob = await loop.run_in_executor(None, _write_parquet, workflow,
+                                      wf_module, delta_id, result, table_hash)
+
+    if previous_save is not None:
+        # Wait, but ignore its errors: our caller will see them
+        await asyncio.wait({previous_save})
+
+    # may raise UnneededExecution
+    output_delta = await _execute_wfmodule_save(workflow, wf_module, result,
+                                                blob, output_fingerprint,
+                                                input_fingerprint)
+
+    await websockets.ws_client_send_delta_async(workflow.id, {
+        'updateWfModules': {
+            str(wf_module.id): build_status_dict(result, delta_id)
+        }
+    })
+
+    # Email notification if data has changed. Do this outside of the database
+    # lock, because SMTP can be slow, and Django's email backend is
+    # synchronous.
+    if output_delta:
+        await loop.run_in_executor(None, notifications.email_output_delta,
+                                   output_delta, datetime.datetime.now())
+
+
+@database_sync_to_async
+def _find_reusable_render_result(
+    workflow: Workflow,
+    wf_module: WfModule,
+    params: Params,
+    tab_name: str,
+    input_result_fingerprint: str
+) -> Tuple[Optional[str], Optional[CachedRenderResult]]:
+    """
+    Fingerprint `wf_module`'s render input; find a stale result that matches.
+
+    Return `(input_fingerprint, stale_result)`. Either may be `None`.
+
+    Raise UnneededExecution if the WfModule has changed in the interim.
+    """
+    # raises UnneededExecution
+    with locked_wf_module(workflow, wf_module) as safe_wf_module:
+        input_fingerprint = fingerprint.input_fingerprint(
+            safe_wf_module.module_version,
+            params.values,
+            tab_name,
+            (safe_wf_module.stored_data_version, safe_wf_module.fetch_error),
+            input_result_fingerprint
+        )
+        if input_fingerprint is None:
+            return (None, None)
+
+        stale_result = safe_wf_module.get_stale_cached_render_result()
+        if (
+            stale_result is None
+            or stale_result.input_fingerprint != input_fingerprint
+            or stale_result.fingerprint is None
+        ):
+            return (input_fingerprint, None)
+
+        return (input_fingerprint, stale_result)
+
+
+async def find_reusable_render_result(
+    workflow: Workflow,
+    wf_module: WfModule,
+    params: Params,
+    tab_name: str,
+    input_result_fingerprint: Optional[str]
+) -> Tuple[Optional[str], Optional[CachedRenderResult]]:
+    """
+    Decide whether rendering `wf_module` would merely reproduce its stale
+    cached result.
+
+    Return `(input_fingerprint, stale_result)`:
+
+    * `input_fingerprint` summarizes everything `render()` would see. Pass it
+      to `execute_wfmodule_pipelined()` so the next render can compare. It's
+      `None` if we can't compute it -- e.g., if the step has tab params, so its
+      input includes other tabs' output.
+    * `stale_result` is a stale cached result rendered from identical input, or
+      `None`. Pass it to `reuse_wfmodule_pipelined()` instead of rendering.
+
+    Pass `input_result_fingerprint=None` if the previous step's output has no
+    fingerprint.
+
+    Raise UnneededExecution if the WfModule has changed in the interim.
+    """
+    if input_result_fingerprint is None:
+        return (None, None)
+
+    module_version = wf_module.module_version
+    if (
+        module_version is not None
+        and module_version.compiled_schema.has_tab_params
+    ):
+        return (None, None)
+
+    return await _find_reusable_render_result(workflow, wf_module, params,
+                                              tab_name,
+                                              input_result_fingerprint)
+
+
+@database_sync_to_async
+def _execute_wfmodule_reuse(workflow: Workflow, wf_module: WfModule,
+                            stale_result: CachedRenderResult
+                            ) -> CachedRenderResult:
+    """
+    Call wf_module.reuse_stale_render_result(), within a database lock.
+
+    Raise UnneededExecution if the WfModule has changed in the interim.
+    """
+    # raises UnneededExecution
+    with locked_wf_module(workflow, wf_module) as safe_wf_module:
+        cached_result = safe_wf_module.cached_render_result
+        if cached_result is not None:
+            return cached_result  # another worker rendered it meanwhile
+
+        if (
+            safe_wf_module.cached_render_result_delta_id
+            != stale_result.delta_id
+        ):
+            # Someone replaced the stale result. We don't know what's in the
+            # database, so we can't call our render "current".
+            raise UnneededExecution
+
+        return safe_wf_module.reuse_stale_render_result(stale_result)
+
+
+async def _reuse_wfmodule_and_notify(
+    workflow: Workflow,
+    wf_module: WfModule,
+    stale_result: CachedRenderResult,
+    previous_save: Optional[asyncio.Task]
+) -> CachedRenderResult:
+    """
+    Make `stale_result` fresh, then tell websocket clients about it.
+
+    Like `_save_wfmodule_and_notify()`, we only commit after `previous_save`
+    is done. There's no email: the output hasn't changed.
+
+    Return the fresh CachedRenderResult.
+
+    Raise UnneededExecution if the WfModule has changed in the interim.
+    """
+    if previous_save is not None:
+        # Wait, but ignore its errors: our caller will see them
+        await asyncio.wait({previous_save})
+
+    # may raise UnneededExecution
+    cached_result = await _execute_wfmodule_reuse(workflow, wf_module,
+                                                  stale_result)
+
+    await websockets.ws_client_send_delta_async(workflow.id, {
+        'updateWfModules': {
+            str(wf_module.id): build_cached_status_dict(cached_result)
+        }
+    })
+
+    return cached_result
+
+
+def reuse_wfmodule_pipelined(
+    workflow: Workflow,
+    wf_module: WfModule,
+    stale_result: CachedRenderResult,
+    previous_save: Optional[asyncio.Task] = None
+) -> asyncio.Task:
+    """
+    Return a Task that makes `stale_result` `wf_module`'s fresh result.
+
+    Call this instead of `execute_wfmodule_pipelined()` when
+    `find_reusable_render_result()` finds a stale result. The Task's result is
+    the fresh CachedRenderResult, whose output fingerprint is
+    `stale_result.fingerprint`. The caller must await the Task: it raises
+    UnneededExecution if the WfModule changed in the interim.
+    """
+    return asyncio.ensure_future(
+        _reuse_wfmodule_and_notify(workflow, wf_module, stale_result,
+                                   previous_save)
+    )
+
+
 async def _render_wfmodule(
     workflow: Workflow,
     wf_module: WfModule,
@@ -141,14 +385,14 @@ async def _render_wfmodule(
     """
     Prepare and call `wf_module`'s `render()`; return a ProcessResult.
 
-    The actual render runs in a background thread so the event loop can process
-    other events.
+    The actual render runs in a `renderpool` process if there is a pool, or a
+    background thread otherwise, so the event loop can process other events.
     """
     if wf_module.order > 0 and input_result.status != 'ok':
         return ProcessResult()  # 'unreachable'
 
     try:
-        loaded_module, fetch_result, param_values = (
+        module_version, loaded_module, fetch_result, param_values = (
             await _execute_wfmodule_pre(workflow, wf_module, params,
                                         input_result.table_shape, tab_shapes)
         )
@@ -167,6 +411,11 @@ async def _render_wfmodule(
             quick_fixes=err.as_quick_fixes()
         )
 
+    pool = renderpool.get_pool()
+    if pool is not None:
+        return await pool.render(module_version, input_result, param_values,
+                                 tab_name, fetch_result)
+
     # Render may take a while. run_in_executor to push that slowdown to a
     # thread and keep our event loop responsive.
     loop = asyncio.get_event_loop()
@@ -209,6 +458,46 @@ async def execute_wfmodule(
     * When a user changes a workflow significantly, all prior renders will end
       relatively cheaply.
 
+    Raises `UnneededExecution` when the input WfModule should not be rendered.
+    """
+    result, _, save = await execute_wfmodule_pipelined(workflow, wf_module,
+                                                       params, tab_name,
+                                                       input_result,
+                                                       tab_shapes)
+    # may raise UnneededExecution
+    await save
+
+    # To skip re-rendering later steps when this output hasn't changed, see
+    # `find_reusable_render_result()` and `execute_tab_flow()`.
+    return result
+
+
+async def execute_wfmodule_pipelined(
+    workflow: Workflow,
+    wf_module: WfModule,
+    params: Params,
+    tab_name: str,
+    input_result: ProcessResult,
+    tab_shapes: Dict[str, Optional[StepResultShape]],
+    previous_save: Optional[asyncio.Task] = None,
+    input_fingerprint: Optional[str] = None
+) -> Tuple[ProcessResult, str, asyncio.Task]:
+    """
+    Render a single WfModule; return output, its fingerprint and a Task that
+    caches it.
+
+    The caller may feed the output into the next step's render right away,
+    while the Task uploads the Parquet file, commits
+    `cached_render_result_delta_id` and notifies websocket clients (in that
+    order). The caller must await the Task: it raises UnneededExecution if the
+    WfModule changed while rendering.
+
+    Pass the previous step's Task as `previous_save`: this step's result will
+    be committed after that one's.
+
+    Pass `input_fingerprint` from `find_reusable_render_result()`: we store it
+    with the result, so a future render with the same input can reuse it.
+
     Raises `UnneededExecution` when the input WfModule should not be rendered.
     """
     # delta_id won't change throughout this function
@@ -218,27 +507,18 @@ async def execute_wfmodule(
     result = await _render_wfmodule(workflow, wf_module, params, tab_name,
                                     input_result, tab_shapes)
 
-    # may raise UnneededExecution
-    output_delta = await _execute_wfmodule_save(workflow, wf_module, result)
-
-    await websockets.ws_client_send_delta_async(workflow.id, {
-        'updateWfModules': {
-            str(wf_module.id): build_status_dict(result, delta_id)
-        }
-    })
-
-    # Email notification if data has changed. Do this outside of the database
-    # lock, because SMTP can be slow, and Django's email backend is
-    # synchronous.
-    if output_delta:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, notifications.email_output_delta,
-                                   output_delta, datetime.datetime.now())
+    # Hash the table once: it's both the blob key and part of the fingerprint
+    loop = asyncio.get_event_loop()
+    table_hash = await loop.run_in_executor(None, hash_table_contents,
+                                            result.dataframe)
+    output_fingerprint = fingerprint.result_fingerprint(result, table_hash)
 
-    # TODO if there's no change, is it possible for us to skip the render
-    # of future modules, setting their cached_render_result_delta_id =
-    # last_relevant_delta_id?  Investigate whether this is worthwhile.
-    return result
+    save = asyncio.ensure_future(
+        _save_wfmodule_and_notify(workflow, wf_module, delta_id, result,
+                                  table_hash, output_fingerprint,
+                                  input_fingerprint, previous_save)
+    )
+    return result, output_fingerprint, save
 
 
 def build_status_dict(result: ProcessResult, delta_id: int) -> Dict[str, Any]:
@@ -252,3 +532,20 @@ def build_status_dict(result: ProcessResult, delta_id: int) -> Dict[str, Any]:
         'output_n_rows': len(result.dataframe),
         'cached_render_result_delta_id': delta_id,
     }
+
+
+def build_cached_status_dict(cached_result: CachedRenderResult
+                             ) -> Dict[str, Any]:
+    """
+    Like `build_status_dict()`, but without reading the Parquet file.
+    """
+    quick_fixes = [qf.to_dict() for qf in cached_result.quick_fixes]
+
+    return {
+        'quick_fixes': quick_fixes,
+        'output_columns': [c.to_dict() for c in cached_result.columns],
+        'output_error': cached_result.error,
+        'output_status': cached_result.status,
+        'output_n_rows': cached_result.nrows,
+        'cached_render_result_delta_id': cached_result.delta_id,
+    }
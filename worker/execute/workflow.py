@@ -1,30 +1,83 @@
-from typing import Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db.models import F
 from cjworkbench.sync import database_sync_to_async
 from cjworkbench.types import StepResultShape
-from server.models import Workflow
+from server.models import Tab, WfModule, Workflow
 from .tab import TabFlow, execute_tab_flow
 from .types import UnneededExecution
 
 
+# MaxParallelTabs: number of tabs in a single workflow to render
+# simultaneously. Each tab renders its steps one after another; independent
+# tabs may render at the same time, on different threads.
+#
+# Default is 4: much of a tab's render is waiting -- on the database, on S3
+# and on render processes -- so a few tabs overlap well even on a 2-CPU
+# machine. Each running tab holds its current table in memory, so keep this
+# small. Set 1 to render tabs one after another, in tab order.
+MaxParallelTabs = int(os.getenv('CJW_WORKER_MAX_PARALLEL_TABS', 4))
+
+
 @database_sync_to_async
-def _load_tab_flows(workflow: Workflow, delta_id: int) -> List[TabFlow]:
+def _load_tab_flows(workflow: Workflow,
+                    delta_id: int) -> Tuple[List[str], List[TabFlow]]:
     """
-    Query `workflow` for each tab's `TabFlow` (ordered by tab position).
+    Query `workflow` for `(tab_slugs, flows)`.
+
+    `tab_slugs` lists all the workflow's tabs (ordered by tab position).
+    `flows` are the `TabFlow`s that need rendering (also ordered by tab
+    position): tabs with stale steps, plus the tabs they read as input.
+
+    Commands mark every step they affect -- and, through the workflow's
+    `DependencyGraph`, every step that depends on those -- by bumping its
+    `last_relevant_delta_id`. So a step is stale if and only if its
+    `cached_render_result_delta_id` differs; and a tab with no stale steps and
+    no stale dependents needn't be loaded at all.
     """
-    ret = []
     with workflow.cooperative_lock():  # reloads workflow
         if workflow.last_delta_id != delta_id:
             raise UnneededExecution
 
-        for tab in workflow.live_tabs.all():
+        tabs = list(workflow.live_tabs.all())
+        stale_tab_ids = frozenset(
+            WfModule.live_in_workflow(workflow)
+            .exclude(
+                cached_render_result_delta_id=F('last_relevant_delta_id')
+            )
+            .values_list('tab_id', flat=True)
+        )
+
+        def load_flow(tab: Tab) -> TabFlow:
             steps = [(wfm, wfm.get_params())
                      for wfm in tab.live_wf_modules.all()]
-            ret.append(TabFlow(tab, steps))
-    return ret
+            return TabFlow(tab, steps)
+
+        flows = {tab.id: load_flow(tab)
+                 for tab in tabs
+                 if tab.id in stale_tab_ids}
+
+        # Stale steps may read other tabs' outputs. Load those tabs, too, so
+        # `execute_workflow()` can order tabs and detect cycles. (If they're
+        # fresh, "rendering" them only reads their output shapes.)
+        tabs_by_slug = {tab.slug: tab for tab in tabs}
+        for flow in list(flows.values()):
+            for slug in flow.input_tab_slugs:
+                tab = tabs_by_slug.get(slug)  # None if tab does not exist
+                if tab is not None and tab.id not in flows:
+                    flows[tab.id] = load_flow(tab)
+
+    return (
+        [tab.slug for tab in tabs],
+        [flows[tab.id] for tab in tabs if tab.id in flows]
+    )
 
 
 def partition_ready_and_dependent(
-    flows: List[TabFlow]
+    flows: List[TabFlow],
+    rendering_flows: Iterable[TabFlow] = ()
 ) -> Tuple[List[TabFlow], List[TabFlow]]:
     """
     Find `(ready_flows, dependent_flows)` from `flows`.
@@ -32,14 +85,18 @@ def partition_ready_and_dependent(
     "Ready" TabFlows are TabFlows that don't depend on not-yet-rendered Tabs.
 
     "Dependent" TabFlows are TabFlows that have one or more Tab parameters that
-    refer to Tabs that haven't been rendered.
+    refer to Tabs that haven't been rendered. Tabs in `flows` haven't been
+    rendered; neither have tabs in `rendering_flows` (which we're rendering
+    right now).
 
     Tab parameters with no value -- and Tab parameters that point to
     nonexistent Tabs -- are treated as "ready". (This lets us optimize
     cleverly: we don't even need to know the list of already-rendered tabs to
     know whether a TabFlow is ready.)
     """
-    pending_tab_slugs = set(flow.tab_slug for flow in flows)
+    pending_tab_slugs = set(flow.tab_slug
+                            for flow in itertools.chain(flows,
+                                                        rendering_flows))
 
     ready = []
     dependent = []
@@ -51,18 +108,29 @@ def partition_ready_and_dependent(
     return (ready, dependent)
 
 
-async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
+async def execute_workflow(workflow: Workflow, delta_id: int,
+                           max_parallel_tabs: Optional[int] = None) -> None:
     """
     Ensure all `workflow.tabs[*].live_wf_modules` cache fresh render results.
 
+    Only tabs with stale steps are rendered; tabs that are fresh (and aren't
+    inputs into stale steps) aren't even loaded.
+
+    Render up to `max_parallel_tabs` tabs at a time (default
+    `MaxParallelTabs`). A tab starts rendering as soon as all the tabs it
+    depends upon have finished rendering.
+
     Raise UnneededExecution if the inputs become stale (at which point we don't
     care about results any more).
 
     WEBSOCKET NOTES: each wf_module is executed in turn. After each execution,
     we notify clients of its new columns and status.
     """
+    if max_parallel_tabs is None:
+        max_parallel_tabs = MaxParallelTabs
+
     # raises UnneededExecution
-    pending_tab_flows = await _load_tab_flows(workflow, delta_id)
+    tab_slugs, pending_tab_flows = await _load_tab_flows(workflow, delta_id)
 
     # tab_shapes: keep track of outputs of each tab. (Outputs are used as
     # inputs into other tabs.) Before render begins, all outputs are `None`.
@@ -70,36 +138,60 @@ async def execute_workflow(workflow: Workflow, delta_id: int) -> None:
     # `tab_shape` we haven't rendered yet, that's because it _couldn't_ be
     # rendered first -- prompting a `TabCycleError`.
     #
-    # `tab_shapes.keys()` returns tab slugs in the Workflow's tab order -- that
-    # is, the order the user determines.
+    # `tab_shapes.keys()` returns all tab slugs in the Workflow's tab order --
+    # that is, the order the user determines. Tabs we didn't load stay `None`:
+    # no stale step reads them.
     tab_shapes: Dict[str, Optional[StepResultShape]] = dict(
-        (flow.tab_slug, None)
-        for flow in pending_tab_flows
+        (tab_slug, None)
+        for tab_slug in tab_slugs
     )
 
-    # Execute one tab_flow at a time.
+    # Execute up to max_parallel_tabs tab_flows at a time.
     #
     # We don't hold a DB lock throughout the loop: the loop can take a long
     # time; it might be run multiple times simultaneously (even on different
     # computers); and `await` doesn't work with locks.
-
-    while pending_tab_flows:
-        ready_flows, dependent_flows = partition_ready_and_dependent(
-            pending_tab_flows
-        )
-
-        if not ready_flows:
-            # All flows are dependent -- meaning they all have cycles. Execute
-            # them last; they can detect their cycles through `tab_shapes`.
+    rendering: Dict[asyncio.Task, TabFlow] = {}
+    error = None
+    while True:
+        if error is None:
+            ready_flows, _ = partition_ready_and_dependent(
+                pending_tab_flows,
+                rendering.values()
+            )
+            n_to_start = max_parallel_tabs - len(rendering)
+            started_flows = ready_flows[:n_to_start]
+            for tab_flow in started_flows:
+                task = asyncio.ensure_future(
+                    execute_tab_flow(workflow, tab_flow, tab_shapes)
+                )
+                rendering[task] = tab_flow
+            # iterate -- keeping tab order
+            pending_tab_flows = [flow for flow in pending_tab_flows
+                                 if flow not in started_flows]
+
+        if not rendering:
+            # Either we're done, or all remaining flows are dependent --
+            # meaning they all have cycles. Execute them last; they can detect
+            # their cycles through `tab_shapes`.
             break
 
-        for tab_flow in ready_flows:
-            result = await execute_tab_flow(workflow, tab_flow, tab_shapes)
-            tab_shape = StepResultShape(result.status, result.table_shape)
-            del result  # recover ram
+        done, _ = await asyncio.wait(rendering.keys(),
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            tab_flow = rendering.pop(task)
+            try:
+                tab_shape = task.result()
+            except Exception as err:
+                # Stop starting new tabs. Let the others finish (they may be
+                # mid-save), then raise.
+                if error is None:
+                    error = err
+                continue
             tab_shapes[tab_flow.tab_slug] = tab_shape
 
-        pending_tab_flows = dependent_flows  # iterate
+    if error is not None:
+        raise error  # e.g., UnneededExecution
 
     # Now, `pending_tab_flows` only contains flows with cycles. Execute them,
     # but don't update `tab_shapes` because none of them should see the output
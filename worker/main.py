@@ -2,10 +2,13 @@ import asyncio
 import logging
 import os
 from cjworkbench import rabbitmq
+from server.migrated_params_cache import migrated_params_cache
+from server.render_cache import render_cache
 from .pg_locker import PgLocker
 from .fetch import handle_fetch
 from .upload_DELETEME import handle_upload_DELETEME
-from .render import handle_render
+from .render import RenderQueue
+from .execute import renderpool
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +27,16 @@ logger = logging.getLogger(__name__)
 # for cron-render.
 NRenderers = int(os.getenv('CJW_WORKER_N_RENDERERS', 1))
 
+# RenderPrefetch: number of render requests to hold (unacked) from RabbitMQ.
+# The worker coalesces pending requests per workflow and renders interactive
+# requests before background ones; it can only do that with requests it has
+# received. Messages are tiny, but every request we hold is one another worker
+# can't start.
+#
+# Default is 20: plenty to absorb a burst of edits, not so many that one worker
+# hoards the queue.
+RenderPrefetch = int(os.getenv('CJW_WORKER_RENDER_PREFETCH', 20))
+
 # NFetchers: number of fetches to perform simultaneously. Fetching is
 # often I/O-heavy, and some of our dependencies use blocking calls, so we
 # allocate a thread per fetcher. Larger files may use lots of RAM.
@@ -34,27 +47,81 @@ NFetchers = int(os.getenv('CJW_WORKER_N_FETCHERS', 3))
 
 # NUploaders: number of uploaded files to process at a time. TODO turn these
 # into fetches - https://www.pivotaltracker.com/story/show/161509317. We handle
-# the occasional 1GB+ file, which will consume ~3GB of RAM, so let's keep this
-# number at 1
+# the occasional 1GB+ file. CSV parsing reads it in chunks and keeps at most
+# MAX_ROWS_PER_TABLE dictionary-encoded rows in at most MAX_BYTES_PER_TABLE of
+# RAM (plus a chunk), whatever the file's size -- but Excel and JSON files are
+# still read all at once, so they cost RAM in proportion to their size.
 #
 # Default is 1: we don't expect many uploads.
 NUploaders = int(os.getenv('CJW_WORKER_N_UPLOADERS', 1))
 
+# RenderCacheBytes: RAM to spend on keeping recently-written and recently-read
+# render results in memory, so the next step (or a tab that joins this tab)
+# needn't download and decode the Parquet file we just wrote. 0 disables.
+#
+# Default is 256MB: enough for the last outputs of a few typical tabs.
+RenderCacheBytes = int(os.getenv('CJW_WORKER_RENDER_CACHE_BYTES',
+                                 256 * 1024 * 1024))
+
+# NRenderProcesses: number of processes to render modules in. Module render()
+# functions are CPU-bound Python: on threads, the GIL lets only one run at a
+# time. With processes, NRenderers renders can really run simultaneously. Each
+# process costs ~100MB of RAM (Django plus pandas) before it renders anything.
+#
+# Default is 0: render on threads, in this process.
+NRenderProcesses = int(os.getenv('CJW_WORKER_N_RENDER_PROCESSES', 0))
+
+# RenderTimeLimit: seconds a render process may spend on a single module
+# before we kill it and report an error. Ignored when NRenderProcesses is 0.
+#
+# Default is 300: no reasonable render takes five minutes.
+RenderTimeLimit = int(os.getenv('CJW_WORKER_RENDER_TIME_LIMIT', 300))
+
+# RenderMemoryLimit: bytes of heap a render process may allocate. A render
+# that needs more fails with an error. 0 means unlimited. Ignored when
+# NRenderProcesses is 0.
+#
+# Default is 0: we rely on the container's memory limit.
+RenderMemoryLimit = int(os.getenv('CJW_WORKER_RENDER_MEMORY_LIMIT', 0))
+
+# WriteBackMigratedParams: when 1, save each step's migrated params to the
+# database the first time we migrate them, so migrate_params() runs once per
+# module upgrade instead of once per render, fetch and page load. The stored
+# params change without a Delta, so undo restores the pre-migration params
+# (which we'll migrate and save again).
+#
+# Default is 0: params in the database are exactly what users wrote.
+WriteBackMigratedParams = bool(int(os.getenv(
+    'CJW_WORKER_WRITE_BACK_MIGRATED_PARAMS', 0
+)))
+
 
 async def main_loop():
     """
     Run fetchers and renderers, forever.
     """
-    async with PgLocker() as pg_locker:
+    render_cache.max_bytes = RenderCacheBytes
+    migrated_params_cache.write_back = WriteBackMigratedParams
+
+    if NRenderProcesses:
+        # Start the processes before we open any connections
+        renderpool.start(NRenderProcesses, RenderTimeLimit, RenderMemoryLimit)
+
+    # Each render holds a connection; leave one for other queries
+    async with PgLocker(max_connections=NRenderers + 1) as pg_locker:
+        render_queue = RenderQueue()
+        for _ in range(NRenderers):
+            asyncio.ensure_future(render_queue.run_renderer(pg_locker))
+
         @rabbitmq.acking_callback_with_requeue
         async def render_callback(*args, **kwargs):
-            return await handle_render(pg_locker, *args, **kwargs)
+            return await render_queue.handle_message(*args, **kwargs)
 
         connection = rabbitmq.get_connection()
 
         connection.declare_queue_consume(
             rabbitmq.Render,
-            NRenderers,
+            max(NRenderers, RenderPrefetch),
             render_callback
         )
         connection.declare_queue_consume(
@@ -1,6 +1,7 @@
 import asyncio
 import asyncpg
 from contextlib import asynccontextmanager
+from typing import FrozenSet, Iterable
 from django.conf import settings
 
 
@@ -21,69 +22,75 @@ class PgLocker:
             except WorkflowAlreadyLocked:
                 ...  # do something else
 
+            # Which workflows are being rendered right now? (One query.)
+            locked_ids = await locker.find_locked_workflow_ids([1, 2, 3])
+
     This client is re-entrant: it can lock multiple workflows at once.
     Double-locking a workflow will always raise WorkflowAlreadyLocked.
+
+    Connections come from a pool of up to `max_connections`. Postgres advisory
+    locks belong to a connection, so each held lock keeps its connection out
+    of the pool until it's released; other callers lock and query on other
+    connections, without waiting.
     """
 
-    def __init__(self):
-        self.pg_connection = None
-        self._pg_lock = asyncio.Lock()
+    def __init__(self, max_connections: int = 4):
+        self.max_connections = max_connections
+        self.pool = None
         self.local_held_locks = set()
 
     async def __aenter__(self) -> 'PgLocker':
-        # pg_connection: asyncpg, not Django database, because we use its
-        # transaction asynchronously. (Async is so much easier than threading.)
+        # pool: asyncpg, not Django database, because we use its transactions
+        # asynchronously. (Async is so much easier than threading.)
         pg_config = settings.DATABASES['default']
-        pg_connection = await asyncpg.connect(
+        interval = pg_config['CONN_MAX_AGE']
+        self.heartbeat_interval = interval
+        self.pool = await asyncpg.create_pool(
             host=pg_config['HOST'],
             user=pg_config['USER'],
             password=pg_config['PASSWORD'],
             database=pg_config['NAME'],
             port=pg_config['PORT'],
-            timeout=pg_config['CONN_MAX_AGE'],
-            command_timeout=pg_config['CONN_MAX_AGE']
-        )
-
-        self.pg_connection = pg_connection
-
-        loop = asyncio.get_event_loop()
-        interval = pg_config['CONN_MAX_AGE']
-        self.heartbeat_task = loop.create_task(
-            self.send_pg_heartbeats_forever(interval)
+            timeout=interval,
+            command_timeout=interval,
+            min_size=1,
+            max_size=self.max_connections,
+            # Close idle connections before anything between us and Postgres
+            # does. (Held connections send heartbeats instead.)
+            max_inactive_connection_lifetime=interval
         )
 
         return self
 
     async def __aexit__(self, exc_type, exc, tb) -> None:
-        """Close connection (for unit tests)."""
-        self.heartbeat_task.cancel()
-
-        await self.pg_connection.close()
-
-    async def _pg_fetchval(self, sql, *args, **kwargs):
-        async with self._pg_lock:
-            return await self.pg_connection.fetchval(sql, *args, **kwargs)
+        """Close connections (for unit tests)."""
+        await self.pool.close()
 
-
-    async def send_pg_heartbeats_forever(self, interval: float) -> None:
+    async def _send_pg_heartbeats_forever(self, connection,
+                                          connection_lock: asyncio.Lock
+                                          ) -> None:
         """
-        Keep Postgres connection alive.
+        Keep a held Postgres connection alive.
+
+        Cancel this only while holding `connection_lock`: cancelling an
+        asyncpg query would leave the connection busy.
         """
+        interval = self.heartbeat_interval
         while True:
             await asyncio.sleep(interval)
-            await self._pg_fetchval("SELECT 'worker_heartbeat'",
-                                    timeout=interval)
+            async with connection_lock:
+                await connection.fetchval("SELECT 'worker_heartbeat'",
+                                          timeout=interval)
 
     @asynccontextmanager
     async def _local_lock(self, workflow_id: int) -> None:
         """
         Local lock manager, ensuring only one render per Workflow.
 
-        pg_try_advisory_lock() docs say "Multiple lock requests stack" (on a
-        single connection). For us, that means multiple local callers can lock
-        the same workflow. ("local" here means, "on this connection".)
-
-        The solution: wrap Postgres locks with a local locking system.
+        Each pg_try_advisory_lock() call in this process runs on its own
+        pooled connection, so Postgres would catch double-locking by itself.
+        But checking locally first saves a round trip; and it closes the
+        window between our acquiring a connection and our locking on it.
         """
         if workflow_id in self.local_held_locks:
             raise WorkflowAlreadyLocked
@@ -113,20 +120,76 @@ class PgLocker:
         pg_try_advisory_lock() takes two int parameters (to make a 64-bit int).
         Give 0 as the first int (let's call 0 "category of lock") and workflow
         ID as the second int. (Workflow IDs are 32-bit.) We use
-        pg_try_advisory_xact_lock(0, workflow_id): `try` is non-blocking.
+        pg_try_advisory_lock(0, workflow_id): `try` is non-blocking.
         Postgres will release the lock if the session ends (e.g., the worker
         disconnects).
         """
         # raises WorkflowAlreadyLocked
         async with self._local_lock(workflow_id):
-            if not await self._pg_fetchval(
-                'SELECT pg_try_advisory_lock(0, $1)',
-                workflow_id
-            ):
-                raise WorkflowAlreadyLocked
+            async with self.pool.acquire() as connection:
+                if not await connection.fetchval(
+                    'SELECT pg_try_advisory_lock(0, $1)',
+                    workflow_id
+                ):
+                    raise WorkflowAlreadyLocked
+
+                connection_lock = asyncio.Lock()
+                heartbeat_task = asyncio.ensure_future(
+                    self._send_pg_heartbeats_forever(connection,
+                                                     connection_lock)
+                )
+                try:
+                    yield
+                finally:
+                    async with connection_lock:
+                        heartbeat_task.cancel()
+                    try:
+                        await heartbeat_task
+                    except asyncio.CancelledError:
+                        pass
+                    await connection.fetchval(
+                        'SELECT pg_advisory_unlock(0, $1)',
+                        workflow_id
+                    )
+
+    async def find_locked_workflow_ids(
+        self,
+        workflow_ids: Iterable[int]
+    ) -> FrozenSet[int]:
+        """
+        Return the subset of `workflow_ids` that some `render_lock()` holds.
 
-            try:
-                yield
-            finally:
-                await self._pg_fetchval('SELECT pg_advisory_unlock(0, $1)',
-                                        workflow_id)
+        This is one query, no matter how many IDs you pass. Like
+        `render_lock()` it's only a hint: a workflow may be locked or unlocked
+        a moment later.
+
+        `pg_try_advisory_lock(0, workflow_id)` appears in `pg_locks` as
+        `classid=0, objid=workflow_id, objsubid=2` ("2" means, "two int4
+        keys").
+        """
+        workflow_ids = list(workflow_ids)
+        if not workflow_ids:
+            return frozenset()
+
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(
+                """
+                SELECT objid::BIGINT AS workflow_id
+                FROM pg_locks
+                WHERE locktype = 'advisory'
+                  AND granted
+                  AND database = (
+                    SELECT oid FROM pg_database
+                    WHERE datname = current_database()
+                  )
+                  AND classid = 0
+                  AND objsubid = 2
+                  AND objid::BIGINT = ANY($1::BIGINT[])
+                """,
+                workflow_ids
+            )
+
+        return frozenset(
+            [row['workflow_id'] for row in rows]
+            + [id for id in workflow_ids if id in self.local_held_locks]
+        )
@@ -1,10 +1,14 @@
 import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
 import logging
 import os
-from typing import Any, Awaitable, Callable, Dict
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
 from django.db import DatabaseError, InterfaceError
 from cjworkbench.sync import database_sync_to_async
 from server.models import Workflow
+from server.render_cache import render_cache
 from .pg_locker import PgLocker, WorkflowAlreadyLocked
 from .util import benchmark
 from . import execute
@@ -14,11 +18,12 @@ logger = logging.getLogger(__name__)
 
 
 # DupRenderWait: number of seconds to wait before queueing a re-render request.
-# When a service requests a render of an already-rendering workflow, the
-# running render will fail fast and a new render should begin. If we receive
-# the request for a new render before the prior render failed fast, we'll wait
-# a bit before rescheduling so we don't re-queue the render ten times per
-# millisecond.
+# When a service requests a render of a workflow that's rendering in another
+# process, the running render will fail fast and a new render should begin. If
+# we receive the request for a new render before the prior render failed fast,
+# we'll wait a bit before rescheduling so we don't re-queue the render ten
+# times per millisecond. (Within a process, RenderQueue waits for the running
+# render instead.)
 #
 # If this is too low, we'll use lots of network traffic and CPU re-queueing a
 # render over and over, if its Workflow is the only one in the queue. If it's
@@ -38,7 +43,7 @@ async def render_or_requeue(
     pg_locker: PgLocker,
     requeue: Callable[[int], Awaitable[None]],
     workflow_id: int,
-    delta_id: int
+    delta_id: Optional[int]
 ) -> None:
     """
     Acquire an advisory lock and render, or re-queue task if the lock is held.
@@ -47,6 +52,8 @@ async def render_or_requeue(
     there's no point in wasting CPU cycles starting from scratch. Wait for the
     first render to exit (which will happen at the next stale database-write)
     before trying again.
+
+    If `delta_id` is `None`, render whatever delta the workflow is at.
     """
     # Query for workflow before locking. We don't need a lock for this, and no
     # lock means we can dismiss spurious renders sooner, so they don't fill the
@@ -56,7 +63,9 @@ async def render_or_requeue(
     except Workflow.DoesNotExist:
         logger.info('Skipping render of deleted Workflow %d', workflow_id)
         return
-    if workflow.last_delta_id != delta_id:
+    if delta_id is None:
+        delta_id = workflow.last_delta_id
+    elif workflow.last_delta_id != delta_id:
         logger.info('Ignoring stale render request %d for Workflow %d',
                     delta_id, workflow_id)
         return
@@ -75,6 +84,7 @@ async def render_or_requeue(
             task = execute.execute_workflow(workflow, delta_id)
             await benchmark(logger, task, 'execute_workflow(%d, %d)',
                             workflow_id, delta_id)
+            logger.info('Render cache stats: %r', render_cache.stats())
 
     except WorkflowAlreadyLocked:
         logger.info('Workflow %d is being rendered elsewhere; rescheduling',
@@ -117,26 +127,271 @@ async def render_or_requeue(
         os._exit(1)
 
 
-async def handle_render(pg_locker: PgLocker, message: Dict[str, Any],
-                        requeue: Callable[[int], Awaitable[None]]) -> None:
-        try:
-            workflow_id = int(message['workflow_id'])
-            delta_id = int(message['delta_id'])
-        except asyncio.CancelledError:
-            raise
-        except Exception:
-            logger.info(
-                ('Ignoring invalid render request. '
-                 'Expected {workflow_id:int, delta_id:int}; got %r'),
-                message
-            )
+@dataclass
+class RenderRequest:
+    """
+    A render request we've received but not yet acked.
+    """
+
+    workflow_id: int
+    delta_id: int
+
+    background: bool
+    """
+    True if nobody is waiting to see this render (e.g., cron fetched data).
+    """
+
+    requeue: Callable[[float], Awaitable[None]]
+    """
+    Re-publish this request's RabbitMQ message after a delay.
+    """
+
+    done: asyncio.Future
+    """
+    Resolved when we're finished with the request. Then we ack its message.
+    """
+
+    queued_at: float
+    """
+    `time.monotonic()` when we received the first request we coalesced into
+    this one.
+    """
+
+    superseded: List['RenderRequest'] = field(default_factory=list)
+    """
+    Requests we coalesced into this one. We ack them when we ack this one.
+    """
+
+
+def _parse_message(message: Dict[str, Any]) -> Optional[RenderRequest]:
+    """
+    Build a RenderRequest from `message`, or log and return `None`.
+    """
+    try:
+        workflow_id = int(message['workflow_id'])
+        delta_id = int(message['delta_id'])
+        background = bool(message.get('background', False))
+    except Exception:
+        logger.info(
+            ('Ignoring invalid render request. '
+             'Expected {workflow_id:int, delta_id:int}; got %r'),
+            message
+        )
+        return None
+
+    return RenderRequest(workflow_id, delta_id, background, None,
+                         asyncio.get_event_loop().create_future(),
+                         time.monotonic())
+
+
+async def _render_and_log(pg_locker: PgLocker,
+                          requeue: Callable[[int], Awaitable[None]],
+                          workflow_id: int, delta_id: Optional[int]) -> None:
+    try:
+        task = render_or_requeue(pg_locker, requeue, workflow_id, delta_id)
+        await benchmark(logger, task, 'render_or_requeue(%d, %s)',
+                        workflow_id, delta_id)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception('Error during render')
+
+
+class RenderQueue:
+    """
+    Render requests we've received from RabbitMQ, coalesced per workflow and
+    ordered by priority.
+
+    Users publish a render request with every change, and each websockets
+    consumer asks for a render when cron fetches new data. Most requests are
+    superseded before a renderer is free. So the worker prefetches render
+    messages (without acking them) and:
+
+    * keeps at most one pending request per workflow. When we coalesce
+      requests for different deltas, we can't tell which one is current:
+      the latest one received may be an undo, or it may be an old message
+      another worker re-published because the workflow was locked. So we
+      render whatever delta the workflow is at when the render starts, and
+      we hold on to every coalesced message until that render finishes.
+    * renders requests with `background=False` before requests with
+      `background=True`, oldest first.
+    * never starts a workflow's render while another renderer in this process
+      is rendering it: that render will finish soon (it raises
+      UnneededExecution at its next save), and then we'll start the pending
+      one. No need to spin with `DupRenderWait`.
+
+    We ack a request's message once its render is finished. If we die first,
+    RabbitMQ redelivers whatever we hadn't acked.
+
+    Usage:
+
+        render_queue = RenderQueue()
+        # ... in each of N renderer tasks:
+        await render_queue.run_renderer(pg_locker)
+        # ... for each RabbitMQ message (an acking_callback_with_requeue):
+        await render_queue.handle_message(message, requeue)
+    """
+
+    def __init__(self):
+        # (interactive, background), each workflow_id => RenderRequest
+        self._queues = (OrderedDict(), OrderedDict())
+        self._rendering: Set[int] = set()
+        self._changed = None  # asyncio.Condition, created on the event loop
+        self.n_received = 0
+        self.n_coalesced = 0
+        self.n_started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_changed(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _queue_for(self, request: RenderRequest) -> OrderedDict:
+        return self._queues[1 if request.background else 0]
+
+    async def handle_message(
+        self,
+        message: Dict[str, Any],
+        requeue: Callable[[float], Awaitable[None]]
+    ) -> None:
+        """
+        Queue a request and wait until we're done with it.
+
+        Return when the request -- or the request we coalesced it into -- is
+        rendered. (Then our caller acks the message.)
+        """
+        request = _parse_message(message)
+        if request is None:
             return
+        request.requeue = requeue
 
-        try:
-            task = render_or_requeue(pg_locker, requeue, workflow_id, delta_id)
-            await benchmark(logger, task, 'render_or_requeue(%d, %d)',
-                            workflow_id, delta_id)
-        except asyncio.CancelledError:
-            raise
-        except Exception:
-            logger.exception('Error during render')
+        await self.put(request)
+        await request.done
+
+    async def put(self, request: RenderRequest) -> None:
+        """
+        Queue `request`, coalescing it with any pending request for its
+        workflow.
+        """
+        changed = self._get_changed()
+        async with changed:
+            self.n_received += 1
+            old = None
+            for queue in self._queues:
+                if request.workflow_id in queue:
+                    old = queue[request.workflow_id]
+                    break
+
+            if old is None:
+                self._queue_for(request)[request.workflow_id] = request
+            else:
+                self.n_coalesced += 1
+                # The new request keeps the old one's place in line; and if
+                # either was interactive, somebody is waiting for it.
+                request.queued_at = old.queued_at
+                request.background = request.background and old.background
+                if request.background == old.background:
+                    queue[request.workflow_id] = request  # same position
+                else:
+                    del queue[request.workflow_id]
+                    self._queue_for(request)[request.workflow_id] = request
+                # Don't ack `old` yet: its delta may be the current one.
+                request.superseded = old.superseded + [old]
+                old.superseded = []
+
+            changed.notify_all()
+
+    async def get(self) -> RenderRequest:
+        """
+        Wait for a request whose workflow isn't rendering, and dequeue it.
+
+        Call `finish()` when you're done with it.
+        """
+        changed = self._get_changed()
+        async with changed:
+            while True:
+                request = self._pop_ready()
+                if request is not None:
+                    break
+                await changed.wait()
+
+            self._rendering.add(request.workflow_id)
+            wait = time.monotonic() - request.queued_at
+            self.n_started += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return request
+
+    def _pop_ready(self) -> Optional[RenderRequest]:
+        for queue in self._queues:
+            for workflow_id, request in queue.items():
+                if workflow_id not in self._rendering:
+                    del queue[workflow_id]
+                    return request
+        return None
+
+    async def finish(self, request: RenderRequest) -> None:
+        """
+        Mark `request` and the requests it superseded as done (so our caller
+        acks their messages), and let other renderers render its workflow.
+        """
+        changed = self._get_changed()
+        async with changed:
+            self._rendering.discard(request.workflow_id)
+            for r in [request] + request.superseded:
+                if not r.done.done():
+                    r.done.set_result(None)
+            changed.notify_all()
+
+    async def run_renderer(self, pg_locker: PgLocker) -> None:
+        """
+        Render requests, one at a time, forever.
+        """
+        while True:
+            request = await self.get()
+            try:
+                await self._render(pg_locker, request)
+            finally:
+                await self.finish(request)
+            logger.info('Render queue stats: %r', self.stats())
+
+    async def _render(self, pg_locker: PgLocker,
+                      request: RenderRequest) -> None:
+        if not request.superseded:
+            await _render_and_log(pg_locker, request.requeue,
+                                  request.workflow_id, request.delta_id)
+            return
+
+        # We coalesced several messages, and any of them may hold the current
+        # delta. Render the current delta; and if the workflow is locked
+        # elsewhere, re-publish one message per delta so none goes missing.
+        # (The stale ones will be ignored when they come back.)
+        by_delta_id = OrderedDict(
+            (r.delta_id, r) for r in request.superseded + [request]
+        )
+
+        async def requeue(delay: float) -> None:
+            await asyncio.gather(*(r.requeue(delay)
+                                   for r in by_delta_id.values()))
+
+        delta_id = request.delta_id if len(by_delta_id) == 1 else None
+        await _render_and_log(pg_locker, requeue, request.workflow_id,
+                              delta_id)
+
+    def stats(self):
+        """
+        Return a dict of queue depths and counters, for logging.
+        """
+        return {
+            'n_pending_interactive': len(self._queues[0]),
+            'n_pending_background': len(self._queues[1]),
+            'n_rendering': len(self._rendering),
+            'n_received': self.n_received,
+            'n_coalesced': self.n_coalesced,
+            'n_started': self.n_started,
+            'mean_wait': (self.total_wait / self.n_started
+                          if self.n_started else 0.0),
+            'max_wait': self.max_wait,
+        }
@@ -0,0 +1,16 @@
+"""
+Set up Django in `worker.execute.renderpool`'s forkserver.
+
+The forkserver imports this before it forks any render process. Each child
+then starts with Django set up and internal modules imported -- which it
+needs even to unpickle its entry point: importing the `worker.execute` package
+imports Django models.
+
+This lives outside `worker.execute` for that reason.
+"""
+import django
+
+
+django.setup()
+
+import server.modules  # noqa: E402,F401 -- preload internal modules
@@ -1,9 +1,9 @@
 import json
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 from django.conf import settings
 from django.utils import timezone
 from cjworkbench.sync import database_sync_to_async
-from cjworkbench.types import ProcessResult
+from cjworkbench.types import ProcessResult, RowsToPrepend
 from server import websockets
 from server.models import WfModule, Workflow
 from server.models.commands import ChangeDataVersionCommand
@@ -13,7 +13,7 @@ from server.models.commands import ChangeDataVersionCommand
 def _maybe_add_version(
     workflow: Workflow,
     wf_module: WfModule,
-    maybe_result: Optional[ProcessResult],
+    maybe_result: Union[None, ProcessResult, RowsToPrepend],
     stored_object_json: Optional[Dict[str, Any]]=None
 ) -> Optional[timezone.datetime]:
     """
@@ -26,6 +26,10 @@ def _maybe_add_version(
     previous one. Che caller may create a ``ChangeDataVersionCommand`` to set
     `wf_module`'s next data version.
 
+    If `maybe_result` is `RowsToPrepend`, the new `StoredObject` holds just
+    those rows and refers to the current version for the rest. (If there are
+    no rows, there's no new version.)
+
     If the input Workflow or WfModule is deleted, return ``None``.
     """
     # Use Django `update_fields` to only write the fields we're
@@ -35,7 +39,9 @@ def _maybe_add_version(
         'is_busy': False,
         'last_update_check': timezone.now(),
     }
-    if maybe_result is not None:
+    if isinstance(maybe_result, RowsToPrepend):
+        fields['fetch_error'] = ''
+    elif maybe_result is not None:
         fields['fetch_error'] = maybe_result.error
 
     for k, v in fields.items():
@@ -47,7 +53,13 @@ def _maybe_add_version(
                                            tab__is_deleted=False).exists():
                 return None
 
-            if maybe_result is not None:
+            if isinstance(maybe_result, RowsToPrepend):
+                version_added = wf_module.store_prepended_rows(
+                    maybe_result.dataframe,
+                    metadata=json.dumps(stored_object_json),
+                    max_rows=maybe_result.max_rows
+                )
+            elif maybe_result is not None:
                 version_added = wf_module.store_fetched_table_if_different(
                     maybe_result.dataframe,  # TODO store entire result
                     metadata=json.dumps(stored_object_json)
@@ -73,7 +85,7 @@ def get_wf_module_workflow(wf_module: WfModule) -> Workflow:
 async def save_result_if_changed(
     workflow_id: int,
     wf_module: WfModule,
-    new_result: Optional[ProcessResult],
+    new_result: Union[None, ProcessResult, RowsToPrepend],
     stored_object_json: Optional[Dict[str, Any]]=None
 ) -> None:
     """
@@ -140,22 +152,31 @@ def enforce_storage_limits(wf_module: WfModule) -> None:
     """
     Delete old versions that bring us past MAX_STORAGE_PER_MODULE.
 
-    This is important on frequently-updating modules that add to the previous
-    table, such as Twitter search, because every version we store is an entire
-    table. Without deleting old versions, we'd grow too quickly.
+    This is important on frequently-updating modules that replace the
+    previous table, because every version we store is an entire table.
+    Without deleting old versions, we'd grow too quickly. (Modules that add to
+    the previous table, such as Twitter with "accumulate", store each
+    version's new rows only.)
+
+    Never delete a version that a kept version is built upon (its `parent`,
+    recursively).
     """
     limit = settings.MAX_STORAGE_PER_MODULE
 
     # walk over this WfM's StoredObjects from newest to oldest, deleting all
-    # that are over the limit
+    # that are over the limit. Parents are older than their children, so we
+    # see which versions are needed before we reach them.
     sos = wf_module.stored_objects.order_by('-stored_at')
     cumulative = 0
     first = True
+    needed_ids = set()
 
     for so in sos:
         cumulative += so.size
-        if cumulative > limit and not first:
+        if cumulative > limit and not first and so.id not in needed_ids:
             # allow most recent version to be stored even if it is itself over
             # limit
             so.delete()
+        elif so.parent_id is not None:
+            needed_ids.add(so.parent_id)
         first = False
@@ -0,0 +1,73 @@
+import unittest
+import pandas as pd
+from cjworkbench.types import ProcessResult
+from server.models import ModuleVersion
+from worker.execute.fingerprint import input_fingerprint, result_fingerprint
+
+
+class ResultFingerprintTest(unittest.TestCase):
+    def test_equal_results(self):
+        self.assertEqual(
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [1, 2]}))),
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [1, 2]})))
+        )
+
+    def test_row_order(self):
+        self.assertNotEqual(
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [1, 2]}))),
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [2, 1]})))
+        )
+
+    def test_column_name(self):
+        self.assertNotEqual(
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [1]}))),
+            result_fingerprint(ProcessResult(pd.DataFrame({'B': [1]})))
+        )
+
+    def test_categories(self):
+        def fingerprint(*args, **kwargs):
+            return result_fingerprint(ProcessResult(pd.DataFrame({
+                'A': pd.Categorical(['a', 'b'], *args, **kwargs),
+            })))
+
+        self.assertNotEqual(fingerprint(), fingerprint(['a', 'b', 'c']))
+        self.assertNotEqual(fingerprint(), fingerprint(['b', 'a']))
+        self.assertNotEqual(fingerprint(), fingerprint(ordered=True))
+
+    def test_error(self):
+        self.assertNotEqual(
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [1]}))),
+            result_fingerprint(ProcessResult(pd.DataFrame({'A': [1]}),
+                                             'warning'))
+        )
+
+
+class InputFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.module_version = ModuleVersion(id_name='x',
+                                            source_version_hash='abc')
+
+    def test_no_module_version(self):
+        self.assertIsNone(input_fingerprint(None, {}, 'Tab 1', None, 'a'))
+
+    def test_equal_inputs(self):
+        self.assertEqual(
+            input_fingerprint(self.module_version, {'a': 1}, 'Tab 1', None,
+                              'a'),
+            input_fingerprint(self.module_version, {'a': 1}, 'Tab 1', None,
+                              'a')
+        )
+
+    def test_params(self):
+        self.assertNotEqual(
+            input_fingerprint(self.module_version, {'a': 1}, 'Tab 1', None,
+                              'a'),
+            input_fingerprint(self.module_version, {'a': 2}, 'Tab 1', None,
+                              'a')
+        )
+
+    def test_input_result(self):
+        self.assertNotEqual(
+            input_fingerprint(self.module_version, {}, 'Tab 1', None, 'a'),
+            input_fingerprint(self.module_version, {}, 'Tab 1', None, 'b')
+        )
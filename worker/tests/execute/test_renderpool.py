@@ -0,0 +1,172 @@
+import asyncio
+from collections import namedtuple
+import os
+import subprocess
+import sys
+import time
+import unittest
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from cjworkbench.types import ProcessResult
+from worker.execute.renderpool import RenderPool
+
+
+MockModuleVersion = namedtuple('MockModuleVersion', ['id_name'])
+
+
+# Render functions run in child processes, so they must be module-level (to
+# be pickled by reference).
+
+
+def render_echo(module_version, input_result, params, tab_name,
+                fetch_result):
+    return ProcessResult(input_result.dataframe, error=params['error'])
+
+
+def render_pid(module_version, input_result, params, tab_name, fetch_result):
+    time.sleep(params.get('sleep', 0))
+    return ProcessResult(pd.DataFrame({'pid': [os.getpid()]}))
+
+
+def render_exit(module_version, input_result, params, tab_name, fetch_result):
+    if params.get('exit'):
+        os._exit(1)
+    return ProcessResult(pd.DataFrame({'pid': [os.getpid()]}))
+
+
+def render_allocate(module_version, input_result, params, tab_name,
+                    fetch_result):
+    bytearray(params['n_bytes'])  # MemoryError if over the limit
+    return ProcessResult(pd.DataFrame({'pid': [os.getpid()]}))
+
+
+def render_raise(module_version, input_result, params, tab_name,
+                 fetch_result):
+    if params.get('raise'):
+        raise ValueError('bug in render()')
+    return ProcessResult(pd.DataFrame({'pid': [os.getpid()]}))
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+class RenderPoolTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+        super().tearDown()
+
+    def _start(self, render, **kwargs):
+        self.pool = RenderPool(1, render=render, **kwargs)
+        return self.pool
+
+    def _render(self, params):
+        return self.pool.render(MockModuleVersion('x'),
+                                ProcessResult(pd.DataFrame({'A': [1, 2]})),
+                                params, 'Tab 1', None)
+
+    def test_render(self):
+        self._start(render_echo, time_limit=10)
+
+        async def inner():
+            return await self._render({'error': 'a warning'})
+
+        result = asyncio.run(inner())
+        assert_frame_equal(result.dataframe, pd.DataFrame({'A': [1, 2]}))
+        self.assertEqual(result.error, 'a warning')
+
+    def test_reuse_process(self):
+        self._start(render_pid, time_limit=10)
+
+        async def inner():
+            result1 = await self._render({})
+            result2 = await self._render({})
+            return result1.dataframe['pid'][0], result2.dataframe['pid'][0]
+
+        pid1, pid2 = asyncio.run(inner())
+        self.assertEqual(pid1, pid2)
+        self.assertNotEqual(pid1, os.getpid())
+
+    def test_timeout_kills_and_replaces_process(self):
+        self._start(render_pid, time_limit=1)
+
+        async def inner():
+            result1 = await self._render({})
+            with self.assertLogs('worker.execute.renderpool', 'INFO'):
+                result2 = await self._render({'sleep': 10})
+            result3 = await self._render({})
+            return result1, result2, result3
+
+        result1, result2, result3 = asyncio.run(inner())
+        self.assertEqual(result2, ProcessResult(error=(
+            'The module took longer than 1 seconds to render, so we stopped '
+            'it.'
+        )))
+        pid1 = result1.dataframe['pid'][0]
+        self.assertFalse(_is_alive(pid1))
+        self.assertNotEqual(result3.dataframe['pid'][0], pid1)
+
+    def test_crash_replaces_process(self):
+        self._start(render_exit, time_limit=10)
+
+        async def inner():
+            with self.assertLogs('worker.execute.renderpool', 'ERROR'):
+                result1 = await self._render({'exit': True})
+            result2 = await self._render({})
+            return result1, result2
+
+        result1, result2 = asyncio.run(inner())
+        self.assertEqual(result1, ProcessResult(error=(
+            'The module crashed. It may have run out of memory.'
+        )))
+        self.assertEqual(list(result2.dataframe.columns), ['pid'])
+
+    def test_memory_limit(self):
+        self._start(render_allocate, time_limit=10, memory_limit=1024**3)
+
+        async def inner():
+            result1 = await self._render({'n_bytes': 4 * 1024**3})
+            result2 = await self._render({'n_bytes': 1024})
+            return result1, result2
+
+        result1, result2 = asyncio.run(inner())
+        self.assertEqual(result1, ProcessResult(error='MemoryError'))
+        self.assertEqual(list(result2.dataframe.columns), ['pid'])
+
+    def test_exception_in_child_becomes_error(self):
+        self._start(render_raise, time_limit=10)
+
+        async def inner():
+            result1 = await self._render({})
+            result2 = await self._render({'raise': True})
+            result3 = await self._render({})
+            return result1, result2, result3
+
+        result1, result2, result3 = asyncio.run(inner())
+        self.assertEqual(result2,
+                         ProcessResult(error='ValueError: bug in render()'))
+        # The process survived
+        self.assertEqual(result3.dataframe['pid'][0],
+                         result1.dataframe['pid'][0])
+
+    def test_close_on_exit(self):
+        # Without RenderPool.close(), multiprocessing's exit handler would
+        # wait forever for our (non-daemon) processes.
+        completed = subprocess.run(
+            [sys.executable, '-c', (
+                'import django; django.setup(); '
+                'from worker.execute import renderpool; '
+                'renderpool.start(2, 10)'
+            )],
+            timeout=60
+        )
+        self.assertEqual(completed.returncode, 0)
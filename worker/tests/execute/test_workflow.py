@@ -1,14 +1,17 @@
 import asyncio
 from collections import namedtuple
 import logging
+import time
 import unittest
 from unittest.mock import Mock, patch
 import pandas as pd
-from cjworkbench.types import ProcessResult
+from cjworkbench.types import ProcessResult, StepResultShape, TableShape
 from server.models import LoadedModule, Workflow
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase
+from worker.execute.tab import execute_tab_flow
 from worker.execute.types import UnneededExecution
+from worker.execute.wf_module import _execute_wfmodule_save
 from worker.execute.workflow import execute_workflow, \
         partition_ready_and_dependent
 
@@ -203,6 +206,50 @@ class WorkflowTests(DbTestCase):
         self.assertEqual(actual, result2)
         fake_loaded_module.render.assert_called_once()  # only with module2
 
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_skip_fresh_tabs(self, fake_load_module):
+        workflow = Workflow.create_and_init()
+        delta_id = workflow.last_delta_id
+        tab1 = workflow.tabs.first()
+        tab2 = workflow.tabs.create(position=1, slug='tab-2')
+
+        # tab1: fresh
+        wf_module1 = tab1.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta_id
+        )
+        wf_module1.cache_render_result(delta_id,
+                                       ProcessResult(pd.DataFrame({'A': [1]})))
+
+        # tab2: stale
+        wf_module2 = tab2.wf_modules.create(
+            order=0,
+            last_relevant_delta_id=delta_id
+        )
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        result2 = ProcessResult(pd.DataFrame({'A': [2]}))
+        fake_loaded_module.render.return_value = result2
+
+        rendered_tab_slugs = []
+
+        async def fake_execute_tab_flow(workflow, flow, tab_shapes):
+            rendered_tab_slugs.append(flow.tab_slug)
+            # tab_shapes lists all tabs, in order -- even tabs we don't load
+            self.assertEqual(list(tab_shapes.keys()), [tab1.slug, tab2.slug])
+            return await execute_tab_flow(workflow, flow, tab_shapes)
+
+        with patch('worker.execute.workflow.execute_tab_flow',
+                   fake_execute_tab_flow):
+            self._execute(workflow)
+
+        self.assertEqual(rendered_tab_slugs, ['tab-2'])
+        wf_module2.refresh_from_db()
+        self.assertEqual(wf_module2.cached_render_result.result, result2)
+        fake_loaded_module.render.assert_called_once()  # only with module2
+
     @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
     @patch('server.websockets.ws_client_send_delta_async', fake_send)
     @patch('server.notifications.email_output_delta')
@@ -267,6 +314,222 @@ class WorkflowTests(DbTestCase):
 
         email.assert_not_called()
 
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_reuse_stale_result_when_input_unchanged(self, fake_load_module):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        delta1 = InitWorkflowCommand.create(workflow)
+        wf_module1 = tab.wf_modules.create(
+            order=0,
+            module_id_name='selectcolumns',
+            last_relevant_delta_id=delta1.id
+        )
+        wf_module2 = tab.wf_modules.create(
+            order=1,
+            module_id_name='selectcolumns',
+            last_relevant_delta_id=delta1.id
+        )
+        result1 = ProcessResult(pd.DataFrame({'A': [1]}))
+        result2 = ProcessResult(pd.DataFrame({'B': [2]}))
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.side_effect = [result1, result2]
+        self._execute(workflow)
+
+        # Change wf_module1's input (as a fetch would), so it must re-render.
+        # Its output won't change, so wf_module2 needn't re-render.
+        delta2 = InitWorkflowCommand.create(workflow)
+        wf_module1.fetch_error = 'fetched again'
+        wf_module1.last_relevant_delta_id = delta2.id
+        wf_module1.save(update_fields=['fetch_error',
+                                       'last_relevant_delta_id'])
+        wf_module2.last_relevant_delta_id = delta2.id
+        wf_module2.save(update_fields=['last_relevant_delta_id'])
+
+        fake_loaded_module.render.reset_mock()
+        fake_loaded_module.render.side_effect = [result1]
+        self._execute(workflow)
+
+        fake_loaded_module.render.assert_called_once()  # only wf_module1
+        wf_module2.refresh_from_db()
+        self.assertEqual(wf_module2.cached_render_result.delta_id, delta2.id)
+        self.assertEqual(wf_module2.cached_render_result.result, result2)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_pipeline_commits_saves_in_order(self, fake_load_module):
+        workflow = Workflow.create_and_init()
+        tab = workflow.tabs.first()
+        delta_id = workflow.last_delta_id
+        wf_module1 = tab.wf_modules.create(order=0,
+                                           last_relevant_delta_id=delta_id)
+        wf_module2 = tab.wf_modules.create(order=1,
+                                           last_relevant_delta_id=delta_id)
+
+        events = []
+
+        def render(input_result, *args):
+            events.append(f'render {len(events)}')
+            return ProcessResult(pd.DataFrame({'A': [len(events)]}))
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.side_effect = render
+
+        async def slow_first_save(workflow, wf_module, *args):
+            if wf_module.order == 0:
+                # Step 2 would commit first if it didn't wait for us
+                await asyncio.sleep(0.1)
+            result = await _execute_wfmodule_save(workflow, wf_module, *args)
+            events.append(f'save {wf_module.order}')
+            return result
+
+        with patch('worker.execute.wf_module._execute_wfmodule_save',
+                   slow_first_save):
+            self._execute(workflow)
+
+        # Step 2 rendered while step 1 was saving; but step 1 committed first
+        self.assertEqual(events, ['render 0', 'render 1', 'save 0', 'save 1'])
+        wf_module1.refresh_from_db()
+        wf_module2.refresh_from_db()
+        self.assertEqual(wf_module1.cached_render_result.delta_id, delta_id)
+        self.assertEqual(wf_module2.cached_render_result.delta_id, delta_id)
+
+    def _test_failed_save_stops_pipeline(self, fake_load_module,
+                                         failing_save, error_class):
+        workflow = Workflow.create_and_init()
+        tab = workflow.tabs.first()
+        delta_id = workflow.last_delta_id
+        tab.wf_modules.create(order=0, last_relevant_delta_id=delta_id)
+        tab.wf_modules.create(order=1, last_relevant_delta_id=delta_id)
+        wf_module3 = tab.wf_modules.create(order=2,
+                                           last_relevant_delta_id=delta_id)
+
+        def render(input_result, *args):
+            # Give step 1's save time to fail before step 3 starts
+            time.sleep(0.1)
+            return ProcessResult(pd.DataFrame({'A': [1]}))
+
+        fake_loaded_module = Mock(LoadedModule)
+        fake_load_module.return_value = fake_loaded_module
+        fake_loaded_module.render.side_effect = render
+
+        with patch('worker.execute.wf_module._execute_wfmodule_save',
+                   failing_save):
+            with self.assertRaises(error_class):
+                self._execute(workflow)
+
+        # Step 2 was already rendering when step 1's save failed. Step 3
+        # never started.
+        self.assertEqual(fake_loaded_module.render.call_count, 2)
+        wf_module3.refresh_from_db()
+        self.assertIsNone(wf_module3.cached_render_result)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_unneeded_save_stops_pipeline(self, fake_load_module):
+        async def failing_save(workflow, wf_module, *args):
+            if wf_module.order == 0:
+                raise UnneededExecution
+            return await _execute_wfmodule_save(workflow, wf_module, *args)
+
+        self._test_failed_save_stops_pipeline(fake_load_module, failing_save,
+                                              UnneededExecution)
+
+    @patch('server.models.loaded_module.LoadedModule.for_module_version_sync')
+    @patch('server.websockets.ws_client_send_delta_async', fake_send)
+    def test_failed_save_stops_pipeline(self, fake_load_module):
+        async def failing_save(workflow, wf_module, *args):
+            if wf_module.order == 0:
+                raise OSError('database is gone')
+            return await _execute_wfmodule_save(workflow, wf_module, *args)
+
+        self._test_failed_save_stops_pipeline(fake_load_module, failing_save,
+                                              OSError)
+
+
+class ParallelTabsTests(DbTestCase):
+    def _create_workflow_with_stale_tabs(self, n_tabs):
+        workflow = Workflow.create_and_init()
+        delta_id = workflow.last_delta_id
+        tab1 = workflow.tabs.first()
+        tab1.wf_modules.create(order=0, last_relevant_delta_id=delta_id)
+        for i in range(2, n_tabs + 1):
+            tab = workflow.tabs.create(position=i - 1, slug=f'tab-{i}')
+            tab.wf_modules.create(order=0, last_relevant_delta_id=delta_id)
+        return workflow
+
+    def _execute(self, workflow, fake_execute_tab_flow, max_parallel_tabs):
+        with patch('worker.execute.workflow.execute_tab_flow',
+                   fake_execute_tab_flow):
+            self.run_with_async_db(execute_workflow(
+                workflow,
+                workflow.last_delta_id,
+                max_parallel_tabs=max_parallel_tabs
+            ))
+
+    def _test_max_parallel_tabs(self, n_tabs, max_parallel_tabs):
+        workflow = self._create_workflow_with_stale_tabs(n_tabs)
+        running = set()
+        max_running = 0
+        rendered_tab_slugs = []
+
+        async def fake_execute_tab_flow(workflow, flow, tab_shapes):
+            nonlocal max_running
+            running.add(flow.tab_slug)
+            max_running = max(max_running, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(flow.tab_slug)
+            rendered_tab_slugs.append(flow.tab_slug)
+            return StepResultShape('ok', TableShape(0, []))
+
+        self._execute(workflow, fake_execute_tab_flow, max_parallel_tabs)
+        return max_running, rendered_tab_slugs
+
+    def test_render_tabs_concurrently(self):
+        max_running, rendered = self._test_max_parallel_tabs(2, 2)
+        self.assertEqual(max_running, 2)
+        self.assertEqual(sorted(rendered), ['tab-1', 'tab-2'])
+
+    def test_max_parallel_tabs(self):
+        max_running, rendered = self._test_max_parallel_tabs(5, 2)
+        self.assertEqual(max_running, 2)
+        self.assertEqual(sorted(rendered),
+                         ['tab-1', 'tab-2', 'tab-3', 'tab-4', 'tab-5'])
+
+    def test_max_parallel_tabs_default(self):
+        with patch('worker.execute.workflow.MaxParallelTabs', 4):
+            max_running, rendered = self._test_max_parallel_tabs(6, None)
+        self.assertEqual(max_running, 4)
+        self.assertEqual(len(rendered), 6)
+
+    def test_max_parallel_tabs_1_renders_in_tab_order(self):
+        max_running, rendered = self._test_max_parallel_tabs(3, 1)
+        self.assertEqual(max_running, 1)
+        self.assertEqual(rendered, ['tab-1', 'tab-2', 'tab-3'])
+
+    def test_error_in_one_tab(self):
+        workflow = self._create_workflow_with_stale_tabs(3)
+        started_tab_slugs = []
+        finished_tab_slugs = []
+
+        async def fake_execute_tab_flow(workflow, flow, tab_shapes):
+            started_tab_slugs.append(flow.tab_slug)
+            if flow.tab_slug == 'tab-1':
+                raise UnneededExecution
+            await asyncio.sleep(0.05)  # still running when tab-1 fails
+            finished_tab_slugs.append(flow.tab_slug)
+            return StepResultShape('ok', TableShape(0, []))
+
+        with self.assertRaises(UnneededExecution):
+            self._execute(workflow, fake_execute_tab_flow, 2)
+
+        # tab-2 was mid-render: we let it finish. We never started tab-3.
+        self.assertEqual(started_tab_slugs, ['tab-1', 'tab-2'])
+        self.assertEqual(finished_tab_slugs, ['tab-2'])
+
 
 class PartitionReadyAndDependentTests(unittest.TestCase):
     MockTabFlow = namedtuple('MockTabFlow', ('tab_slug', 'input_tab_slugs'))
@@ -313,3 +576,12 @@ class PartitionReadyAndDependentTests(unittest.TestCase):
             self.MockTabFlow('t1', {'t1'})
         ]
         self.assertEqual(([], flows), partition_ready_and_dependent(flows))
+
+    def test_rendering_flows_are_not_ready(self):
+        rendering = [self.MockTabFlow('t1', set())]
+        flows = [
+            self.MockTabFlow('t2', {'t1'}),
+            self.MockTabFlow('t3', set()),
+        ]
+        self.assertEqual((flows[1:], flows[:1]),
+                         partition_ready_and_dependent(flows, rendering))
@@ -80,3 +80,23 @@ class PgLockerTest(unittest.TestCase):
                     task.result()  # throw error, if any
 
         asyncio.run(inner())
+
+    def test_find_locked_workflow_ids(self):
+        async def inner():
+            async with PgLocker() as locker1:
+                async with PgLocker() as locker2:
+                    async with locker1.render_lock(1):
+                        async with locker2.render_lock(3):
+                            self.assertEqual(
+                                await locker2.find_locked_workflow_ids(
+                                    [1, 2, 3]
+                                ),
+                                frozenset([1, 3])
+                            )
+
+                    self.assertEqual(
+                        await locker2.find_locked_workflow_ids([1, 2, 3]),
+                        frozenset()
+                    )
+
+        asyncio.run(inner())
@@ -6,7 +6,7 @@ from server.models import Workflow
 from server.models.commands import InitWorkflowCommand
 from server.tests.utils import DbTestCase
 from worker import execute
-from worker.render import handle_render, render_or_requeue, DupRenderWait
+from worker.render import render_or_requeue, DupRenderWait, RenderQueue
 from worker.pg_locker import WorkflowAlreadyLocked
 
 
@@ -45,18 +45,6 @@ class FailedRenderLocker:
 
 
 class RenderTest(DbTestCase):
-    def test_handle_render_invalid_message(self):
-        async def inner():
-            with self.assertLogs('worker', level='INFO') as cm:
-                await handle_render(None, {'workflow_id': 123}, None)
-                self.assertEqual(cm.output, [
-                    ('INFO:worker.render:Ignoring invalid render '
-                     'request. Expected {workflow_id:int, delta_id:int}; got '
-                     "{'workflow_id': 123}"),
-                ])
-
-        self.run_with_async_db(inner())
-
     @patch('worker.execute.execute_workflow')
     def test_render_or_requeue_render(self, execute):
         execute.return_value = future_none
@@ -146,3 +134,176 @@ class RenderTest(DbTestCase):
 
         # Don't requeue: it is _unneeded_ execution.
         requeue.assert_not_called()
+
+
+class RenderQueueTest(DbTestCase):
+    def test_invalid_message(self):
+        async def inner():
+            queue = RenderQueue()
+            with self.assertLogs('worker', level='INFO') as cm:
+                await queue.handle_message({'workflow_id': 123}, None)
+                self.assertEqual(cm.output, [
+                    ('INFO:worker.render:Ignoring invalid render '
+                     'request. Expected {workflow_id:int, delta_id:int}; got '
+                     "{'workflow_id': 123}"),
+                ])
+            self.assertEqual(queue.stats()['n_received'], 0)
+
+        self.run_with_async_db(inner())
+
+    def test_coalesce_per_workflow(self):
+        async def inner():
+            queue = RenderQueue()
+            requeue = Mock(name='requeue', return_value=future_none)
+            handles = [
+                asyncio.ensure_future(queue.handle_message(
+                    {'workflow_id': 1, 'delta_id': delta_id},
+                    requeue
+                ))
+                for delta_id in (2, 3, 1)  # 1 is an undo: it's the latest
+            ]
+            request = await queue.get()
+            self.assertEqual((request.workflow_id, request.delta_id), (1, 1))
+            # We don't ack any request until the render is finished: we don't
+            # know which delta is current
+            await asyncio.sleep(0)
+            self.assertEqual([h.done() for h in handles],
+                             [False, False, False])
+            self.assertEqual(queue.stats()['n_coalesced'], 2)
+
+            await queue.finish(request)
+            await asyncio.gather(*handles)
+
+        self.run_with_async_db(inner())
+
+    def test_interactive_before_background(self):
+        async def inner():
+            queue = RenderQueue()
+            requeue = Mock(name='requeue', return_value=future_none)
+            asyncio.ensure_future(queue.handle_message(
+                {'workflow_id': 1, 'delta_id': 1, 'background': True},
+                requeue
+            ))
+            asyncio.ensure_future(queue.handle_message(
+                {'workflow_id': 2, 'delta_id': 1},
+                requeue
+            ))
+            await asyncio.sleep(0)
+            self.assertEqual(queue.stats()['n_pending_background'], 1)
+            request1 = await queue.get()
+            request2 = await queue.get()
+            self.assertEqual(request1.workflow_id, 2)
+            self.assertEqual(request2.workflow_id, 1)
+
+        self.run_with_async_db(inner())
+
+    def test_interactive_request_promotes_background_request(self):
+        async def inner():
+            queue = RenderQueue()
+            requeue = Mock(name='requeue', return_value=future_none)
+            for message in [
+                {'workflow_id': 1, 'delta_id': 1, 'background': True},
+                {'workflow_id': 2, 'delta_id': 1},
+                {'workflow_id': 1, 'delta_id': 1},
+            ]:
+                asyncio.ensure_future(queue.handle_message(message, requeue))
+            await asyncio.sleep(0)
+            self.assertEqual(queue.stats()['n_pending_background'], 0)
+            request = await queue.get()
+            self.assertEqual(request.workflow_id, 2)  # still first in line
+
+        self.run_with_async_db(inner())
+
+    def test_skip_workflow_that_is_rendering(self):
+        async def inner():
+            queue = RenderQueue()
+            requeue = Mock(name='requeue', return_value=future_none)
+            asyncio.ensure_future(queue.handle_message(
+                {'workflow_id': 1, 'delta_id': 1},
+                requeue
+            ))
+            request1 = await queue.get()
+            asyncio.ensure_future(queue.handle_message(
+                {'workflow_id': 1, 'delta_id': 2},
+                requeue
+            ))
+            asyncio.ensure_future(queue.handle_message(
+                {'workflow_id': 2, 'delta_id': 1},
+                requeue
+            ))
+            request2 = await queue.get()
+            self.assertEqual(request2.workflow_id, 2)
+
+            await queue.finish(request1)
+            request3 = await queue.get()
+            self.assertEqual((request3.workflow_id, request3.delta_id),
+                             (1, 2))
+
+        self.run_with_async_db(inner())
+
+    @patch('worker.execute.execute_workflow')
+    def test_requeued_old_request_does_not_hide_new_delta(self, execute):
+        execute.return_value = future_none
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        requeue = Mock(name='requeue', return_value=future_none)
+
+        async def inner():
+            queue = RenderQueue()
+            handles = [
+                asyncio.ensure_future(queue.handle_message(
+                    {'workflow_id': workflow.id, 'delta_id': delta_id},
+                    requeue
+                ))
+                # delta.id - 1: another worker re-published an old message
+                for delta_id in (delta.id, delta.id - 1)
+            ]
+            await asyncio.sleep(0)
+            renderer = asyncio.ensure_future(
+                queue.run_renderer(SuccessfulRenderLocker)
+            )
+            with self.assertLogs('worker', level='INFO'):
+                await asyncio.gather(*handles)
+            renderer.cancel()
+
+        self.run_with_async_db(inner())
+
+        execute.assert_called_once_with(workflow, delta.id)
+        requeue.assert_not_called()
+
+    @patch('worker.execute.execute_workflow')
+    def test_requeue_every_coalesced_delta(self, execute):
+        workflow = Workflow.objects.create()
+        delta = InitWorkflowCommand.create(workflow)
+        requeue1 = Mock(name='requeue1', return_value=future_none)
+        requeue2 = Mock(name='requeue2', return_value=future_none)
+        requeue3 = Mock(name='requeue3', return_value=future_none)
+
+        async def inner():
+            queue = RenderQueue()
+            handles = [
+                asyncio.ensure_future(queue.handle_message(
+                    {'workflow_id': workflow.id, 'delta_id': delta_id},
+                    requeue
+                ))
+                for delta_id, requeue in [
+                    (delta.id, requeue1),
+                    (delta.id - 1, requeue2),
+                    (delta.id - 1, requeue3),
+                ]
+            ]
+            await asyncio.sleep(0)
+            renderer = asyncio.ensure_future(
+                queue.run_renderer(FailedRenderLocker)
+            )
+            with self.assertLogs('worker', level='INFO'):
+                await asyncio.gather(*handles)
+            renderer.cancel()
+
+        self.run_with_async_db(inner())
+
+        execute.assert_not_called()
+        # One message per delta: the duplicate of delta.id - 1 is dropped
+        requeue1.assert_called_once_with(DupRenderWait)
+        requeue2.assert_not_called()
+        requeue3.assert_called_once_with(DupRenderWait)
@@ -2,7 +2,7 @@ from unittest.mock import patch
 from django.conf import settings
 from django.test import override_settings
 import pandas as pd
-from cjworkbench.types import ProcessResult
+from cjworkbench.types import ProcessResult, RowsToPrepend
 from server.models import StoredObject, Workflow
 from server.tests.utils import DbTestCase, mock_csv_table
 from worker.save import save_result_if_changed
@@ -63,6 +63,71 @@ class SaveTests(DbTestCase):
         # if not, increase table size/loop iterations, or decrease limit
         self.assertEqual(n_objects, 1)
 
+    def _prepend_and_select(self, workflow, wf_module, table):
+        """
+        Save `table` as RowsToPrepend and select the new version (as the
+        ChangeDataVersionCommand after a fetch would).
+        """
+        version = self.run_with_async_db(save_result_if_changed(
+            workflow.id,
+            wf_module,
+            RowsToPrepend(table)
+        ))
+        if version is not None:
+            wf_module.stored_data_version = version
+            wf_module.save(update_fields=['stored_data_version'])
+        return version
+
+    def test_store_rows_to_prepend(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+
+        self._prepend_and_select(workflow, wf_module,
+                                 pd.DataFrame({'A': [1, 2]}))
+        self._prepend_and_select(workflow, wf_module, pd.DataFrame({'A': [3]}))
+        # no new rows: no new version
+        self._prepend_and_select(workflow, wf_module, pd.DataFrame({'A': []}))
+
+        self.assertEqual(wf_module.stored_objects.count(), 2)
+        latest = wf_module.stored_objects.order_by('-stored_at').first()
+        self.assertIsNotNone(latest.parent_id)
+        self.assertEqual(list(latest.get_table()['A']), [3, 1, 2])
+
+    @override_settings(MAX_STORAGE_PER_MODULE=1000)
+    def test_storage_limits_keep_parents(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+
+        # Bigger than the limit: the rows of the latest version, which we
+        # must keep
+        table = pd.DataFrame({'A': range(1000)})
+        for i in range(3):
+            self._prepend_and_select(workflow, wf_module, table + i * 1000)
+
+        self.assertEqual(wf_module.stored_objects.count(), 3)
+        latest = wf_module.stored_objects.order_by('-stored_at').first()
+        self.assertEqual(len(latest.get_table()), 3000)
+
+    def test_prepend_to_selected_version(self):
+        workflow = Workflow.objects.create()
+        tab = workflow.tabs.create(position=0)
+        wf_module = tab.wf_modules.create(order=0)
+
+        v1 = self._prepend_and_select(workflow, wf_module,
+                                      pd.DataFrame({'A': [1]}))
+        self._prepend_and_select(workflow, wf_module, pd.DataFrame({'A': [2]}))
+        # The user selects the older version. fetch() reads it, so it returns
+        # the rows the newer version added, too.
+        wf_module.stored_data_version = v1
+        wf_module.save(update_fields=['stored_data_version'])
+        self._prepend_and_select(workflow, wf_module,
+                                 pd.DataFrame({'A': [3, 2]}))
+
+        latest = wf_module.stored_objects.order_by('-stored_at').first()
+        self.assertEqual(list(latest.get_table()['A']), [3, 2, 1])
+
     def test_race_deleted_workflow(self):
         result = ProcessResult(pd.DataFrame({'A': [1]}))
 